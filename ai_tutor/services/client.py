@@ -0,0 +1,264 @@
+import logging
+import os
+import random
+import threading
+import time
+from typing import Dict, Iterator, Optional
+
+import openai
+from django.conf import settings
+
+from chatsql.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+
+class AIClientError(Exception):
+    """The AI call failed after retries"""
+
+
+class AIUnavailable(AIClientError):
+    """The call was not attempted: the circuit is open or every call slot is busy"""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+    After `threshold` failed calls in a row the circuit opens and calls are refused for
+    `reset_timeout` seconds; then one trial call is let through (half-open), and its
+    outcome closes or re-opens the circuit.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+    def __init__(self, threshold: int = 5, reset_timeout: float = 30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def release_trial(self):
+        """Give up a trial call that never reached the upstream"""
+        with self._lock:
+            self._trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.threshold:
+                if self.opened_at is None:
+                    logger.warning('AI circuit opened after %d consecutive failures', self.failures)
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+
+# Worth another try: the request timed out, never connected, was rate limited or hit a 5xx
+RETRYABLE_ERRORS = (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError,
+                    openai.InternalServerError)
+
+
+class AIClient:
+    """
+    Long-lived chat completion client shared by all requests.
+    - one openai.OpenAI client, so HTTP connections are pooled and kept alive
+    - explicit connect / read timeouts, and retries with full-jitter exponential backoff
+    - a circuit breaker that stops calling a failing upstream for a while
+    - a semaphore capping in-flight calls, so a slow upstream can't tie up every worker thread
+    BASE_URL points it at any OpenAI-compatible server, e.g. a local fake for tests.
+    """
+
+    DEFAULTS = {
+        'BASE_URL': None,
+        'MODEL': 'gpt-4o-mini',
+        'TIMEOUT': 15.0,            # seconds to wait for the (first byte of the) response
+        'CONNECT_TIMEOUT': 3.0,
+        'MAX_RETRIES': 2,           # retries after the first attempt
+        'BACKOFF_BASE': 0.25,       # seconds; attempt n sleeps up to BACKOFF_BASE * 2**n
+        'BACKOFF_MAX': 4.0,
+        'MAX_CONCURRENT': 8,        # in-flight calls per process
+        'ACQUIRE_TIMEOUT': 1.0,     # seconds to wait for a free call slot
+        'BREAKER_THRESHOLD': 5,     # consecutive failed calls before the circuit opens
+        'BREAKER_RESET': 30.0,      # seconds the circuit stays open
+    }
+
+    def __init__(self, api_key: Optional[str], **options):
+        conf = {**self.DEFAULTS, **options}
+        self.model = conf['MODEL']
+        self.max_retries = int(conf['MAX_RETRIES'])
+        self.backoff_base = float(conf['BACKOFF_BASE'])
+        self.backoff_max = float(conf['BACKOFF_MAX'])
+        self.acquire_timeout = float(conf['ACQUIRE_TIMEOUT'])
+        self.max_concurrent = int(conf['MAX_CONCURRENT'])
+        self.breaker = CircuitBreaker(int(conf['BREAKER_THRESHOLD']), float(conf['BREAKER_RESET']))
+        self._slots = threading.BoundedSemaphore(self.max_concurrent)
+        self._in_flight = 0
+        self._counts = {'calls': 0, 'retries': 0, 'failures': 0, 'rejected': 0}
+        self._lock = threading.Lock()
+        self.configured = bool(api_key)
+        self._client = openai.OpenAI(
+            api_key=api_key or 'not-configured',
+            base_url=conf['BASE_URL'] or None,
+            timeout=openai.Timeout(float(conf['TIMEOUT']), connect=float(conf['CONNECT_TIMEOUT'])),
+            max_retries=0,  # retries are ours, so they respect the breaker and the backoff policy
+        )
+
+    def _count(self, name: str, delta: int = 1):
+        with self._lock:
+            self._counts[name] += delta
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            return {
+                **self._counts,
+                'in_flight': self._in_flight,
+                'max_concurrent': self.max_concurrent,
+                'circuit': self.breaker.state,
+            }
+
+    def _acquire(self):
+        if not self.breaker.allow():
+            self._count('rejected')
+            raise AIUnavailable('AI circuit is open')
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            self._count('rejected')
+            self.breaker.release_trial()
+            raise AIUnavailable('Too many AI calls in flight')
+        with self._lock:
+            self._in_flight += 1
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def _backoff(self, attempt: int):
+        time.sleep(random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt)))
+
+    def _call(self, **kwargs):
+        """One request with retries; the caller holds a slot"""
+        self._count('calls')
+        attempt = 0
+        while True:
+            try:
+                with timed('ai'):
+                    return self._client.chat.completions.create(model=self.model, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries:
+                    self._count('failures')
+                    self.breaker.record_failure()
+                    raise AIClientError(f'AI request failed after {attempt + 1} attempt(s): {e}') from e
+                self._count('retries')
+                self._backoff(attempt)
+                attempt += 1
+            except openai.OpenAIError as e:
+                # 4xx and the like: retrying won't help, and the upstream itself is healthy
+                self._count('failures')
+                self.breaker.record_success()
+                raise AIClientError(f'AI request was rejected: {e}') from e
+
+    def complete(self, messages, **kwargs) -> str:
+        """Return the assistant's reply text (may be empty)"""
+        self._acquire()
+        try:
+            resp = self._call(messages=messages, **kwargs)
+        except AIClientError:
+            raise
+        except BaseException:
+            self.breaker.release_trial()
+            raise
+        finally:
+            self._release()
+        self.breaker.record_success()
+        if not resp.choices:
+            return ''
+        return (resp.choices[0].message.content or '').strip()
+
+    def stream(self, messages, **kwargs) -> Iterator[str]:
+        """
+        Yield reply text chunks as they arrive. Retries only cover opening the stream;
+        the call slot is held until the stream is exhausted or closed.
+        """
+        self._acquire()
+        try:
+            chunks = self._call(messages=messages, stream=True, **kwargs)
+            try:
+                for chunk in chunks:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            except Exception as e:
+                # Besides openai.OpenAIError, the HTTP library's read, timeout and protocol errors
+                # reach us unwrapped once the stream is open (GeneratorExit is not an Exception)
+                self._count('failures')
+                self.breaker.record_failure()
+                raise AIClientError(f'AI stream broke off: {e}') from e
+            finally:
+                chunks.close()
+            self.breaker.record_success()
+        except AIClientError:
+            raise
+        except BaseException:
+            # Closed early (GeneratorExit when the client goes away) or an unexpected error: the
+            # outcome is unknown, but a half-open trial must not stay claimed or the circuit never closes
+            self.breaker.release_trial()
+            raise
+        finally:
+            self._release()
+
+    def close(self):
+        self._client.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_ai_client() -> AIClient:
+    """The process-wide AIClient, configured from settings.AI_CLIENT"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                api_key = os.getenv('OPENAI_API_KEY') or getattr(settings, 'OPENAI_API_KEY', None)
+                _client = AIClient(api_key, **getattr(settings, 'AI_CLIENT', {}))
+    return _client
+
+
+def ai_client_metrics() -> Optional[Dict]:
+    """The shared client's metrics, or None if no real-mode call has created it yet"""
+    client = _client
+    return client.metrics() if client is not None else None
+
+
+def reset_ai_client():
+    """Drop the shared client, e.g. after changing AI_CLIENT settings"""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
@@ -1,20 +1,52 @@
-import os
-import openai
+import logging
+import re
+import time
+from typing import Dict, Iterator, Sequence
+
 from django.conf import settings
 
-# Configure API key from environment or Django settings
-openai.api_key = os.getenv('OPENAI_API_KEY') or getattr(settings, 'OPENAI_API_KEY', None)
+from ai_tutor.services.client import AIClientError, AIUnavailable, get_ai_client
+from ai_tutor.services.prompt import build_messages
 
+logger = logging.getLogger(__name__)
 
-def _mock_response(message: str, exercise, user_query: str = None, error: str = None) -> str:
-    """Return a short canned response for demo/mock mode."""
+
+def _canned_hint(message: str, exercise, user_query: str = None, error: str = None) -> str:
     ex_title = getattr(exercise, 'title', 'this exercise') if exercise is not None else 'the exercise'
     # Keep response concise to save tokens in eventual real mode
     if error:
-        return f"I see an error: {error}. Check your SELECT columns and WHERE clause for typos. (mock)"
+        return f"I see an error: {error}. Check your SELECT columns and WHERE clause for typos."
     if user_query:
-        return f"Your query looks reasonable for {ex_title}. Consider ordering results or selecting explicit columns. (mock)"
-    return f"Try selecting the relevant columns from the table for {ex_title}. (mock)"
+        return f"Your query looks reasonable for {ex_title}. Consider ordering results or selecting explicit columns."
+    return f"Try selecting the relevant columns from the table for {ex_title}."
+
+
+def _mock_response(message: str, exercise, user_query: str = None, error: str = None) -> str:
+    """Return a short canned response for demo/mock mode."""
+    return _canned_hint(message, exercise, user_query, error) + " (mock)"
+
+
+class AIServiceError(Exception):
+    """The AI call produced no usable answer; the message is safe to show to the student"""
+
+
+class AIFallback(AIServiceError):
+    """The AI is unavailable; the message is a canned hint to show instead"""
+
+
+def _completion_kwargs(message: str, exercise=None, user_query: str = None, error: str = None,
+                       history: Sequence[Dict] = ()) -> dict:
+    return {
+        'messages': build_messages(message, exercise, user_query, error, history),
+        'max_tokens': 150,
+        'temperature': 0.2,
+    }
+
+
+def _fallback(message: str, exercise, user_query: str, error: str, cause: Exception) -> AIFallback:
+    logger.warning('AI tutor unavailable, serving a canned hint: %s', cause)
+    hint = _canned_hint(message, exercise, user_query, error)
+    return AIFallback(f"The AI tutor is busy right now, so here is a general hint: {hint}")
 
 
 def get_ai_response(message: str, exercise=None, user_query: str = None, error: str = None) -> str:
@@ -22,34 +54,85 @@ def get_ai_response(message: str, exercise=None, user_query: str = None, error:
 
     Behavior:
     - If `OPENAI_MODE` in Django settings is 'mock' (default), return a canned response.
-    - If set to 'real', attempt a single short OpenAI chat completion call (with token limits).
+    - If set to 'real', make one short chat completion through the shared AIClient
+      (timeouts, retries, circuit breaker); a canned hint is returned while it is unavailable.
+    """
+    try:
+        return generate_ai_response(message, exercise, user_query, error)
+    except AIServiceError as e:
+        return str(e)
+
+
+def generate_ai_response(message: str, exercise=None, user_query: str = None, error: str = None,
+                         history: Sequence[Dict] = ()) -> str:
+    """
+    Like get_ai_response, but raises AIServiceError instead of returning a fallback message.
+    history: the session's earlier turns on this exercise, newest first (see prompt.build_messages)
     """
     mode = getattr(settings, 'OPENAI_MODE', 'mock')
     # Mock mode: quick, deterministic, zero-cost
     if mode != 'real':
         return _mock_response(message, exercise, user_query, error)
 
-    # Real mode: attempt to call OpenAI with strict limits
-    if not openai.api_key:
-        return "AI tutor is not configured (missing OPENAI_API_KEY)."
+    client = get_ai_client()
+    if not client.configured:
+        raise AIServiceError("AI tutor is not configured (missing OPENAI_API_KEY).")
+
+    try:
+        content = client.complete(**_completion_kwargs(message, exercise, user_query, error, history))
+    except AIUnavailable as e:
+        raise _fallback(message, exercise, user_query, error, e) from e
+    except AIClientError as e:
+        logger.warning('AI tutor request failed: %s', e)
+        if client.breaker.state != client.breaker.CLOSED:
+            raise _fallback(message, exercise, user_query, error, e) from e
+        raise AIServiceError("AI tutor failed to generate a response (see server logs).") from e
+    if not content:
+        raise AIServiceError("AI returned no content.")
+    return content
+
+
+_WORD_RE = re.compile(r'\S+\s*')
+
+
+def _mock_stream(text: str) -> Iterator[str]:
+    """Replay a mock response in word chunks, AI_MOCK_STREAM_DELAY seconds apart"""
+    delay = float(getattr(settings, 'AI_MOCK_STREAM_DELAY', 0.05))
+    size = max(1, int(getattr(settings, 'AI_MOCK_STREAM_CHUNK_WORDS', 3)))
+    words = _WORD_RE.findall(text)
+    for i in range(0, len(words), size):
+        if delay:
+            time.sleep(delay)
+        yield ''.join(words[i:i + size])
+
+
+def stream_ai_response(message: str, exercise=None, user_query: str = None, error: str = None,
+                       history: Sequence[Dict] = ()) -> Iterator[str]:
+    """
+    Yield the tutor response in chunks as the model produces them.
+    Raises AIServiceError (possibly after some chunks) if no usable answer is produced,
+    or AIFallback before the first chunk if the AI is unavailable.
+    """
+    mode = getattr(settings, 'OPENAI_MODE', 'mock')
+    if mode != 'real':
+        yield from _mock_stream(_mock_response(message, exercise, user_query, error))
+        return
+
+    client = get_ai_client()
+    if not client.configured:
+        raise AIServiceError("AI tutor is not configured (missing OPENAI_API_KEY).")
 
-    prompt = f"You are a concise SQL tutor. Message: {message}\nExercise: {getattr(exercise, 'title', None)}\nUser query: {user_query}\nError: {error}"
+    produced = False
     try:
-        resp = openai.ChatCompletion.create(
-            model='gpt-4o-mini',
-            messages=[
-                {"role": "system", "content": "You are a concise SQL tutor. Keep responses short and focused."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=150,
-            temperature=0.2,
-        )
-        # Safe access to response
-        choices = getattr(resp, 'choices', None) or resp.get('choices', [])
-        if choices:
-            # openai library response shape may vary; handle common patterns
-            content = choices[0].get('message', {}).get('content') if isinstance(choices[0], dict) else getattr(choices[0].message, 'content', '')
-            return (content or '').strip()
-        return "AI returned no content."
-    except Exception:
-        return "AI tutor failed to generate a response (see server logs)."
+        for content in client.stream(**_completion_kwargs(message, exercise, user_query, error, history)):
+            produced = True
+            yield content
+    except AIUnavailable as e:
+        raise _fallback(message, exercise, user_query, error, e) from e
+    except AIClientError as e:
+        logger.warning('AI tutor stream failed: %s', e)
+        if not produced and client.breaker.state != client.breaker.CLOSED:
+            raise _fallback(message, exercise, user_query, error, e) from e
+        raise AIServiceError("AI tutor failed to generate a response (see server logs).") from e
+    if not produced:
+        raise AIServiceError("AI returned no content.")
@@ -0,0 +1,231 @@
+from typing import Dict, List, Optional, Sequence
+
+from django.conf import settings
+from django.core.cache import cache
+
+from exercises.services.result_cache import get_cached_expected_result, schema_version
+from exercises.services.sql_validator import COMMENT, PUNCT, QUOTED_IDENT, WORD, tokenize
+
+SYSTEM_PROMPT = (
+    "You are a concise SQL tutor. Keep responses short and focused. "
+    "Guide the student towards the answer; do not give the full solution query."
+)
+
+_CONSTRAINT_WORDS = frozenset(['PRIMARY', 'FOREIGN', 'KEY', 'UNIQUE', 'CONSTRAINT', 'INDEX', 'CHECK', 'FULLTEXT'])
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English and SQL); never underestimates short text"""
+    return (len(text) + 3) // 4 if text else 0
+
+
+def _name(tok) -> str:
+    return tok.value[1:-1] if tok.kind == QUOTED_IDENT else tok.value
+
+
+def _split_top_level(tokens) -> List[list]:
+    """Split the tokens inside a CREATE TABLE's parentheses at top-level commas"""
+    parts, current, depth = [], [], 0
+    for tok in tokens:
+        if tok.kind == PUNCT and tok.value == '(':
+            depth += 1
+        elif tok.kind == PUNCT and tok.value == ')':
+            depth -= 1
+        elif tok.kind == PUNCT and tok.value == ',' and depth == 0:
+            parts.append(current)
+            current = []
+            continue
+        current.append(tok)
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _idents_in_parens(tokens, start: int) -> List[str]:
+    """Identifiers in the first (...) group at or after tokens[start]"""
+    names, inside = [], False
+    for tok in tokens[start:]:
+        if tok.kind == PUNCT and tok.value == '(':
+            inside = True
+        elif tok.kind == PUNCT and tok.value == ')' and inside:
+            break
+        elif inside and tok.kind in (WORD, QUOTED_IDENT):
+            names.append(_name(tok))
+    return names
+
+
+def _reference(tokens) -> Optional[str]:
+    """`REFERENCES table (column)` as 'table.column'"""
+    for i, tok in enumerate(tokens):
+        if tok.kind == WORD and tok.value.upper() == 'REFERENCES' and i + 1 < len(tokens):
+            table = _name(tokens[i + 1])
+            cols = _idents_in_parens(tokens, i + 2)
+            return f"{table}.{cols[0]}" if cols else table
+    return None
+
+
+def parse_tables(schema_sql: str) -> List[Dict]:
+    """
+    Tables, columns and keys from CREATE TABLE statements:
+    [{'name': ..., 'columns': [{'name', 'type', 'pk', 'fk'}]}]
+    """
+    tokens = [tok for tok in tokenize(schema_sql or '') if tok.kind != COMMENT]
+    tables = []
+    i = 0
+    while i < len(tokens):
+        tok = tokens[i]
+        if not (tok.kind == WORD and tok.value.upper() == 'CREATE'):
+            i += 1
+            continue
+        # CREATE [TEMPORARY] TABLE [IF NOT EXISTS] name (
+        j = i + 1
+        while j < len(tokens) and tokens[j].kind == WORD and tokens[j].value.upper() != 'TABLE':
+            j += 1
+        if j >= len(tokens) or tokens[j].kind != WORD:
+            break
+        j += 1
+        while j < len(tokens) and tokens[j].kind == WORD and tokens[j].value.upper() in ('IF', 'NOT', 'EXISTS'):
+            j += 1
+        if j + 1 >= len(tokens) or tokens[j + 1].value != '(':
+            i = j
+            continue
+        table = {'name': _name(tokens[j]), 'columns': []}
+
+        # Collect the body up to the matching ')'
+        depth, k, body = 0, j + 1, []
+        while k < len(tokens):
+            t = tokens[k]
+            if t.kind == PUNCT and t.value == '(':
+                depth += 1
+                if depth == 1:
+                    k += 1
+                    continue
+            elif t.kind == PUNCT and t.value == ')':
+                depth -= 1
+                if depth == 0:
+                    break
+            body.append(t)
+            k += 1
+
+        columns = {}
+        for part in _split_top_level(body):
+            if not part:
+                continue
+            head = part[0].value.upper() if part[0].kind == WORD else ''
+            if head in _CONSTRAINT_WORDS:
+                words = [t.value.upper() for t in part if t.kind == WORD]
+                if 'PRIMARY' in words:
+                    for name in _idents_in_parens(part, 0):
+                        if name in columns:
+                            columns[name]['pk'] = True
+                elif 'FOREIGN' in words:
+                    names = _idents_in_parens(part, 0)
+                    ref = _reference(part)
+                    if names and names[0] in columns:
+                        columns[names[0]]['fk'] = ref
+                continue
+            words = [t.value.upper() for t in part if t.kind == WORD]
+            column = {
+                'name': _name(part[0]),
+                'type': part[1].value.lower() if len(part) > 1 and part[1].kind == WORD else '',
+                'pk': 'PRIMARY' in words,
+                'fk': _reference(part),
+            }
+            columns[column['name']] = column
+            table['columns'].append(column)
+        tables.append(table)
+        i = k + 1
+    return tables
+
+
+def format_schema_summary(tables: Sequence[Dict]) -> str:
+    """One compact line per table, e.g. `employees(id int PK, dept_id int FK->departments.id)`"""
+    lines = []
+    for table in tables:
+        cols = []
+        for col in table['columns']:
+            text = f"{col['name']} {col['type']}".strip()
+            if col['pk']:
+                text += ' PK'
+            if col['fk']:
+                text += f" FK->{col['fk']}"
+            cols.append(text)
+        lines.append(f"{table['name']}({', '.join(cols)})")
+    return '\n'.join(lines)
+
+
+def schema_summary(schema) -> str:
+    """Compact summary of a DatabaseSchema, computed once per schema version"""
+    if schema is None:
+        return ''
+    key = f'schema_summary:{schema.id}:{schema_version(schema)}'
+    summary = cache.get(key)
+    if summary is None:
+        summary = format_schema_summary(parse_tables(schema.schema_sql))
+        cache.set(key, summary, getattr(settings, 'EXPECTED_RESULT_CACHE_TIMEOUT', 60 * 60 * 24))
+    return summary
+
+
+def expected_shape(exercise) -> str:
+    """Columns and row count of the reference result, if already cached; never the rows themselves"""
+    result = get_cached_expected_result(exercise) if exercise is not None else None
+    if not result:
+        return ''
+    return f"{', '.join(result['columns'])} ({result['row_count']} rows)"
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return text[:max(0, max_tokens * 4 - 3)] + '...'
+
+
+def build_messages(message: str, exercise=None, user_query: str = None, error: str = None,
+                   history: Sequence[Dict] = ()) -> List[Dict]:
+    """
+    Chat messages for the tutor, fitted to AI_PROMPT_TOKEN_BUDGET.
+    The student's question always goes in; the exercise, schema summary, expected result
+    shape and then earlier turns (newest first) are added while they fit the budget.
+    history: earlier turns, newest first, as {'message': ..., 'response': ...}
+    """
+    budget = int(getattr(settings, 'AI_PROMPT_TOKEN_BUDGET', 1200))
+
+    question = [f"Question: {message}"]
+    if user_query:
+        question.append(f"My query:\n{user_query}")
+    if error:
+        question.append(f"Error: {error}")
+    question = _truncate('\n'.join(question), budget // 2)
+    used = estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(question)
+
+    context = []
+    if exercise is not None:
+        sections = [f"Exercise: {exercise.title}\n{exercise.description}"]
+        summary = schema_summary(getattr(exercise, 'schema', None))
+        if summary:
+            sections.append(f"Schema:\n{summary}")
+        shape = expected_shape(exercise)
+        if shape:
+            sections.append(f"Expected result columns: {shape}")
+        for section in sections:
+            room = budget - used
+            if room <= 0:
+                break
+            section = _truncate(section, room)
+            context.append(section)
+            used += estimate_tokens(section)
+
+    turns = []
+    for turn in history:
+        cost = estimate_tokens(turn['message']) + estimate_tokens(turn['response'])
+        if used + cost > budget:
+            break
+        turns.append(turn)
+        used += cost
+
+    messages = [{"role": "system", "content": SYSTEM_PROMPT + ('\n\n' + '\n\n'.join(context) if context else '')}]
+    for turn in reversed(turns):
+        messages.append({"role": "user", "content": turn['message']})
+        messages.append({"role": "assistant", "content": turn['response']})
+    messages.append({"role": "user", "content": question})
+    return messages
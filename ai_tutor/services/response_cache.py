@@ -0,0 +1,115 @@
+import hashlib
+import re
+import threading
+from typing import Callable, Dict, Optional, Sequence, Tuple, Union
+
+from django.conf import settings
+from django.core.cache import caches
+
+from chatsql.metrics import cache_lookup
+from exercises.services.sql_validator import query_fingerprint
+from ai_tutor.services.openai_service import AIServiceError, generate_ai_response
+
+CACHE_ALIAS = 'ai_responses'
+KEY_PREFIX = 'ai_response'
+
+_NUMBER_RE = re.compile(r'\d+')
+_SPACE_RE = re.compile(r'\s+')
+
+
+def text_fingerprint(text: Optional[str]) -> str:
+    """Case- and whitespace-insensitive form of an error or message; numbers (positions, line numbers) become ?"""
+    if not text:
+        return ''
+    return _SPACE_RE.sub(' ', _NUMBER_RE.sub('?', text)).strip().lower()
+
+
+def cache_key(exercise, message: str, user_query: str = None, error: str = None) -> str:
+    mode = getattr(settings, 'OPENAI_MODE', 'mock')
+    parts = (
+        mode,
+        str(getattr(exercise, 'id', '')),
+        text_fingerprint(message),
+        query_fingerprint(user_query),
+        text_fingerprint(error),
+    )
+    digest = hashlib.sha256('\x00'.join(parts).encode('utf-8')).hexdigest()
+    return f'{KEY_PREFIX}:{digest}'
+
+
+class _Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.hits = self.misses = self.bypassed = self.stored = 0
+
+    def incr(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'bypassed': self.bypassed,
+                'stored': self.stored,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+_stats = _Stats()
+
+
+def response_cache_stats() -> Dict:
+    """Hit / miss counters for this process"""
+    return _stats.snapshot()
+
+
+def lookup_response(key: str, bypass: bool = False) -> Optional[str]:
+    """Cached answer for a cache_key(), or None on a miss, a bypass or with the cache disabled"""
+    if bypass or not getattr(settings, 'AI_RESPONSE_CACHE_ENABLED', True):
+        _stats.incr('bypassed')
+        return None
+    cached = caches[CACHE_ALIAS].get(key)
+    _stats.incr('hits' if cached is not None else 'misses')
+    cache_lookup('ai_response', cached is not None)
+    return cached
+
+
+def store_response(key: str, response: str):
+    if getattr(settings, 'AI_RESPONSE_CACHE_ENABLED', True):
+        caches[CACHE_ALIAS].set(key, response)
+        _stats.incr('stored')
+
+
+def get_cached_ai_response(message: str, exercise=None, user_query: str = None, error: str = None,
+                           bypass: bool = False,
+                           history: Union[Sequence[Dict], Callable[[], Sequence[Dict]]] = ()) -> Tuple[str, bool]:
+    """
+    get_ai_response through the response cache.
+    Entries expire after the ai_responses cache TIMEOUT, and the least recently used are
+    culled past MAX_ENTRIES. Failed AI calls are never cached.
+    With bypass (or AI_RESPONSE_CACHE_ENABLED = False) the AI is always asked, and the
+    fresh answer replaces any cached one.
+    The key ignores `history`: equivalent questions share an answer whatever came before.
+    `history` may be a callable, so it is only loaded when the AI is actually asked.
+    Returns (response, served_from_cache).
+    """
+    key = cache_key(exercise, message, user_query, error)
+    cached = lookup_response(key, bypass)
+    if cached is not None:
+        return cached, True
+
+    if callable(history):
+        history = history()
+    try:
+        response = generate_ai_response(message, exercise, user_query, error, history)
+    except AIServiceError as e:
+        return str(e), False
+    store_response(key, response)
+    return response, False
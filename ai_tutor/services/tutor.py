@@ -0,0 +1,173 @@
+import base64
+import binascii
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+from django.conf import settings
+from django.db.models import Q
+
+from exercises.models import ChatHistory, Exercise
+from exercises.services.query_runner import ensure_session_key
+from exercises.services.write_behind import BatchWriter
+from ai_tutor.services.openai_service import AIFallback, AIServiceError, stream_ai_response
+from ai_tutor.services.response_cache import cache_key, get_cached_ai_response, lookup_response, store_response
+
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    """The history cursor was not produced by chat_history_page"""
+
+
+def _write_chat(batch: List[ChatHistory]):
+    # The exercise FK is SET_NULL, so detach messages whose exercise was deleted before the flush
+    exercise_ids = {chat.exercise_id for chat in batch if chat.exercise_id is not None}
+    live = set(Exercise.objects.filter(id__in=exercise_ids).values_list('id', flat=True))
+    for chat in batch:
+        if chat.exercise_id not in live:
+            chat.exercise_id = None
+    ChatHistory.objects.bulk_create(batch, batch_size=500)
+
+
+chat_writer = BatchWriter('chat', _write_chat)
+
+
+def ask_tutor(exercise, session, message: str, user_query: str = None, error: str = None,
+              bypass_cache: bool = False) -> Dict:
+    """
+    Get an AI tutor response for an exercise and queue it for ChatHistory.
+    Returns the response payload: {'response': str, 'cached': bool}.
+    """
+    session_id = ensure_session_key(session)
+
+    # Get AI response (mock or real), reusing answers to equivalent questions
+    resp_text, cached = get_cached_ai_response(
+        message or user_query or 'Help me', exercise, user_query, error,
+        bypass=bypass_cache, history=lambda: _recent_turns(exercise, session_id)
+    )
+
+    _save_chat(session_id, exercise, message or user_query or '', resp_text, user_query, error)
+    return {'response': resp_text, 'cached': cached}
+
+
+def _recent_turns(exercise, session_id: str) -> List[Dict]:
+    """The session's last AI_PROMPT_HISTORY_TURNS exchanges on this exercise, newest first"""
+    limit = getattr(settings, 'AI_PROMPT_HISTORY_TURNS', 3)
+    if not limit or getattr(settings, 'OPENAI_MODE', 'mock') != 'real':
+        return []
+    # This session's messages still waiting for chat_writer are newer than anything saved;
+    # ones that already have a pk were written and come back from the query below
+    pending = [
+        chat for chat in chat_writer.snapshot()
+        if chat.pk is None and chat.session_id == session_id and chat.exercise_id == exercise.id
+    ]
+    saved = list(
+        ChatHistory.objects.filter(session_id=session_id, exercise=exercise)
+        .order_by('-created_at', '-id')
+        .values('message', 'response', 'created_at')[:limit]
+    )
+    turns = [{'message': c.message, 'response': c.response, 'created_at': c.created_at} for c in pending] + saved
+    turns.sort(key=lambda turn: turn['created_at'], reverse=True)
+    return [{'message': turn['message'], 'response': turn['response']} for turn in turns[:limit]]
+
+
+def _save_chat(session_id, exercise, message, response, user_query, error):
+    # Persist ChatHistory in the background; created_at is stamped now
+    chat_writer.add(ChatHistory(
+        session_id=session_id,
+        exercise=exercise,
+        message=message,
+        response=response,
+        context={'user_query': user_query, 'error': error}
+    ))
+
+
+def stream_tutor(exercise, session, message: str, user_query: str = None, error: str = None,
+                 bypass_cache: bool = False) -> Iterator[Dict]:
+    """
+    Streaming ask_tutor. The session is created before returning, so its cookie can go out
+    with the response headers; the AI is called as the returned iterator is consumed.
+    Yields {'event': 'token', 'text': ...} chunks, then a final {'event': 'done', 'response',
+    'cached'} once the full answer is saved, or {'event': 'error', 'error': ...}.
+    """
+    session_id = ensure_session_key(session)
+    prompt = message or user_query or 'Help me'
+
+    def events():
+        key = cache_key(exercise, prompt, user_query, error)
+        cached = lookup_response(key, bypass_cache)
+        if cached is not None:
+            yield {'event': 'token', 'text': cached}
+            _save_chat(session_id, exercise, message or user_query or '', cached, user_query, error)
+            yield {'event': 'done', 'response': cached, 'cached': True}
+            return
+
+        parts = []
+        try:
+            for text in stream_ai_response(prompt, exercise, user_query, error, _recent_turns(exercise, session_id)):
+                parts.append(text)
+                yield {'event': 'token', 'text': text}
+        except AIFallback as e:
+            # The AI is unavailable: answer with the canned hint rather than an error
+            yield {'event': 'token', 'text': str(e)}
+            _save_chat(session_id, exercise, message or user_query or '', str(e), user_query, error)
+            yield {'event': 'done', 'response': str(e), 'cached': False}
+            return
+        except AIServiceError as e:
+            yield {'event': 'error', 'error': str(e)}
+            return
+        response = ''.join(parts).strip()
+        store_response(key, response)
+        _save_chat(session_id, exercise, message or user_query or '', response, user_query, error)
+        yield {'event': 'done', 'response': response, 'cached': False}
+
+    return events()
+
+
+def _encode_cursor(chat: ChatHistory) -> str:
+    raw = f'{chat.created_at.isoformat()}|{chat.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise InvalidCursor('Invalid cursor') from e
+
+
+def chat_history_page(exercise, session_id: Optional[str], cursor: str = None, limit: int = HISTORY_PAGE_SIZE) -> Dict:
+    """
+    One page of a session's chat for an exercise, newest first.
+    Keyset pagination on (created_at, id): each page is a range scan of
+    chat_history_session_ex_idx no matter how deep the client pages.
+    Returns {'results': [...], 'next_cursor': str or None}.
+    """
+    if not session_id:
+        return {'results': [], 'next_cursor': None}
+    # Make this session's just-asked messages visible
+    if len(chat_writer):
+        chat_writer.flush()
+
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+    qs = ChatHistory.objects.filter(session_id=session_id, exercise=exercise)
+    if cursor:
+        created_at, pk = _decode_cursor(cursor)
+        qs = qs.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+    page = list(qs.order_by('-created_at', '-id')[:limit + 1])
+
+    has_more = len(page) > limit
+    page = page[:limit]
+    return {
+        'results': [{
+            'id': chat.id,
+            'message': chat.message,
+            'response': chat.response,
+            'context': chat.context,
+            'created_at': chat.created_at.isoformat()
+        } for chat in page],
+        'next_cursor': _encode_cursor(page[-1]) if has_more else None
+    }
@@ -0,0 +1,386 @@
+import asyncio
+import json
+import threading
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from django.core.cache import cache, caches
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from ai_tutor.services import response_cache
+from ai_tutor.services.client import AIClient, AIClientError
+from ai_tutor.services.openai_service import AIServiceError
+from ai_tutor.services.response_cache import cache_key, get_cached_ai_response
+from ai_tutor.services.tutor import ask_tutor, chat_history_page, chat_writer
+from exercises.models import ChatHistory
+from exercises.tests import create_exercise
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """
+    POST /v1/chat/completions streaming `server.chunks` as chat completion chunks.
+    With `server.break_off` set the connection is dropped mid-body, before the terminating chunk.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for text in self.server.chunks:
+            chunk = {
+                'id': 'chatcmpl-test', 'object': 'chat.completion.chunk', 'created': 0, 'model': 'fake',
+                'choices': [{'index': 0, 'delta': {'content': text}, 'finish_reason': None}],
+            }
+            self._write_chunk(f'data: {json.dumps(chunk)}\n\n'.encode())
+        if self.server.break_off:
+            self.close_connection = True
+            return
+        self._write_chunk(b'data: [DONE]\n\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+
+def start_fake_openai(test, **options):
+    """A FakeOpenAIHandler server and an AIClient for it, both stopped after the test"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeOpenAIHandler)
+    server.chunks = ['Use ', 'a WHERE ', 'clause.']
+    server.break_off = False
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    test.addCleanup(server.server_close)
+    test.addCleanup(server.shutdown)
+    client = AIClient(
+        'test-key', BASE_URL=f'http://127.0.0.1:{server.server_port}/v1',
+        **{'MAX_RETRIES': 0, 'BREAKER_THRESHOLD': 1, 'TIMEOUT': 5, **options},
+    )
+    test.addCleanup(client.close)
+    return server, client
+
+
+class TransportError(Exception):
+    """Stands in for an HTTP library error that openai does not wrap, e.g. httpx.ReadTimeout"""
+
+
+class BrokenStream:
+    def __init__(self):
+        self.closed = False
+
+    def __iter__(self):
+        yield mock.Mock(choices=[mock.Mock(delta=mock.Mock(content='Use '))])
+        raise TransportError('read timed out')
+
+    def close(self):
+        self.closed = True
+
+
+class AIClientStreamTests(SimpleTestCase):
+    """AIClient.stream against a local OpenAI-compatible server"""
+
+    def setUp(self):
+        self.server, self.client = start_fake_openai(self)
+
+    def test_stream_yields_chunks(self):
+        chunks = list(self.client.stream([{'role': 'user', 'content': 'hint?'}]))
+        self.assertEqual(chunks, ['Use ', 'a WHERE ', 'clause.'])
+        self.assertEqual(self.client.metrics()['failures'], 0)
+        self.assertEqual(self.client.metrics()['in_flight'], 0)
+        self.assertEqual(self.client.breaker.state, 'closed')
+
+    def test_stream_broken_off_mid_body(self):
+        self.server.break_off = True
+        received = []
+        with self.assertRaises(AIClientError):
+            for chunk in self.client.stream([{'role': 'user', 'content': 'hint?'}]):
+                received.append(chunk)
+        self.assertEqual(received, ['Use ', 'a WHERE ', 'clause.'])
+        metrics = self.client.metrics()
+        self.assertEqual(metrics['failures'], 1)
+        self.assertEqual(metrics['in_flight'], 0)
+        # BREAKER_THRESHOLD=1: the broken stream alone opens the circuit
+        self.assertEqual(metrics['circuit'], 'open')
+
+    def test_stream_transport_error_mid_body(self):
+        stream = BrokenStream()
+        with mock.patch.object(self.client._client.chat.completions, 'create', return_value=stream):
+            with self.assertRaises(AIClientError):
+                list(self.client.stream([{'role': 'user', 'content': 'hint?'}]))
+        self.assertTrue(stream.closed)
+        metrics = self.client.metrics()
+        self.assertEqual(metrics['failures'], 1)
+        self.assertEqual(metrics['in_flight'], 0)
+        self.assertEqual(metrics['circuit'], 'open')
+
+
+class AIClientBreakerTests(SimpleTestCase):
+    """The half-open trial call must always give its slot back, however it ends"""
+
+    def setUp(self):
+        self.server, self.client = start_fake_openai(self, BREAKER_RESET=0.05)
+        self.client.breaker.record_failure()  # threshold 1: the circuit is open
+        time.sleep(0.06)
+        self.assertEqual(self.client.breaker.state, 'half-open')
+
+    def test_stream_closed_during_trial(self):
+        stream = self.client.stream([{'role': 'user', 'content': 'hint?'}])
+        self.assertEqual(next(stream), 'Use ')
+        self.assertFalse(self.client.breaker.allow())  # the trial is running
+        stream.close()
+        self.assertEqual(self.client.metrics()['in_flight'], 0)
+        # Still half-open, and the next call is let through as the trial and closes the circuit
+        chunks = list(self.client.stream([{'role': 'user', 'content': 'hint?'}]))
+        self.assertEqual(chunks, ['Use ', 'a WHERE ', 'clause.'])
+        self.assertEqual(self.client.breaker.state, 'closed')
+
+    def test_unexpected_error_during_trial(self):
+        with mock.patch.object(self.client._client.chat.completions, 'create', side_effect=TypeError('bad kwarg')):
+            with self.assertRaises(TypeError):
+                self.client.complete([{'role': 'user', 'content': 'hint?'}])
+            with self.assertRaises(TypeError):
+                list(self.client.stream([{'role': 'user', 'content': 'hint?'}]))
+        self.assertEqual(len(list(self.client.stream([{'role': 'user', 'content': 'hint?'}]))), 3)
+        self.assertEqual(self.client.breaker.state, 'closed')
+
+
+@override_settings(WRITE_BEHIND_ENABLED=True, WRITE_BEHIND_INTERVAL=3600, WRITE_BEHIND_MAX_PENDING=1000)
+class AIResponseCacheTests(SimpleTestCase):
+    """Tutor answers are cached under a key that ignores layout, case and literal values"""
+
+    exercise = SimpleNamespace(id=7)
+
+    def setUp(self):
+        caches[response_cache.CACHE_ALIAS].clear()
+        self.ai = self.enterContext(
+            mock.patch.object(response_cache, 'generate_ai_response', return_value='Try GROUP BY')
+        )
+
+    def key(self, message='Why is this wrong?', user_query=None, error=None, exercise=exercise):
+        return cache_key(exercise, message, user_query, error)
+
+    def test_equivalent_questions_share_a_key(self):
+        self.assertEqual(self.key('Why is this  WRONG? '), self.key())
+        self.assertEqual(self.key(user_query="select name from employees where id = 7;"),
+                         self.key(user_query="SELECT  name\nFROM `employees` WHERE id='12'"))
+        self.assertEqual(self.key(error="Unknown column 'x' at line 3"),
+                         self.key(error="unknown column 'x' at line 12"))
+
+    def test_different_questions_do_not(self):
+        base = self.key(user_query='SELECT name FROM employees', error='syntax error')
+        for other in (
+            self.key(user_query='SELECT name FROM employees', error='syntax error', exercise=SimpleNamespace(id=8)),
+            self.key(user_query='SELECT title FROM employees', error='syntax error'),
+            self.key(user_query='SELECT name FROM employees', error='no such table'),
+            self.key('Give me a hint', user_query='SELECT name FROM employees', error='syntax error'),
+        ):
+            self.assertNotEqual(other, base)
+        with self.settings(OPENAI_MODE='real'):
+            self.assertNotEqual(self.key(user_query='SELECT name FROM employees', error='syntax error'), base)
+
+    def test_hits_skip_the_ai_and_the_history(self):
+        history = mock.Mock(return_value=[])
+        answer = get_cached_ai_response('Why?', self.exercise, 'SELECT 1', history=history)
+        self.assertEqual(answer, ('Try GROUP BY', False))
+        answer = get_cached_ai_response('why? ', self.exercise, 'SELECT 2', history=history)
+        self.assertEqual(answer, ('Try GROUP BY', True))
+        self.assertEqual((self.ai.call_count, history.call_count), (1, 1))
+
+    def test_bypass_replaces_the_cached_answer(self):
+        get_cached_ai_response('Why?', self.exercise)
+        self.ai.return_value = 'Check the JOIN'
+        self.assertEqual(get_cached_ai_response('Why?', self.exercise, bypass=True), ('Check the JOIN', False))
+        self.assertEqual(get_cached_ai_response('Why?', self.exercise), ('Check the JOIN', True))
+
+    def test_failures_and_disabled_cache_are_not_stored(self):
+        self.ai.side_effect = AIServiceError('The AI is unavailable')
+        self.assertEqual(get_cached_ai_response('Why?', self.exercise), ('The AI is unavailable', False))
+        self.ai.side_effect = None
+        with self.settings(AI_RESPONSE_CACHE_ENABLED=False):
+            get_cached_ai_response('Why?', self.exercise)
+        self.assertEqual(get_cached_ai_response('Why?', self.exercise), ('Try GROUP BY', False))
+        self.assertEqual(self.ai.call_count, 3)
+
+
+class ChatHistoryTests(TestCase):
+    """Batched ChatHistory writes and the keyset-paginated history API"""
+
+    def setUp(self):
+        cache.clear()
+        self.exercise = create_exercise()
+        chat_writer.flush()
+
+    def add_chats(self, session_id, count, created_at=None):
+        now = timezone.now()
+        ChatHistory.objects.bulk_create([
+            ChatHistory(session_id=session_id, exercise=self.exercise, message=f'q{i}', response=f'a{i}',
+                        created_at=created_at or now + timedelta(seconds=i))
+            for i in range(count)
+        ])
+
+    def collect(self, session_id, limit):
+        messages, cursor, pages = [], None, 0
+        while True:
+            page = chat_history_page(self.exercise, session_id, cursor, limit)
+            messages += [chat['message'] for chat in page['results']]
+            pages += 1
+            cursor = page['next_cursor']
+            if cursor is None:
+                return messages, pages
+
+    def test_pages_newest_first(self):
+        self.add_chats('s1', 7)
+        self.add_chats('s2', 3)
+        messages, pages = self.collect('s1', 3)
+        self.assertEqual(messages, [f'q{i}' for i in reversed(range(7))])
+        self.assertEqual(pages, 3)
+
+    def test_ties_on_created_at_are_ordered_by_id(self):
+        self.add_chats('s1', 5, created_at=timezone.now())
+        messages, _ = self.collect('s1', 2)
+        self.assertEqual(messages, [f'q{i}' for i in reversed(range(5))])
+
+    def test_exact_page_has_no_next_cursor(self):
+        self.add_chats('s1', 4)
+        page = chat_history_page(self.exercise, 's1', limit=4)
+        self.assertEqual(len(page['results']), 4)
+        self.assertIsNone(page['next_cursor'])
+
+    def test_asked_messages_are_written_in_a_batch(self):
+        session = self.client.session
+        session.save()
+        for message in ('first', 'second', 'third'):
+            ask_tutor(self.exercise, session, message)
+        self.assertFalse(ChatHistory.objects.exists())
+        self.assertEqual(len(chat_writer), 3)
+        # Reading the history flushes the buffer first
+        page = chat_history_page(self.exercise, session.session_key)
+        self.assertEqual([chat['message'] for chat in page['results']], ['third', 'second', 'first'])
+        self.assertEqual(len(chat_writer), 0)
+
+    def test_view(self):
+        session = self.client.session
+        session.save()
+        self.add_chats(session.session_key, 3)
+        url = f'/api/exercises/{self.exercise.id}/ai/history/'
+        response = self.client.get(url, {'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        first = response.json()
+        self.assertEqual([chat['message'] for chat in first['results']], ['q2', 'q1'])
+        response = self.client.get(url, {'limit': 2, 'cursor': first['next_cursor']})
+        self.assertEqual([chat['message'] for chat in response.json()['results']], ['q0'])
+
+        self.assertEqual(self.client.get(url, {'cursor': 'not-a-cursor'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'limit': 'ten'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/exercises/999999/ai/history/').status_code, 404)
+
+
+def parse_sse(body: bytes):
+    """[(event name, data), ...] of a text/event-stream body"""
+    events = []
+    for block in body.decode().split('\n\n'):
+        if block:
+            name, data = block.split('\n')
+            events.append((name[len('event: '):], json.loads(data[len('data: '):])))
+    return events
+
+
+@override_settings(WRITE_BEHIND_ENABLED=False, AI_MOCK_STREAM_DELAY=0, AI_MOCK_STREAM_CHUNK_WORDS=3)
+class AIStreamViewTests(TransactionTestCase):
+    """Event sequence of the server-sent event endpoints"""
+
+    def setUp(self):
+        cache.clear()
+        self.exercise = create_exercise()
+        self.url = f'/api/exercises/{self.exercise.id}/ai/stream/'
+
+    def stream(self, body, url=None):
+        response = self.client.post(url or self.url, body, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return parse_sse(b''.join(response.streaming_content))
+
+    def test_tokens_then_done(self):
+        events = self.stream({'message': 'Where do I start?'})
+        names = [name for name, _ in events]
+        self.assertEqual(names, ['token'] * (len(events) - 1) + ['done'])
+        self.assertGreater(len(events), 2)
+        done = events[-1][1]
+        self.assertEqual(done['response'], ''.join(data['text'] for _, data in events[:-1]).strip())
+        self.assertFalse(done['cached'])
+        self.assertEqual(ChatHistory.objects.get().response, done['response'])
+
+    def test_cached_answer_is_one_token(self):
+        first = self.stream({'message': 'Where do I start?'})
+        events = self.stream({'message': 'Where do I start?'})
+        self.assertEqual([name for name, _ in events], ['token', 'done'])
+        self.assertTrue(events[1][1]['cached'])
+        self.assertEqual(events[1][1]['response'], first[-1][1]['response'])
+
+    def test_broken_stream_ends_with_error(self):
+        server, client = start_fake_openai(self)
+        server.break_off = True
+        with self.settings(OPENAI_MODE='real'), \
+                mock.patch('ai_tutor.services.openai_service.get_ai_client', return_value=client), \
+                self.assertLogs('ai_tutor.services', 'WARNING'):
+            events = self.stream({'message': 'Where do I start?'})
+        self.assertEqual([name for name, _ in events], ['token', 'token', 'token', 'error'])
+        self.assertFalse(ChatHistory.objects.exists())
+
+    def test_bad_requests(self):
+        post = self.client.post
+        self.assertEqual(post(self.url, '{not json', content_type='application/json').status_code, 400)
+        self.assertEqual(post(self.url, {}, content_type='application/json').status_code, 400)
+        self.assertEqual(post('/api/exercises/999999/ai/stream/', {'message': 'hi'},
+                              content_type='application/json').status_code, 404)
+
+    async def test_async_view(self):
+        response = await AsyncClient().post(f'/api/async/exercises/{self.exercise.id}/ai/stream/',
+                                            {'message': 'Where do I start?'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        events = parse_sse(b''.join([chunk async for chunk in response.streaming_content]))
+        self.assertEqual(events[-1][0], 'done')
+        self.assertEqual({name for name, _ in events[:-1]}, {'token'})
+
+    async def test_async_view_closes_the_stream_on_disconnect(self):
+        pulling, resume, closed = threading.Event(), threading.Event(), threading.Event()
+
+        def stream_tutor(exercise, session, *args):
+            def events():
+                try:
+                    yield {'event': 'token', 'text': 'Use '}
+                    pulling.set()
+                    resume.wait(5)  # the upstream is slow to send the next chunk
+                    yield {'event': 'token', 'text': 'a WHERE '}
+                finally:
+                    closed.set()
+            return events()
+
+        with mock.patch('ai_tutor.views.stream_tutor', stream_tutor):
+            response = await AsyncClient().post(f'/api/async/exercises/{self.exercise.id}/ai/stream/',
+                                                {'message': 'hi'}, content_type='application/json')
+            chunks = aiter(response.streaming_content)
+            self.assertIn(b'event: token', await anext(chunks))
+            # The ASGI handler cancels the response task when the client disconnects
+            task = asyncio.ensure_future(anext(chunks))
+            await asyncio.get_running_loop().run_in_executor(None, pulling.wait, 5)
+            task.cancel()
+            resume.set()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+        self.assertTrue(closed.is_set())
+
+    async def test_async_view_unknown_exercise(self):
+        response = await AsyncClient().post('/api/async/exercises/999999/ai/stream/', {'message': 'hi'},
+                                            content_type='application/json')
+        self.assertEqual(response.status_code, 404)
@@ -1,39 +1,164 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from exercises.models import Exercise, ChatHistory
-from ai_tutor.services.openai_service import get_ai_response
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from exercises.models import Exercise
+from exercises.services.offload import run_offloaded
+from exercises.views import parse_json_body
+import json
+import threading
+from ai_tutor.services.tutor import HISTORY_PAGE_SIZE, InvalidCursor, ask_tutor, chat_history_page, stream_tutor
 
 
 class ExerciseAIView(APIView):
     """POST /api/exercises/{id}/ai/ - Get AI help (mock or real depending on settings)"""
 
     def post(self, request, exercise_id):
-        exercise = get_object_or_404(Exercise, id=exercise_id)
+        exercise = get_object_or_404(Exercise.objects.select_related('schema'), id=exercise_id)
         message = request.data.get('message', '')
         user_query = request.data.get('user_query')
         error = request.data.get('error')
+        bypass_cache = bool(request.data.get('bypass_cache'))
 
         if not message and not user_query and not error:
             return Response({'error': 'message or user_query or error is required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Ensure session
-        session_id = request.session.session_key
-        if not session_id:
-            request.session.create()
-            session_id = request.session.session_key
-
-        # Get AI response (mock or real)
-        resp_text = get_ai_response(message or user_query or 'Help me', exercise, user_query, error)
-
-        # Persist ChatHistory
-        ChatHistory.objects.create(
-            session_id=session_id,
-            exercise=exercise,
-            message=message or user_query or '',
-            response=resp_text,
-            context={'user_query': user_query, 'error': error}
-        )
-
-        return Response({'response': resp_text})
+        return Response(ask_tutor(exercise, request.session, message, user_query, error, bypass_cache))
+
+
+class ExerciseAIHistoryView(APIView):
+    """GET /api/exercises/{id}/ai/history/?cursor=...&limit=20 - This session's chat, newest first"""
+
+    def get(self, request, exercise_id):
+        exercise = get_object_or_404(Exercise.objects.select_related('schema'), id=exercise_id)
+        try:
+            limit = int(request.query_params.get('limit', HISTORY_PAGE_SIZE))
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            page = chat_history_page(exercise, request.session.session_key, request.query_params.get('cursor'), limit)
+        except InvalidCursor as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(page)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncExerciseAIView(View):
+    """POST /api/async/exercises/{id}/ai/ - Async variant of ExerciseAIView"""
+
+    http_method_names = ['post']
+
+    @staticmethod
+    def _handle(exercise_id, session, message, user_query, error, bypass_cache):
+        exercise = get_object_or_404(Exercise.objects.select_related('schema'), id=exercise_id)
+        return ask_tutor(exercise, session, message, user_query, error, bypass_cache)
+
+    async def post(self, request, exercise_id):
+        data = parse_json_body(request)
+        if data is None:
+            return JsonResponse({'error': 'Invalid JSON body'}, status=status.HTTP_400_BAD_REQUEST)
+        message = data.get('message', '')
+        user_query = data.get('user_query')
+        error = data.get('error')
+        bypass_cache = bool(data.get('bypass_cache'))
+
+        if not message and not user_query and not error:
+            return JsonResponse({'error': 'message or user_query or error is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            payload = await run_offloaded(
+                self._handle, exercise_id, request.session, message, user_query, error, bypass_cache
+            )
+        except Http404:
+            return JsonResponse({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        return JsonResponse(payload)
+
+
+def sse_event(event: dict) -> str:
+    """Format a stream_tutor event as a server-sent event"""
+    name = event.pop('event')
+    return f"event: {name}\ndata: {json.dumps(event)}\n\n"
+
+
+def sse_response(stream) -> StreamingHttpResponse:
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # stop nginx from buffering the stream
+    return response
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class ExerciseAIStreamView(View):
+    """
+    POST /api/exercises/{id}/ai/stream/ - ExerciseAIView as server-sent events:
+    `token` events carry text chunks, then one `done` (full response) or `error` event
+    """
+
+    http_method_names = ['post']
+
+    def parse(self, request):
+        data = parse_json_body(request)
+        if data is None:
+            return None, JsonResponse({'error': 'Invalid JSON body'}, status=status.HTTP_400_BAD_REQUEST)
+        args = (data.get('message', ''), data.get('user_query'), data.get('error'), bool(data.get('bypass_cache')))
+        if not any(args[:3]):
+            return None, JsonResponse({'error': 'message or user_query or error is required'}, status=status.HTTP_400_BAD_REQUEST)
+        return args, None
+
+    def post(self, request, exercise_id):
+        args, error_response = self.parse(request)
+        if error_response:
+            return error_response
+        exercise = get_object_or_404(Exercise.objects.select_related('schema'), id=exercise_id)
+        events = stream_tutor(exercise, request.session, *args)
+        return sse_response(sse_event(event) for event in events)
+
+
+class AsyncExerciseAIStreamView(ExerciseAIStreamView):
+    """
+    POST /api/async/exercises/{id}/ai/stream/ - Async variant of ExerciseAIStreamView.
+    Under ASGI a synchronous stream would be buffered whole, so each chunk is pulled on the offload pool.
+    """
+
+    @staticmethod
+    def _start(exercise_id, session, args):
+        exercise = get_object_or_404(Exercise.objects.select_related('schema'), id=exercise_id)
+        return stream_tutor(exercise, session, *args)
+
+    async def post(self, request, exercise_id):
+        args, error_response = self.parse(request)
+        if error_response:
+            return error_response
+        try:
+            events = await run_offloaded(self._start, exercise_id, request.session, args)
+        except Http404:
+            return JsonResponse({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+        # A chunk still being pulled when the client disconnects must finish before the generator can close
+        lock = threading.Lock()
+
+        def pull():
+            with lock:
+                return next(events, None)
+
+        def close():
+            with lock:
+                events.close()
+
+        async def stream():
+            try:
+                while True:
+                    event = await run_offloaded(pull)
+                    if event is None:
+                        break
+                    yield sse_event(event)
+            finally:
+                # Also on disconnect (cancellation): free the AI call slot and the upstream stream now
+                await run_offloaded(close)
+
+        return sse_response(stream())
@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react'
-import { getExercises } from '../services/api'
-import type { Exercise as Ex } from '../types'
+import { getCatalog } from '../services/api'
+import type { CatalogExercise as Ex } from '../types'
 
 interface Props {
   selectedId: number | null
@@ -19,8 +19,8 @@ export default function ProblemList({ selectedId, onSelect, demoMode }: Props) {
   async function loadExercises() {
     try {
       setIsLoading(true)
-      const ex = await getExercises(demoMode)
-      setExercises(ex)
+      const catalog = await getCatalog(demoMode)
+      setExercises(catalog.exercises)
     } catch (e) {
       console.error(e)
     } finally {
@@ -59,7 +59,7 @@ export default function ProblemList({ selectedId, onSelect, demoMode }: Props) {
               {ex.difficulty}
             </span>
           </div>
-          <div className="text-sm text-gray-600 ml-7">{ex.schema.display_name}</div>
+          <div className="text-sm text-gray-600 ml-7">{ex.schema}</div>
         </div>
       ))}
     </div>
@@ -1,11 +1,38 @@
-import React from 'react'
+import React, { useEffect, useState } from 'react'
 import type { QueryResult, SubmitResult } from '../types'
+import { getResultPage } from '../services/api'
 
 interface Props { queryResult: QueryResult | null; submitResult: SubmitResult | null }
 
 export default function ResultPanel({ queryResult, submitResult }: Props){
+  const [rows, setRows] = useState<any[][]>([])
+  const [loadingMore, setLoadingMore] = useState(false)
+  const [pageError, setPageError] = useState<string | null>(null)
+
+  useEffect(() => {
+    setRows(queryResult?.rows ?? [])
+    setPageError(null)
+  }, [queryResult])
+
+  const loadMore = async () => {
+    if(!queryResult?.result_handle) return
+    setLoadingMore(true)
+    try {
+      const page = await getResultPage(queryResult.result_handle, rows.length, queryResult.page_size)
+      setRows(prev => [...prev, ...page.rows])
+    } catch (e) {
+      setPageError('These results have expired. Run the query again to see more rows.')
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
   if(!queryResult && !submitResult) return <div className="p-6 text-gray-500">Run your query to see results</div>
 
+  // A truncated result's spill holds total_estimate rows, more than the response's row_count
+  const available = queryResult?.total_estimate ?? queryResult?.row_count ?? 0
+  const hasMore = !!queryResult?.result_handle && rows.length < available
+
   return (
     <div className="p-4">
       {submitResult && (
@@ -20,10 +47,22 @@ export default function ResultPanel({ queryResult, submitResult }: Props){
             <pre className="text-red-600">{queryResult.error}</pre>
           ) : (
             <div className="overflow-x-auto">
+              {queryResult.truncated && (
+                <div className="p-2 mb-2 rounded-xl bg-yellow-100 text-sm text-gray-900">
+                  The query returned more than {queryResult.row_count} rows
+                  {queryResult.total_estimate ? ` (${queryResult.total_is_lower_bound ? 'at least ' : ''}${queryResult.total_estimate})` : ''}. Add a LIMIT or WHERE clause to narrow the result.
+                </div>
+              )}
               <table className="w-full table-auto text-sm">
                 <thead><tr>{queryResult.columns.map((c,i)=><th key={i} className="px-2 py-1 text-left">{c}</th>)}</tr></thead>
-                <tbody>{queryResult.rows.map((r,ri)=>(<tr key={ri}>{r.map((c,ci)=><td key={ci} className="px-2 py-1">{String(c)}</td>)}</tr>))}</tbody>
+                <tbody>{rows.map((r,ri)=>(<tr key={ri}>{r.map((c,ci)=><td key={ci} className="px-2 py-1">{String(c)}</td>)}</tr>))}</tbody>
               </table>
+              {hasMore && !pageError && (
+                <button className="mt-2 px-3 py-1 rounded-xl bg-gray-100 text-sm" onClick={loadMore} disabled={loadingMore}>
+                  {loadingMore ? 'Loading...' : `Show more (${rows.length} of ${available})`}
+                </button>
+              )}
+              {pageError && <div className="mt-2 text-sm text-red-600">{pageError}</div>}
             </div>
           )}
         </div>
@@ -1,5 +1,5 @@
 import axios from 'axios'
-import type { DatabaseSchema, Exercise, QueryResult, SubmitResult, AIResponse } from '../types'
+import type { Catalog, ChatHistoryPage, ColumnarQueryResult, DatabaseSchema, Exercise, QueryResult, ResultPage, SubmitResult, AIResponse } from '../types'
 
 const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || 'http://localhost:8000/api'
 
@@ -47,6 +47,13 @@ const mockExercises: Exercise[] = [
   }
 ]
 
+const mockCatalog: Catalog = {
+  schemas: mockSchemas,
+  exercises: mockExercises.map(e => ({
+    id: e.id, title: e.title, difficulty: e.difficulty, schema_id: e.schema.id, schema: e.schema.display_name, tags: e.tags
+  }))
+}
+
 const mockQueryResult: QueryResult = {
   success: true,
   columns: ['id', 'name', 'dept'],
@@ -88,6 +95,14 @@ export const getExercises = async (useMock = false, params?: any): Promise<Exerc
   }, mockExercises, useMock)
 }
 
+// Schemas and the exercise list in one round trip; the browser revalidates it with the ETag
+export const getCatalog = async (useMock = false): Promise<Catalog> => {
+  return tryApi(async () => {
+    const r = await api.get('/catalog/')
+    return r.data
+  }, mockCatalog, useMock)
+}
+
 export const getExercise = async (id: number, useMock = false): Promise<Exercise> => {
   return tryApi(async () => {
     const r = await api.get(`/exercises/${id}/`)
@@ -102,6 +117,18 @@ export const executeQuery = async (exerciseId: number, query: string, useMock =
   }, { ...mockQueryResult, rows: mockQueryResult.rows }, useMock)
 }
 
+// One array per column; `truncated` still flags a cut-off result, `truncated_values` lists shortened values
+export const executeQueryColumnar = async (exerciseId: number, query: string): Promise<ColumnarQueryResult> => {
+  const r = await api.post(`/exercises/${exerciseId}/execute/`, { query, result_format: 'columnar' })
+  return r.data
+}
+
+// Later pages of an execute result that came back with a result_handle
+export const getResultPage = async (handle: string, offset: number, limit = 100): Promise<ResultPage> => {
+  const r = await api.get(`/results/${handle}/`, { params: { offset, limit } })
+  return r.data
+}
+
 export const submitQuery = async (exerciseId: number, query: string, useMock = false): Promise<SubmitResult> => {
   return tryApi(async () => {
     const r = await api.post(`/exercises/${exerciseId}/submit/`, { query })
@@ -116,4 +143,48 @@ export const getAIResponse = async (exerciseId: number, message: string, userQue
   }, mockAIResponse, useMock)
 }
 
+// Server-sent events: onToken gets each text chunk as it arrives; resolves with the full response
+export const streamAIResponse = async (
+  exerciseId: number, message: string, onToken: (text: string) => void, userQuery?: string, error?: string, useMock = false
+): Promise<AIResponse> => {
+  if (useMock) {
+    onToken(mockAIResponse.response)
+    return mockAIResponse
+  }
+  const r = await fetch(`${API_BASE_URL}/exercises/${exerciseId}/ai/stream/`, {
+    method: 'POST',
+    credentials: 'include',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ message, user_query: userQuery, error }),
+  })
+  if (!r.ok || !r.body) throw new Error(`AI stream failed (${r.status})`)
+  const reader = r.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  for (;;) {
+    const { value, done } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+    let end
+    while ((end = buffer.indexOf('\n\n')) >= 0) {
+      const block = buffer.slice(0, end)
+      buffer = buffer.slice(end + 2)
+      const event = block.match(/^event: (.*)$/m)?.[1]
+      const data = JSON.parse(block.match(/^data: (.*)$/m)?.[1] || '{}')
+      if (event === 'token') onToken(data.text)
+      else if (event === 'done') return { response: data.response, cached: data.cached }
+      else if (event === 'error') throw new Error(data.error)
+    }
+  }
+  throw new Error('AI stream ended unexpectedly')
+}
+
+// Newest first; pass the previous page's next_cursor to load older messages
+export const getChatHistory = async (exerciseId: number, cursor?: string | null, useMock = false): Promise<ChatHistoryPage> => {
+  return tryApi(async () => {
+    const r = await api.get(`/exercises/${exerciseId}/ai/history/`, { params: cursor ? { cursor } : undefined })
+    return r.data
+  }, { results: [], next_cursor: null }, useMock)
+}
+
 export default api
\ No newline at end of file
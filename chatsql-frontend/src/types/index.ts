@@ -1,7 +1,13 @@
 export interface DatabaseSchema { id: number; name: string; display_name: string; description: string; exercise_count: number }
 export interface Hint { level: number; text: string }
 export interface Exercise { id: number; title: string; description: string; difficulty: 'easy'|'medium'|'hard'; initial_query: string; hints: Hint[]; schema: { id:number; name:string; display_name:string; db_name:string }; tags: string[]; completed?: boolean }
-export interface QueryResult { success: boolean; columns: string[]; rows: any[][]; row_count: number; execution_time: number; error?: string }
+export interface QueryResult { success: boolean; columns: string[]; rows: any[][]; row_count: number; execution_time: number; cached?: boolean; truncated?: boolean; total_estimate?: number | null; total_is_lower_bound?: boolean; result_handle?: string; page_size?: number; error?: string }
+export interface ResultPage { columns: string[]; rows: any[][]; row_count: number; total_is_lower_bound: boolean; offset: number; has_more: boolean; result_handle: string }
 export interface SubmitResult { correct: boolean; message: string; user_result: QueryResult; diff?: any }
 export interface ChatMessage { id: string; message: string; response: string; timestamp: string; isUser: boolean }
-export interface AIResponse { response: string }
+export interface AIResponse { response: string; cached?: boolean }
+export interface CatalogExercise { id: number; title: string; difficulty: 'easy'|'medium'|'hard'; schema_id: number; schema: string; tags: string[] }
+export interface Catalog { schemas: DatabaseSchema[]; exercises: CatalogExercise[] }
+export interface ChatHistoryEntry { id: number; message: string; response: string; context: { user_query?: string; error?: string }; created_at: string }
+export interface ChatHistoryPage { results: ChatHistoryEntry[]; next_cursor: string | null }
+export interface ColumnarQueryResult extends Omit<QueryResult, 'rows'> { format: 'columnar'; types: string[]; data: any[][]; truncated_values: [number, number, number][] }
@@ -0,0 +1,194 @@
+"""
+In-process request metrics.
+
+PerformanceMiddleware starts a RequestMetrics for every request and keeps it in a context
+variable, so code anywhere below the view (executor, AI client, caches) can record into it
+with timed() and cache_lookup(). When the request ends its numbers go out in the
+Server-Timing header and are folded into per-view histograms, which /metrics renders in the
+Prometheus text format. Everything is per process: scrape each worker.
+"""
+import contextvars
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# Seconds; roughly log-spaced from 1ms to 30s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_current: contextvars.ContextVar[Optional['RequestMetrics']] = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Timings and counters for one request; safe to update from the request's helper threads"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.durations = defaultdict(float)  # component -> seconds
+        self.counts = defaultdict(int)       # component -> number of calls
+        self.cache = []                      # (cache name, hit)
+        self._lock = threading.Lock()
+
+    def add(self, component: str, seconds: float, calls: int = 1):
+        with self._lock:
+            self.durations[component] += seconds
+            self.counts[component] += calls
+
+    def add_cache(self, name: str, hit: bool):
+        with self._lock:
+            self.cache.append((name, hit))
+
+    def server_timing(self, total: float) -> str:
+        """Server-Timing header value, e.g. `total;dur=12.5, db;dur=1.2;desc="3 calls", cache;desc="catalog hit"`"""
+        entries = [f'total;dur={total * 1000:.1f}']
+        with self._lock:
+            for component, seconds in self.durations.items():
+                calls = self.counts[component]
+                entries.append(f'{component};dur={seconds * 1000:.1f};desc="{calls} call{"s" if calls != 1 else ""}"')
+            if self.cache:
+                lookups = ', '.join(f'{name} {"hit" if hit else "miss"}' for name, hit in self.cache)
+                entries.append(f'cache;desc="{lookups}"')
+        return ', '.join(entries)
+
+
+def current() -> Optional[RequestMetrics]:
+    return _current.get()
+
+
+def start_request() -> contextvars.Token:
+    return _current.set(RequestMetrics())
+
+
+def end_request(token: contextvars.Token):
+    _current.reset(token)
+
+
+@contextmanager
+def timed(component: str):
+    """Add the block's wall time to the current request's `component` total (no-op outside a request)"""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add(component, time.perf_counter() - start)
+
+
+def cache_lookup(name: str, hit: bool):
+    """Record a cache hit or miss, globally and on the current request"""
+    registry.count_cache(name, hit)
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.add_cache(name, hit)
+
+
+def record_query(execute, sql, params, many, context):
+    """Django execute_wrapper counting ORM queries and their time into the current request"""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add('db', time.perf_counter() - start)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str):
+        cumulative = 0
+        for bound, n in zip(self.buckets, self.counts):
+            cumulative += n
+            yield f'{name}_bucket{{{labels},le="{bound:g}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f'{name}_sum{{{labels}}} {self.sum:.6f}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Registry:
+    """Per-view histograms and counters aggregated from finished requests"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clear()
+
+    def reset(self):
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        self.durations = defaultdict(Histogram)  # (component, view) -> Histogram
+        self.calls = defaultdict(int)            # (component, view) -> calls
+        self.requests = defaultdict(int)         # (view, status) -> requests
+        self.cache = defaultdict(int)            # (cache, 'hit' | 'miss') -> lookups
+
+    def observe_request(self, view: str, status: int, total: float, metrics: RequestMetrics):
+        with self._lock:
+            self.requests[(view, status)] += 1
+            self.durations[('request', view)].observe(total)
+            for component, seconds in metrics.durations.items():
+                self.durations[(component, view)].observe(seconds)
+                self.calls[(component, view)] += metrics.counts[component]
+
+    def count_cache(self, name: str, hit: bool):
+        with self._lock:
+            self.cache[(name, 'hit' if hit else 'miss')] += 1
+
+    def render(self, gauges: Dict[str, Dict[str, float]] = None) -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            lines += ['# HELP chatsql_requests_total Finished requests by view and status',
+                      '# TYPE chatsql_requests_total counter']
+            for (view, status), n in sorted(self.requests.items()):
+                lines.append(f'chatsql_requests_total{{view="{_escape(view)}",status="{status}"}} {n}')
+
+            components = sorted({component for component, _ in self.durations})
+            for component in components:
+                name = f'chatsql_{component}_seconds'
+                what = 'Request wall time' if component == 'request' else f'Time per request spent in {component}'
+                lines += [f'# HELP {name} {what}', f'# TYPE {name} histogram']
+                for (comp, view), hist in sorted(self.durations.items()):
+                    if comp == component:
+                        lines.extend(hist.render(name, f'view="{_escape(view)}"'))
+
+            lines += ['# HELP chatsql_calls_total Calls per component (ORM queries, practice queries, AI calls)',
+                      '# TYPE chatsql_calls_total counter']
+            for (component, view), n in sorted(self.calls.items()):
+                lines.append(f'chatsql_calls_total{{component="{component}",view="{_escape(view)}"}} {n}')
+
+            lines += ['# HELP chatsql_cache_lookups_total Cache lookups by cache and result',
+                      '# TYPE chatsql_cache_lookups_total counter']
+            for (name, result), n in sorted(self.cache.items()):
+                lines.append(f'chatsql_cache_lookups_total{{cache="{name}",result="{result}"}} {n}')
+
+        for name, values in (gauges or {}).items():
+            lines += [f'# TYPE {name} gauge']
+            for labels, value in values.items():
+                lines.append(f'{name}{{{labels}}} {value}' if labels else f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
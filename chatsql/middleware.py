@@ -0,0 +1,144 @@
+import time
+from typing import Optional
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+from chatsql import metrics
+
+try:
+    import brotli
+except ImportError:  # optional: pip install brotli
+    brotli = None
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    """Count every ORM query, on any thread, into the request that caused it"""
+    if metrics.record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(metrics.record_query)
+
+
+class PerformanceMiddleware:
+    """
+    Times every request and what it spent in the ORM, practice databases, AI calls and caches
+    (see chatsql.metrics). Adds a Server-Timing header and feeds the /metrics histograms,
+    labelled by URL name (execute-query, submit-query, exercise-ai, ...).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Connections opened before the middleware loaded never saw connection_created
+        for connection in connections.all(initialized_only=True):
+            instrument_connection(None, connection)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = metrics.start_request()
+        try:
+            response = self.get_response(request)
+            self._finish(request, response, metrics.current())
+        finally:
+            metrics.end_request(token)
+        return response
+
+    async def __acall__(self, request):
+        token = metrics.start_request()
+        try:
+            response = await self.get_response(request)
+            self._finish(request, response, metrics.current())
+        finally:
+            metrics.end_request(token)
+        return response
+
+    @staticmethod
+    def _finish(request, response, request_metrics):
+        total = time.perf_counter() - request_metrics.start
+        match = getattr(request, 'resolver_match', None)
+        view = (match.url_name or match.view_name) if match else 'unmatched'
+        if view != 'metrics':
+            metrics.registry.observe_request(view, response.status_code, total, request_metrics)
+        response['Server-Timing'] = request_metrics.server_timing(total)
+
+
+def accepted_encoding(header: str) -> Optional[str]:
+    """'br' or 'gzip', whichever the Accept-Encoding header allows (br preferred, q=0 excluded)"""
+    accepted = set()
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        q = params.strip()
+        if q.startswith('q='):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip().lower())
+    if brotli is not None and ('br' in accepted or '*' in accepted):
+        return 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return None
+
+
+class CompressionMiddleware:
+    """
+    Compresses JSON API responses with brotli (when the package is installed) or gzip, as the
+    client's Accept-Encoding allows. Large query results shrink several times over.
+    Streaming responses (server-sent events) and bodies under RESPONSE_COMPRESSION_MIN_SIZE bytes
+    are sent as is.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self._compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self._compress(request, await self.get_response(request))
+
+    @staticmethod
+    def _compress(request, response):
+        if (not getattr(settings, 'RESPONSE_COMPRESSION', True) or response.streaming
+                or response.has_header('Content-Encoding')
+                or not response.get('Content-Type', '').startswith('application/json')
+                or len(response.content) < getattr(settings, 'RESPONSE_COMPRESSION_MIN_SIZE', 1024)):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = accepted_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+        if encoding == 'br':
+            compressed = brotli.compress(response.content, quality=getattr(settings, 'RESPONSE_BROTLI_QUALITY', 5))
+        else:
+            # Random padding mitigates BREACH, as in django.middleware.gzip.GZipMiddleware
+            compressed = compress_string(response.content, max_random_bytes=100)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response.headers['Content-Length'] = str(len(compressed))
+        response.headers['Content-Encoding'] = encoding
+        # The bytes changed, so a strong validator no longer applies
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        return response
@@ -1,5 +1,6 @@
 import os
 from pathlib import Path
+import django
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -29,6 +30,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'chatsql.middleware.PerformanceMiddleware',
+    'chatsql.middleware.CompressionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -41,6 +44,18 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'chatsql.urls'
 
+# Compress JSON responses of at least RESPONSE_COMPRESSION_MIN_SIZE bytes with gzip, or brotli
+# when the optional `brotli` package is installed and the client accepts it
+RESPONSE_COMPRESSION = os.getenv('RESPONSE_COMPRESSION', 'True') == 'True'
+RESPONSE_COMPRESSION_MIN_SIZE = int(os.getenv('RESPONSE_COMPRESSION_MIN_SIZE', '1024'))
+
+# Expose per-view latency histograms at /metrics (Prometheus text format). Off by default;
+# when on, only staff users, clients sending `Authorization: Bearer <METRICS_TOKEN>` and
+# addresses in METRICS_ALLOWED_IPS (comma-separated) may read it
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'False') == 'True'
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.getenv('METRICS_ALLOWED_IPS', '').split(',') if ip.strip()]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -109,9 +124,134 @@ else:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            # Concurrent writers (async endpoints, threaded servers) wait for the write
+            # lock instead of failing with "database is locked" on lock upgrade
+            'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 20} if django.VERSION >= (5, 1) else {'timeout': 20},
         }
     }
 
+# Cache used for expected results and other derived data. Use a shared backend
+# (e.g. Redis or Memcached) in production so warm-up commands benefit all workers.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    },
+    # AI tutor answers: expire after TIMEOUT, least recently used culled past MAX_ENTRIES
+    'ai_responses': {
+        'BACKEND': os.getenv('AI_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('AI_CACHE_LOCATION', 'ai-responses'),
+        'TIMEOUT': int(os.getenv('AI_CACHE_TIMEOUT', str(60 * 60 * 24))),
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('AI_CACHE_MAX_ENTRIES', '5000'))},
+    },
+}
+
+# Shared AI client for real mode (see ai_tutor.services.client.AIClient). BASE_URL points it
+# at any OpenAI-compatible server; while the circuit is open students get canned hints.
+AI_CLIENT = {
+    'BASE_URL': os.getenv('OPENAI_BASE_URL') or None,
+    'MODEL': os.getenv('OPENAI_MODEL', 'gpt-4o-mini'),
+    'TIMEOUT': float(os.getenv('AI_TIMEOUT', '15')),
+    'CONNECT_TIMEOUT': float(os.getenv('AI_CONNECT_TIMEOUT', '3')),
+    'MAX_RETRIES': int(os.getenv('AI_MAX_RETRIES', '2')),
+    'MAX_CONCURRENT': int(os.getenv('AI_MAX_CONCURRENT', '8')),
+    'BREAKER_THRESHOLD': int(os.getenv('AI_BREAKER_THRESHOLD', '5')),
+    'BREAKER_RESET': float(os.getenv('AI_BREAKER_RESET', '30')),
+}
+
+# Tutor prompts carry the exercise, a schema summary, the expected result columns and the
+# last AI_PROMPT_HISTORY_TURNS exchanges, trimmed to about AI_PROMPT_TOKEN_BUDGET tokens
+AI_PROMPT_TOKEN_BUDGET = int(os.getenv('AI_PROMPT_TOKEN_BUDGET', '1200'))
+AI_PROMPT_HISTORY_TURNS = int(os.getenv('AI_PROMPT_HISTORY_TURNS', '3'))
+
+# Mock mode streams its canned answer AI_MOCK_STREAM_CHUNK_WORDS words at a time,
+# AI_MOCK_STREAM_DELAY seconds apart, to simulate model time-to-first-token offline
+AI_MOCK_STREAM_DELAY = float(os.getenv('AI_MOCK_STREAM_DELAY', '0.05'))
+AI_MOCK_STREAM_CHUNK_WORDS = int(os.getenv('AI_MOCK_STREAM_CHUNK_WORDS', '3'))
+
+# Reuse tutor answers for equivalent (exercise, message, query, error) questions
+AI_RESPONSE_CACHE_ENABLED = os.getenv('AI_RESPONSE_CACHE_ENABLED', 'True') == 'True'
+
+# Seconds to keep cached expected_sql results (entries are also invalidated on save)
+EXPECTED_RESULT_CACHE_TIMEOUT = int(os.getenv('EXPECTED_RESULT_CACHE_TIMEOUT', str(60 * 60 * 24)))
+
+# Seconds to keep the schema/exercise catalog (a new version is started on every save)
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', str(60 * 60)))
+
+# Seconds to keep a session's cached completed exercises and attempt counts
+PROGRESS_CACHE_TIMEOUT = int(os.getenv('PROGRESS_CACHE_TIMEOUT', str(60 * 60 * 24)))
+
+# Attempt tracking (and other write-behind buffers) is flushed in bulk from a background thread
+# every WRITE_BEHIND_INTERVAL seconds, or once WRITE_BEHIND_MAX_PENDING entries are waiting.
+# Set WRITE_BEHIND_ENABLED=False to write synchronously.
+WRITE_BEHIND_ENABLED = os.getenv('WRITE_BEHIND_ENABLED', 'True') == 'True'
+WRITE_BEHIND_INTERVAL = float(os.getenv('WRITE_BEHIND_INTERVAL', '1.0'))
+WRITE_BEHIND_MAX_PENDING = int(os.getenv('WRITE_BEHIND_MAX_PENDING', '1000'))
+
+# Worker threads used by the async (ASGI) endpoints to run blocking DB and AI calls
+ASYNC_OFFLOAD_WORKERS = int(os.getenv('ASYNC_OFFLOAD_WORKERS', '32'))
+
+# Worker threads used to run the reference query alongside the user query on submit
+PARALLEL_QUERY_WORKERS = int(os.getenv('PARALLEL_QUERY_WORKERS', '16'))
+
+# Connection pool for the practice databases used by SQLExecutor (one pool per alias)
+PRACTICE_DB_POOL = {
+    'MAX_SIZE': int(os.getenv('PRACTICE_DB_POOL_SIZE', '10')),
+    'MAX_IDLE_TIME': int(os.getenv('PRACTICE_DB_POOL_MAX_IDLE', '300')),
+    'WAIT_TIMEOUT': float(os.getenv('PRACTICE_DB_POOL_WAIT', '3')),
+    'HEALTH_CHECK_AFTER': int(os.getenv('PRACTICE_DB_POOL_HEALTH_CHECK_AFTER', '30')),
+}
+
+# Without a practice DB alias, run student queries in per-thread in-memory SQLite copies
+# of each DatabaseSchema instead of on the default database
+PRACTICE_SQLITE_SANDBOX = os.getenv('PRACTICE_SQLITE_SANDBOX', 'True') == 'True'
+
+# Explicit executor backend per DatabaseSchema.db_name (see exercises.services.backends).
+# Entries without one use MySQL for MySQL aliases, else the in-memory sandbox. Example:
+#   'practice_hr': {'BACKEND': 'sqlite-file', 'PATH': BASE_DIR / 'practice_hr.sqlite3'},
+#   'practice_school': {'BACKEND': 'mock', 'LATENCY': 0.01},
+PRACTICE_DB_BACKENDS = {}
+
+# generate_dataset writes SQLite practice databases here as <db_name>.sqlite3; student
+# queries for a db_name with such a file run on it (read-only) instead of a sandbox
+PRACTICE_DATA_DIR = os.getenv('PRACTICE_DATA_DIR', str(BASE_DIR / 'practice_data'))
+
+# Resource governor for student queries (see exercises.services.executor.QueryGovernor)
+PRACTICE_QUERY_LIMITS = {
+    'STATEMENT_TIMEOUT': int(os.getenv('PRACTICE_QUERY_TIMEOUT', '5')),
+    'MAX_JOIN_SIZE': int(os.getenv('PRACTICE_QUERY_MAX_JOIN_SIZE', '1000000')),
+    'MAX_CONCURRENT_PER_SESSION': int(os.getenv('PRACTICE_QUERY_MAX_CONCURRENT_PER_SESSION', '2')),
+    'SQLITE_MAX_STEPS': int(os.getenv('PRACTICE_QUERY_SQLITE_MAX_STEPS', '50000000')),
+}
+
+# In-process LRU of practice query results keyed by database, schema version and canonical
+# query text, bounded by the total size of the cached results
+QUERY_RESULT_CACHE_ENABLED = os.getenv('QUERY_RESULT_CACHE_ENABLED', 'True') == 'True'
+QUERY_RESULT_CACHE_MAX_BYTES = int(os.getenv('QUERY_RESULT_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+QUERY_RESULT_CACHE_MAX_ENTRY_BYTES = int(os.getenv('QUERY_RESULT_CACHE_MAX_ENTRY_BYTES', str(1024 * 1024)))
+QUERY_RESULT_CACHE_TIMEOUT = int(os.getenv('QUERY_RESULT_CACHE_TIMEOUT', '3600'))
+
+# Text values longer than this are cut in the opt-in columnar result format
+# (the response lists their full lengths); 0 keeps them whole
+RESULT_MAX_VALUE_LENGTH = int(os.getenv('RESULT_MAX_VALUE_LENGTH', '1000'))
+
+# Execute returns the first RESULT_PAGE_SIZE rows (or ?page_size=) and spills the rest of the
+# result to a JSON-lines file in RESULT_SPILL_DIR, served by /api/results/<handle>/ for
+# RESULT_SPILL_TTL seconds. Spill files are capped at RESULT_SPILL_MAX_BYTES in total.
+# Responses hold at most SQLExecutor.MAX_ROWS rows; the spill keeps reading a longer result
+# up to RESULT_SPILL_MAX_ROWS rows (or RESULT_SPILL_MAX_ENTRY_BYTES).
+RESULT_PAGE_SIZE = int(os.getenv('RESULT_PAGE_SIZE', '100'))
+RESULT_SPILL_DIR = os.getenv('RESULT_SPILL_DIR') or None
+RESULT_SPILL_TTL = int(os.getenv('RESULT_SPILL_TTL', '600'))
+RESULT_SPILL_MAX_BYTES = int(os.getenv('RESULT_SPILL_MAX_BYTES', str(256 * 1024 * 1024)))
+RESULT_SPILL_MAX_ENTRY_BYTES = int(os.getenv('RESULT_SPILL_MAX_ENTRY_BYTES', str(16 * 1024 * 1024)))
+RESULT_SPILL_MAX_ROWS = int(os.getenv('RESULT_SPILL_MAX_ROWS', '100000'))
+
+# Practice queries slower than this many seconds go to the SlowQuery log (0 disables it);
+# their EXPLAIN plan is captured too unless SLOW_QUERY_EXPLAIN is False
+SLOW_QUERY_THRESHOLD = float(os.getenv('SLOW_QUERY_THRESHOLD', '0.5'))
+SLOW_QUERY_EXPLAIN = os.getenv('SLOW_QUERY_EXPLAIN', 'True') == 'True'
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
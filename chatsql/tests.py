@@ -0,0 +1,52 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+
+@override_settings(METRICS_ENABLED=True, METRICS_TOKEN='s3cret', METRICS_ALLOWED_IPS=[])
+class MetricsViewTests(TestCase):
+    """/metrics is off by default and, when on, only readable by staff, the token or allowed addresses"""
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, **extra):
+        return self.client.get('/metrics', **extra)
+
+    def test_disabled_by_default(self):
+        with self.settings(METRICS_ENABLED=False):
+            self.assertEqual(self.get(HTTP_AUTHORIZATION='Bearer s3cret').status_code, 404)
+
+    def test_anonymous_clients_are_refused(self):
+        for header in ('', 'Bearer wrong', 'Bearer ', 's3cret', 'Basic s3cret'):
+            with self.subTest(header=header):
+                self.assertEqual(self.get(HTTP_AUTHORIZATION=header).status_code, 403)
+
+    def test_empty_token_never_matches(self):
+        with self.settings(METRICS_TOKEN=''):
+            self.assertEqual(self.get(HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+
+    def test_token(self):
+        self.client.get('/api/catalog/')
+        response = self.get(HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn('view="catalog"', response.content.decode())
+
+    def test_allowed_ips(self):
+        with self.settings(METRICS_ALLOWED_IPS=['10.0.0.5']):
+            self.assertEqual(self.get(REMOTE_ADDR='10.0.0.5').status_code, 200)
+            self.assertEqual(self.get(REMOTE_ADDR='10.0.0.6').status_code, 403)
+
+    def test_staff_only(self):
+        user = User.objects.create_user('student', password='pw')
+        self.client.force_login(user)
+        self.assertEqual(self.get().status_code, 403)
+        user.is_staff = True
+        user.save()
+        self.assertEqual(self.get().status_code, 200)
+
+    def test_server_timing_is_always_sent(self):
+        with self.settings(METRICS_ENABLED=False):
+            response = self.client.get('/api/catalog/')
+        self.assertIn('total;dur=', response['Server-Timing'])
@@ -3,21 +3,41 @@ from django.urls import path, include
 from exercises.views import (
     SchemaListView,
     ExerciseListView,
+    CatalogView,
     ExerciseDetailView,
     ExecuteQueryView,
-    SubmitQueryView
+    SubmitQueryView,
+    ResultPageView,
+    AsyncExecuteQueryView,
+    AsyncSubmitQueryView
+)
+from ai_tutor.views import (
+    ExerciseAIView,
+    ExerciseAIHistoryView,
+    ExerciseAIStreamView,
+    AsyncExerciseAIView,
+    AsyncExerciseAIStreamView,
 )
-from ai_tutor.views import ExerciseAIView
 from frontend.views import IndexView
+from chatsql.views import MetricsView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', MetricsView.as_view(), name='metrics'),
     path('api/schemas/', SchemaListView.as_view(), name='schema-list'),
     path('api/exercises/', ExerciseListView.as_view(), name='exercise-list'),
+    path('api/catalog/', CatalogView.as_view(), name='catalog'),
     path('api/exercises/<int:exercise_id>/', ExerciseDetailView.as_view(), name='exercise-detail'),
     path('api/exercises/<int:exercise_id>/execute/', ExecuteQueryView.as_view(), name='execute-query'),
     path('api/exercises/<int:exercise_id>/submit/', SubmitQueryView.as_view(), name='submit-query'),
+    path('api/results/<str:handle>/', ResultPageView.as_view(), name='result-page'),
     path('api/exercises/<int:exercise_id>/ai/', ExerciseAIView.as_view(), name='exercise-ai'),
+    path('api/exercises/<int:exercise_id>/ai/stream/', ExerciseAIStreamView.as_view(), name='exercise-ai-stream'),
+    path('api/exercises/<int:exercise_id>/ai/history/', ExerciseAIHistoryView.as_view(), name='exercise-ai-history'),
+    path('api/async/exercises/<int:exercise_id>/execute/', AsyncExecuteQueryView.as_view(), name='execute-query-async'),
+    path('api/async/exercises/<int:exercise_id>/submit/', AsyncSubmitQueryView.as_view(), name='submit-query-async'),
+    path('api/async/exercises/<int:exercise_id>/ai/', AsyncExerciseAIView.as_view(), name='exercise-ai-async'),
+    path('api/async/exercises/<int:exercise_id>/ai/stream/', AsyncExerciseAIStreamView.as_view(), name='exercise-ai-stream-async'),
     path('', IndexView.as_view(), name='index'),
     path('api/auth/', include('accounts.urls')),
     path('', include('frontend.urls')),
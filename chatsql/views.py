@@ -0,0 +1,56 @@
+import hmac
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.views import View
+
+from ai_tutor.services.client import ai_client_metrics
+from ai_tutor.services.response_cache import response_cache_stats
+from exercises.services.pool import pool_metrics
+from exercises.services.query_cache import get_query_cache
+from exercises.services.write_behind import pending_writes
+from chatsql.metrics import registry
+
+
+def metrics_allowed(request) -> bool:
+    """Staff users, the METRICS_TOKEN bearer token or a METRICS_ALLOWED_IPS address"""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_active and user.is_staff:
+        return True
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    header = request.headers.get('Authorization', '')
+    if token and header.startswith('Bearer ') and hmac.compare_digest(header[7:].strip(), token):
+        return True
+    return request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', [])
+
+
+class MetricsView(View):
+    """GET /metrics - Prometheus text format: per-view latency histograms, cache and pool gauges"""
+
+    http_method_names = ['get']
+
+    def get(self, request):
+        if not getattr(settings, 'METRICS_ENABLED', False):
+            raise Http404
+        if not metrics_allowed(request):
+            return HttpResponseForbidden()
+        gauges = {
+            'chatsql_write_behind_pending': {f'writer="{name}"': n for name, n in pending_writes().items()},
+            'chatsql_ai_response_cache': {
+                f'stat="{key}"': value for key, value in response_cache_stats().items() if value is not None
+            },
+        }
+        gauges['chatsql_query_result_cache'] = {
+            f'stat="{key}"': value for key, value in get_query_cache().stats().items() if value is not None
+        }
+        for alias, pool in pool_metrics().items():
+            for key, value in pool.items():
+                if isinstance(value, (int, float)):
+                    gauges.setdefault('chatsql_practice_pool', {})[f'alias="{alias}",stat="{key}"'] = value
+        client = ai_client_metrics()
+        if client:
+            gauges['chatsql_ai_client'] = {
+                f'stat="{key}"': value for key, value in client.items() if isinstance(value, (int, float))
+            }
+            gauges['chatsql_ai_circuit_open'] = {'': int(client['circuit'] != 'closed')}
+        return HttpResponse(registry.render(gauges), content_type='text/plain; version=0.0.4; charset=utf-8')
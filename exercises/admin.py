@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import DatabaseSchema, Exercise, UserProgress, ChatHistory
+from django.db.models import Avg, Count, Max, OuterRef, Subquery, Sum
+from .models import DatabaseSchema, Exercise, UserProgress, ChatHistory, SlowQuery, SlowQueryFingerprint
 
 @admin.register(DatabaseSchema)
 class DatabaseSchemaAdmin(admin.ModelAdmin):
@@ -24,3 +25,56 @@ class ChatHistoryAdmin(admin.ModelAdmin):
     list_display = ['session_id', 'exercise', 'created_at']
     list_filter = ['created_at']
     search_fields = ['session_id', 'message']
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'exercise', 'db_name', 'execution_time', 'row_count', 'normalized_query']
+    list_filter = ['db_name', 'exercise__schema', 'created_at']
+    search_fields = ['normalized_query', 'fingerprint']
+    readonly_fields = [f.name for f in SlowQuery._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+def _per_fingerprint(aggregate):
+    """Subquery computing `aggregate` over every SlowQuery sharing the outer row's fingerprint"""
+    return Subquery(
+        SlowQuery.objects.filter(fingerprint=OuterRef('fingerprint'))
+        .order_by().values('fingerprint').annotate(value=aggregate).values('value')
+    )
+
+@admin.register(SlowQueryFingerprint)
+class SlowQueryFingerprintAdmin(admin.ModelAdmin):
+    """One row per query fingerprint (its latest occurrence), most total time first"""
+    list_display = ['normalized_query', 'exercise', 'occurrences', 'total_time', 'avg_time', 'max_time', 'created_at']
+    list_filter = ['db_name', 'exercise__schema']
+    search_fields = ['normalized_query', 'fingerprint']
+    readonly_fields = [f.name for f in SlowQuery._meta.fields]
+
+    def get_queryset(self, request):
+        latest = SlowQuery.objects.order_by().values('fingerprint').annotate(latest=Max('id')).values('latest')
+        return super().get_queryset(request).filter(id__in=latest).annotate(
+            occurrences=_per_fingerprint(Count('id')),
+            total_time=_per_fingerprint(Sum('execution_time')),
+            avg_time=_per_fingerprint(Avg('execution_time')),
+            max_time=_per_fingerprint(Max('execution_time')),
+        ).order_by('-total_time')
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.display(ordering='occurrences')
+    def occurrences(self, obj):
+        return obj.occurrences
+
+    @admin.display(ordering='total_time', description='Total (s)')
+    def total_time(self, obj):
+        return round(obj.total_time, 3)
+
+    @admin.display(ordering='avg_time', description='Avg (s)')
+    def avg_time(self, obj):
+        return round(obj.avg_time, 3)
+
+    @admin.display(ordering='max_time', description='Max (s)')
+    def max_time(self, obj):
+        return round(obj.max_time, 3)
@@ -1,26 +1,72 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
 from django.core.management.base import BaseCommand
-from django.db import connection, transaction
+from django.db import connections
+from django.utils import timezone
 from exercises.models import DatabaseSchema
+from exercises.services.datasets import is_generated
+from exercises.services.seeding import apply_schema
 
 
 class Command(BaseCommand):
-    help = 'Apply schema_sql and seed_sql from DatabaseSchema into the default database'
+    help = (
+        'Apply schema_sql and seed_sql from DatabaseSchema into its practice database '
+        '(the db_name alias if configured, else the default database). Unchanged schemas are skipped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('schemas', nargs='*', help='DatabaseSchema names (default: all)')
+        parser.add_argument('--database', help='Load every schema into this database alias instead')
+        parser.add_argument('--force', action='store_true', help='Reload even if the SQL is unchanged')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per executemany() batch (MySQL)')
+        parser.add_argument('--jobs', type=int, default=4,
+                            help='Databases loaded in parallel (schemas sharing a database load one at a time)')
+
+    def _alias(self, schema, override):
+        if override:
+            return override
+        return schema.db_name if schema.db_name in settings.DATABASES else 'default'
+
+    def _apply_group(self, alias, schemas, options):
+        try:
+            return [apply_schema(s, alias, options['force'], options['batch_size']) for s in schemas]
+        finally:
+            connections[alias].close()
 
     def handle(self, *args, **options):
         schemas = DatabaseSchema.objects.all()
+        if options['schemas']:
+            schemas = schemas.filter(name__in=options['schemas'])
+        schemas = list(schemas)
+        for s in list(schemas):
+            if is_generated(s):
+                # Its seed_sql holds no rows, so applying it would only create empty tables
+                self.stdout.write(f'{s.name} is a generated dataset, skipped; rerun generate_dataset to rebuild it')
+                schemas.remove(s)
         if not schemas:
-            self.stdout.write(self.style.WARNING('No DatabaseSchema records found'))
+            self.stdout.write(self.style.WARNING('No DatabaseSchema records to apply'))
             return
 
-        with connection.cursor() as cursor:
-            for s in schemas:
-                self.stdout.write(f'Applying schema for {s.name}...')
-                try:
-                    with transaction.atomic():
-                        if s.schema_sql:
-                            cursor.executescript(s.schema_sql)
-                        if s.seed_sql:
-                            cursor.executescript(s.seed_sql)
-                    self.stdout.write(self.style.SUCCESS(f'Applied schema and seed for {s.name}'))
-                except Exception as e:
-                    self.stdout.write(self.style.ERROR(f'Failed to apply {s.name}: {e}'))
\ No newline at end of file
+        groups = defaultdict(list)
+        for s in schemas:
+            groups[self._alias(s, options['database'])].append(s)
+
+        self.stdout.write(f'Applying {len(schemas)} schema(s) to {len(groups)} database(s)...')
+        with ThreadPoolExecutor(max_workers=max(1, options['jobs'])) as pool:
+            futures = [pool.submit(self._apply_group, alias, group, options) for alias, group in groups.items()]
+            results = [result for future in futures for result in future.result()]
+
+        for result in results:
+            if result.error:
+                self.stdout.write(self.style.ERROR(f'Failed to apply {result.schema} on {result.alias}: {result.error}'))
+            elif result.skipped:
+                self.stdout.write(f'{result.schema} on {result.alias} is up to date, skipped')
+            else:
+                # New data means a new schema version: cached results and sandboxes are rebuilt
+                DatabaseSchema.objects.filter(name=result.schema).update(updated_at=timezone.now())
+                self.stdout.write(self.style.SUCCESS(
+                    f'Applied {result.schema} on {result.alias}: {result.statements} statements, '
+                    f'{result.rows} rows in {result.seconds:.2f}s ({result.rows_per_second:,.0f} rows/s)'
+                ))
@@ -0,0 +1,313 @@
+import json
+import math
+import platform
+import random
+import re
+import statistics
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from ai_tutor.services.response_cache import response_cache_stats
+from exercises.models import ChatHistory, Exercise, UserProgress
+from exercises.services.write_behind import flush_all
+
+ENDPOINTS = {
+    'execute': 'execute-query',
+    'submit': 'submit-query',
+    'ai': 'exercise-ai',
+    'ai-stream': 'exercise-ai-stream',
+}
+
+TIMEOUT_QUERY = 'WITH RECURSIVE r(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM r) SELECT COUNT(*) FROM r'
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def default_query_mix(exercise, include_timeouts=False):
+    """Query shapes built from the exercise schema's first table: (name, query, weight)"""
+    match = re.search(r'CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?[`"]?(\w+)[`"]?\s*\(\s*[`"]?(\w+)',
+                      exercise.schema.schema_sql or '', re.IGNORECASE)
+    table, column = match.groups() if match else ('employees', 'id')
+    mix = [
+        ('trivial', 'SELECT 1', 2),
+        ('scan', f'SELECT * FROM {table}', 3),
+        ('aggregate', f'SELECT COUNT(*), MIN({column}), MAX({column}) FROM {table}', 2),
+        ('join', f'SELECT a.{column} FROM {table} a JOIN {table} b ON a.{column} = b.{column}', 2),
+        ('reference', exercise.expected_sql, 2),
+        ('invalid', 'SELECT * FROM no_such_table', 1),
+        ('rejected', f'DELETE FROM {table}', 1),
+    ]
+    if include_timeouts:
+        mix.append(('timeout', TIMEOUT_QUERY, 1))
+    return mix
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the execute / submit / ai endpoints in-process with concurrent clients; '
+        'reports latency percentiles, throughput and ORM queries per request'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--exercise', type=int, help='Exercise id (default: first exercise)')
+        parser.add_argument('--endpoints', nargs='+', choices=list(ENDPOINTS), default=list(ENDPOINTS))
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per endpoint')
+        parser.add_argument('--queries', help='JSON file: [{"name": ..., "query": ..., "weight": ...}, ...]')
+        parser.add_argument('--include-timeouts', action='store_true',
+                            help='Add a runaway recursive CTE to the default query mix')
+        parser.add_argument('--backend', help='Executor backend for the exercise database (e.g. sqlite-memory, mysql, mock)')
+        parser.add_argument('--real-ai', action='store_true', help='Use OPENAI_MODE from settings instead of mock')
+        parser.add_argument('--warm-cache', action='store_true',
+                            help='Keep the query result and AI response caches on (by default every request does the work)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write machine-readable results to this JSON file')
+        parser.add_argument('--baseline', help='Compare against a previous --output file')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed relative regression of p95 latency / throughput vs the baseline')
+
+    def handle(self, *args, **options):
+        exercise = self._get_exercise(options['exercise'])
+        mix = self._load_mix(options, exercise)
+
+        overrides = {'ALLOWED_HOSTS': list(settings.ALLOWED_HOSTS) + ['testserver']}
+        if not options['real_ai']:
+            overrides['OPENAI_MODE'] = 'mock'
+        if not options['warm_cache']:
+            # The mix repeats a few queries, so with the caches on most timed requests would be hits
+            overrides['QUERY_RESULT_CACHE_ENABLED'] = False
+            overrides['AI_RESPONSE_CACHE_ENABLED'] = False
+        if options['backend']:
+            backends = dict(getattr(settings, 'PRACTICE_DB_BACKENDS', {}))
+            backends[exercise.schema.db_name] = {'BACKEND': options['backend']}
+            overrides['PRACTICE_DB_BACKENDS'] = backends
+
+        sessions = set()
+        results = {}
+        try:
+            with override_settings(**overrides):
+                for endpoint in options['endpoints']:
+                    results[endpoint] = self._run_endpoint(endpoint, exercise, mix, options, sessions)
+        finally:
+            # Leave no benchmark progress / chat rows behind, including buffered ones
+            flush_all()
+            if sessions:
+                UserProgress.objects.filter(session_id__in=sessions).delete()
+                ChatHistory.objects.filter(session_id__in=sessions).delete()
+
+        report = {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'exercise': exercise.id,
+                'db_name': exercise.schema.db_name,
+                'backend': options['backend'] or 'auto',
+                'warm_cache': options['warm_cache'],
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'python': platform.python_version(),
+                'database': connection.vendor,
+            },
+            'endpoints': results,
+        }
+        if 'ai' in results:
+            report['ai_response_cache'] = response_cache_stats()
+        self._print_report(report)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote results to {options['output']}"))
+
+        if options['baseline']:
+            self._compare_baseline(report, options['baseline'], options['tolerance'])
+
+    def _get_exercise(self, exercise_id):
+        qs = Exercise.objects.select_related('schema')
+        exercise = qs.filter(id=exercise_id).first() if exercise_id else qs.first()
+        if exercise is None:
+            raise CommandError('No exercise found; run setup_demo first or pass --exercise')
+        return exercise
+
+    def _load_mix(self, options, exercise):
+        if not options['queries']:
+            return default_query_mix(exercise, options['include_timeouts'])
+        with open(options['queries']) as f:
+            return [(q['name'], q['query'], q.get('weight', 1)) for q in json.load(f)]
+
+    def _payload(self, endpoint, name, query):
+        if endpoint.startswith('ai'):
+            return {'message': f'Why does my {name} query fail?', 'user_query': query, 'error': None}
+        return {'query': query}
+
+    def _run_endpoint(self, endpoint, exercise, mix, options, sessions):
+        url = reverse(ENDPOINTS[endpoint], args=[exercise.id])
+        rng = random.Random(options['seed'])
+        names, queries, weights = zip(*mix)
+        plan = rng.choices(range(len(mix)), weights=weights, k=options['warmup'] + options['requests'])
+        warmup, timed = plan[:options['warmup']], plan[options['warmup']:]
+
+        samples = []  # (shape, latency_ms, ok, db_queries, first_byte_ms)
+        samples_lock = threading.Lock()
+        next_index = iter(range(len(timed)))
+        index_lock = threading.Lock()
+
+        def send(client, i):
+            body = json.dumps(self._payload(endpoint, names[i], queries[i]))
+            return client.post(url, body, content_type='application/json')
+
+        def worker():
+            client = Client()
+            calls = []
+
+            def count_queries(execute, sql, params, many, context):
+                calls.append(1)
+                return execute(sql, params, many, context)
+
+            try:
+                with connection.execute_wrapper(count_queries):
+                    while True:
+                        with index_lock:
+                            n = next(next_index, None)
+                        if n is None:
+                            break
+                        i = timed[n]
+                        calls.clear()
+                        start = time.perf_counter()
+                        response = send(client, i)
+                        first_byte = None
+                        if response.streaming:
+                            # Time to first token, then drain the stream
+                            for chunk in response.streaming_content:
+                                if first_byte is None:
+                                    first_byte = (time.perf_counter() - start) * 1000
+                        latency = (time.perf_counter() - start) * 1000
+                        ok = response.status_code == 200 and self._succeeded(endpoint, names[i], response)
+                        with samples_lock:
+                            samples.append((names[i], latency, ok, len(calls), first_byte))
+            finally:
+                if 'sessionid' in client.cookies:
+                    sessions.add(client.cookies['sessionid'].value)
+                connection.close()
+
+        warm_client = Client()
+        for i in warmup:
+            response = send(warm_client, i)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        if 'sessionid' in warm_client.cookies:
+            sessions.add(warm_client.cookies['sessionid'].value)
+
+        threads = [threading.Thread(target=worker) for _ in range(max(1, options['concurrency']))]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - start
+
+        return self._summarize(samples, wall)
+
+    @staticmethod
+    def _succeeded(endpoint, shape, response):
+        """Responses count as errors only if they fail unexpectedly (invalid shapes are meant to fail)"""
+        if endpoint != 'execute' or shape in ('invalid', 'rejected', 'timeout'):
+            return True
+        return bool(response.json().get('success'))
+
+    @staticmethod
+    def _stats(samples):
+        latencies = sorted(s[1] for s in samples)
+        stats = {
+            'requests': len(latencies),
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+            'mean_ms': round(statistics.fmean(latencies), 2),
+            'db_queries_per_request': round(statistics.fmean(s[3] for s in samples), 2),
+        }
+        first_bytes = sorted(s[4] for s in samples if s[4] is not None)
+        if first_bytes:
+            stats['ttft_p50_ms'] = round(percentile(first_bytes, 50), 2)
+            stats['ttft_p95_ms'] = round(percentile(first_bytes, 95), 2)
+        return stats
+
+    def _summarize(self, samples, wall):
+        if not samples:
+            return {'requests': 0}
+        summary = self._stats(samples)
+        summary['errors'] = sum(1 for s in samples if not s[2])
+        summary['throughput_rps'] = round(len(samples) / wall, 2)
+        by_shape = defaultdict(list)
+        for s in samples:
+            by_shape[s[0]].append(s)
+        summary['shapes'] = {
+            shape: self._stats(group)
+            for shape, group in sorted(by_shape.items())
+        }
+        return summary
+
+    def _print_report(self, report):
+        meta = report['meta']
+        self.stdout.write(
+            f"exercise={meta['exercise']} db={meta['db_name']} backend={meta['backend']} "
+            f"requests={meta['requests']} concurrency={meta['concurrency']} warm_cache={meta['warm_cache']}"
+        )
+        header = f"{'endpoint':<10} {'shape':<10} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'db q/req':>9}"
+        self.stdout.write(header)
+        for endpoint, summary in report['endpoints'].items():
+            if not summary.get('requests'):
+                continue
+            rows = [('all', summary)] + list(summary['shapes'].items())
+            for shape, s in rows:
+                self.stdout.write(
+                    f"{endpoint:<10} {shape:<10} {s['requests']:>5} {s['p50_ms']:>9.2f} {s['p95_ms']:>9.2f} "
+                    f"{s['p99_ms']:>9.2f} {s['db_queries_per_request']:>9.2f}"
+                )
+            self.stdout.write(
+                f"{endpoint:<10} throughput {summary['throughput_rps']:.1f} req/s, errors {summary['errors']}"
+            )
+            if 'ttft_p50_ms' in summary:
+                self.stdout.write(
+                    f"{endpoint:<10} time to first token p50 {summary['ttft_p50_ms']:.2f} ms, "
+                    f"p95 {summary['ttft_p95_ms']:.2f} ms"
+                )
+        stats = report.get('ai_response_cache')
+        if stats:
+            self.stdout.write(
+                f"ai response cache: {stats['hits']} hits, {stats['misses']} misses, "
+                f"{stats['bypassed']} bypassed, hit rate {stats['hit_rate']}"
+            )
+
+    def _compare_baseline(self, report, path, tolerance):
+        with open(path) as f:
+            baseline = json.load(f)
+        regressions = []
+        for endpoint, current in report['endpoints'].items():
+            previous = baseline.get('endpoints', {}).get(endpoint)
+            if not previous or not previous.get('requests') or not current.get('requests'):
+                continue
+            if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+                regressions.append(f"{endpoint}: p95 {previous['p95_ms']} -> {current['p95_ms']} ms")
+            if current['throughput_rps'] < previous['throughput_rps'] * (1 - tolerance):
+                regressions.append(
+                    f"{endpoint}: throughput {previous['throughput_rps']} -> {current['throughput_rps']} req/s"
+                )
+        if regressions:
+            raise CommandError('Performance regression vs baseline:\n  ' + '\n  '.join(regressions))
+        self.stdout.write(self.style.SUCCESS(f'No regressions beyond {tolerance:.0%} vs {path}'))
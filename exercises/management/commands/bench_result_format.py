@@ -0,0 +1,99 @@
+import gzip
+import json
+import random
+import sqlite3
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from rest_framework.utils.encoders import JSONEncoder
+
+from chatsql.middleware import brotli
+from exercises.services.result_format import to_columnar
+
+COLUMNS = ['id', 'first_name', 'last_name', 'email', 'salary', 'hire_date', 'department_id', 'notes']
+
+
+def build_database(rows: int, note_length: int) -> sqlite3.Connection:
+    rng = random.Random(42)
+    conn = sqlite3.connect(':memory:')
+    conn.execute(
+        'CREATE TABLE employees (id INTEGER PRIMARY KEY, first_name TEXT, last_name TEXT, email TEXT, '
+        'salary REAL, hire_date TEXT, department_id INTEGER, notes TEXT)'
+    )
+    names = ['Ann', 'Bo', 'Chen', 'Dara', 'Eli', 'Femi', 'Gus', 'Hana']
+    conn.executemany('INSERT INTO employees VALUES (?, ?, ?, ?, ?, ?, ?, ?)', (
+        (i, rng.choice(names), rng.choice(names) + 'son', f'user{i}@example.com',
+         round(rng.uniform(30000, 150000), 2), f'20{rng.randint(10, 24)}-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}',
+         rng.randint(1, 12), 'x' * (note_length if i % 10 == 0 else 20))
+        for i in range(rows)
+    ))
+    return conn
+
+
+def dict_factory(cursor, row):
+    return {desc[0]: value for desc, value in zip(cursor.description, row)}
+
+
+def legacy_rows(conn, limit):
+    """DictCursor rows rebuilt as lists, as MySQLBackend did before"""
+    conn.row_factory = dict_factory
+    try:
+        rows = conn.execute(f'SELECT * FROM employees LIMIT {limit}').fetchall()
+    finally:
+        conn.row_factory = None
+    return {'success': True, 'columns': COLUMNS, 'rows': [list(row.values()) for row in rows], 'row_count': len(rows)}
+
+
+def tuple_rows(conn, limit):
+    rows = conn.execute(f'SELECT * FROM employees LIMIT {limit}').fetchall()
+    return {'success': True, 'columns': COLUMNS, 'rows': rows, 'row_count': len(rows)}
+
+
+def encode(result) -> bytes:
+    return json.dumps(result, cls=JSONEncoder).encode('utf-8')
+
+
+def measure(build):
+    """(peak traced bytes, seconds, JSON payload) for fetching and encoding one result"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    payload = build()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, elapsed, payload
+
+
+class Command(BaseCommand):
+    help = 'Compare peak memory and payload size of the rows and columnar result formats'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[100, 1000])
+        parser.add_argument('--note-length', type=int, default=5000,
+                            help='Length of the long text value in every tenth row')
+        parser.add_argument('--max-value-length', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        max_rows = max(options['rows'])
+        conn = build_database(max_rows, options['note_length'])
+        variants = [
+            ('legacy rows', lambda n: encode(legacy_rows(conn, n))),
+            ('tuple rows', lambda n: encode(tuple_rows(conn, n))),
+            ('columnar', lambda n: encode(to_columnar(tuple_rows(conn, n), options['max_value_length']))),
+        ]
+        header = f"{'rows':>6} {'format':<12} {'peak KiB':>9} {'ms':>7} {'JSON KiB':>9} {'gzip KiB':>9}"
+        if brotli is not None:
+            header += f" {'br KiB':>8}"
+        self.stdout.write(header)
+        for n in options['rows']:
+            for name, build in variants:
+                build(n)  # warm up
+                peak, elapsed, payload = measure(lambda: build(n))
+                line = (f'{n:>6} {name:<12} {peak / 1024:>9.1f} {elapsed * 1000:>7.2f} '
+                        f'{len(payload) / 1024:>9.1f} {len(gzip.compress(payload, 6)) / 1024:>9.1f}')
+                if brotli is not None:
+                    line += f' {len(brotli.compress(payload, quality=5)) / 1024:>8.1f}'
+                self.stdout.write(line)
+        if brotli is None:
+            self.stdout.write('brotli is not installed; only gzip sizes are shown (pip install brotli)')
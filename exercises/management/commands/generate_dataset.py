@@ -0,0 +1,129 @@
+import os
+import re
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from exercises.models import DatabaseSchema
+from exercises.services.backends import practice_data_path
+from exercises.services.datasets import DATASETS, GENERATED_MARKER, size_label
+from exercises.services.seeding import (
+    bulk_load, insert_rows, record_applied, seed_hash, split_statements, sqlite_file_connection, table_names,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a deterministic HR, eCommerce or School dataset of any size, stream it into a SQLite '
+        'file in PRACTICE_DATA_DIR (or a MySQL alias) and register it as a DatabaseSchema'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(DATASETS))
+        parser.add_argument('--rows', type=int, default=100_000, help='Approximate total rows across all tables')
+        parser.add_argument('--seed', type=int, default=42, help='Same seed and --rows give the same data')
+        parser.add_argument('--name', help='DatabaseSchema name (default: <dataset>_<size>, e.g. hr_100k)')
+        parser.add_argument('--database', help='Load into this MySQL alias instead of a SQLite file')
+        parser.add_argument('--batch-size', type=int, default=10_000, help='Rows per executemany() batch')
+        parser.add_argument('--no-indexes', action='store_true',
+                            help='Skip the foreign key indexes, e.g. for exercises about adding them')
+
+    def handle(self, *args, **options):
+        dataset = DATASETS[options['dataset']]
+        rows = options['rows']
+        if rows < 1:
+            raise CommandError('--rows must be positive')
+        name = options['name'] or f'{dataset.name}_{size_label(rows)}'
+        alias = options['database']
+        if alias:
+            if alias not in settings.DATABASES:
+                raise CommandError(f"Unknown database alias '{alias}'")
+            if connections[alias].vendor != 'mysql':
+                raise CommandError('--database must be a MySQL alias; SQLite datasets are written to PRACTICE_DATA_DIR')
+            db_name = alias
+        else:
+            db_name = f'practice_{name}'
+            if practice_data_path(db_name) is None:
+                raise CommandError('Set PRACTICE_DATA_DIR to generate SQLite datasets')
+        # The name ends up in a file name and in DatabaseSchema.name / db_name
+        if not re.fullmatch(r'\w+', name):
+            raise CommandError('--name may only contain letters, digits and underscores')
+        for field, value in (('name', name), ('db_name', db_name)):
+            max_length = DatabaseSchema._meta.get_field(field).max_length
+            if len(value) > max_length:
+                raise CommandError(f"--name is too long: {field} '{value}' must fit in {max_length} characters")
+
+        counts = dataset.plan(rows)
+        schema = DatabaseSchema.objects.filter(name=name).first() or DatabaseSchema(name=name)
+        schema.display_name = f'{dataset.display_name} ({size_label(rows)} rows)'
+        schema.description = f'{dataset.description}. Generated with seed {options["seed"]}.'
+        schema.db_name = db_name
+        schema.schema_sql = dataset.schema_sql(indexes=not options['no_indexes'])
+        # The data lives in the practice database only; this records how to regenerate it
+        schema.seed_sql = (
+            f'{GENERATED_MARKER} {dataset.name} --rows {rows} --seed {options["seed"]}\n'
+            + ''.join(f'-- {table}: {count} rows\n' for table, count in counts.items())
+        )
+
+        total = sum(counts.values())
+        self.stdout.write(f'Generating {dataset.name} ({total:,} rows, seed {options["seed"]}) into {db_name}...')
+        start = time.perf_counter()
+        if alias:
+            self._load(connections[alias], dataset, schema, counts, options)
+        else:
+            path = practice_data_path(db_name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.tmp'
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            connection = sqlite_file_connection(tmp_path)
+            try:
+                self._load(connection, dataset, schema, counts, options)
+            except Exception:
+                connection.close()
+                os.remove(tmp_path)
+                raise
+            connection.close()
+            # Readers keep the old file open until they notice the swap (see SQLiteFileBackend)
+            os.replace(tmp_path, path)
+        seconds = time.perf_counter() - start
+
+        # Saving bumps updated_at: a new schema version for the result cache and the catalog
+        schema.save()
+        self.stdout.write(self.style.SUCCESS(
+            f'Registered DatabaseSchema {name}: {total:,} rows in {seconds:.1f}s ({total / seconds:,.0f} rows/s)'
+        ))
+
+    def _load(self, connection, dataset, schema, counts, options):
+        # SQLite loads each table in one transaction; MySQL autocommits every batch so undo logs stay small
+        per_table = connection.vendor == 'sqlite'
+        with connection.cursor() as cursor, bulk_load(connection, cursor):
+            for table in reversed(table_names(dataset.tables_sql)):
+                cursor.execute(f'DROP TABLE IF EXISTS {connection.ops.quote_name(table)}')
+            for statement in split_statements(dataset.tables_sql):
+                cursor.execute(statement)
+            for table in dataset.tables:
+                start = time.perf_counter()
+                if per_table:
+                    connection.set_autocommit(False)
+                try:
+                    count = insert_rows(connection, cursor, table.name, table.columns,
+                                        dataset.generate(table, options['seed'], counts), options['batch_size'])
+                    if per_table:
+                        connection.commit()
+                except Exception:
+                    if per_table:
+                        connection.rollback()
+                    raise
+                finally:
+                    if per_table:
+                        connection.set_autocommit(True)
+                self.stdout.write(f'  {table.name}: {count:,} rows in {time.perf_counter() - start:.1f}s')
+            # Building indexes once over the loaded data is faster than maintaining them row by row
+            if not options['no_indexes']:
+                start = time.perf_counter()
+                for statement in split_statements(dataset.indexes_sql):
+                    cursor.execute(statement)
+                self.stdout.write(f'  indexes in {time.perf_counter() - start:.1f}s')
+            record_applied(connection, cursor, schema.name, seed_hash(schema))
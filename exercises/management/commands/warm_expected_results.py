@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from exercises.models import Exercise
+from exercises.services.query_runner import get_runner
+from exercises.services.result_cache import get_cached_expected_result, store_expected_result
+
+
+class Command(BaseCommand):
+    help = 'Run every exercise expected_sql once and store the reference results in the cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Re-run even if a fresh entry is cached')
+
+    def handle(self, *args, **options):
+        exercises = Exercise.objects.select_related('schema').all()
+        warmed = skipped = failed = 0
+        for ex in exercises:
+            if not options['force'] and get_cached_expected_result(ex) is not None:
+                skipped += 1
+                continue
+            result = get_runner(ex)(ex.expected_sql)
+            if store_expected_result(ex, result) is None:
+                failed += 1
+                self.stdout.write(self.style.ERROR(f'Failed to warm exercise {ex.id} ({ex.title}): {result.get("error")}'))
+                continue
+            warmed += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Warmed {warmed} exercises ({skipped} already cached, {failed} failed)'))
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:23
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exercises', '0002_chat_history_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('db_name', models.CharField(max_length=50)),
+                ('fingerprint', models.CharField(help_text='Hash of the normalized query', max_length=32)),
+                ('normalized_query', models.TextField()),
+                ('query', models.TextField(help_text='One example of the query as written')),
+                ('execution_time', models.FloatField(help_text='Seconds')),
+                ('row_count', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('plan', models.TextField(blank=True, help_text='EXPLAIN (MySQL) or EXPLAIN QUERY PLAN (SQLite) output')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('exercise', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='exercises.exercise')),
+            ],
+            options={
+                'db_table': 'slow_queries',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SlowQueryFingerprint',
+            fields=[
+            ],
+            options={
+                'verbose_name': 'slow query fingerprint',
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('exercises.slowquery',),
+        ),
+        migrations.AddIndex(
+            model_name='slowquery',
+            index=models.Index(fields=['fingerprint', 'created_at'], name='slow_queries_fingerprint_idx'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 class DatabaseSchema(models.Model):
     """Three schemas: HR, Ecommerce, School"""
@@ -68,8 +69,43 @@ class ChatHistory(models.Model):
     message = models.TextField()
     response = models.TextField()
     context = models.JSONField(default=dict, help_text='{"query": "...", "error": "..."}')
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Set when the message is asked, not when the batched insert runs
+    created_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
         db_table = 'chat_history'
         ordering = ['-created_at']
+        indexes = [
+            # Serves the newest-first, keyset-paginated history of one session's exercise chat
+            models.Index(fields=['session_id', 'exercise', 'created_at'], name='chat_history_session_ex_idx'),
+        ]
+
+class SlowQuery(models.Model):
+    """A practice query that ran past SLOW_QUERY_THRESHOLD, with the database's plan for it"""
+    exercise = models.ForeignKey(Exercise, on_delete=models.SET_NULL, null=True, blank=True)
+    db_name = models.CharField(max_length=50)
+    fingerprint = models.CharField(max_length=32, help_text="Hash of the normalized query")
+    normalized_query = models.TextField()
+    query = models.TextField(help_text="One example of the query as written")
+    execution_time = models.FloatField(help_text="Seconds")
+    row_count = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    plan = models.TextField(blank=True, help_text="EXPLAIN (MySQL) or EXPLAIN QUERY PLAN (SQLite) output")
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.execution_time:.3f}s {self.normalized_query[:80]}"
+
+    class Meta:
+        db_table = 'slow_queries'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['fingerprint', 'created_at'], name='slow_queries_fingerprint_idx'),
+        ]
+
+class SlowQueryFingerprint(SlowQuery):
+    """Admin view of SlowQuery grouped by fingerprint"""
+
+    class Meta:
+        proxy = True
+        verbose_name = 'slow query fingerprint'
@@ -0,0 +1,352 @@
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import pymysql
+from django.conf import settings
+from django.db import connections
+from django.utils.module_loading import import_string
+
+from .datasets import is_generated
+from .pool import get_pool, PoolTimeout
+from .sandbox import sandboxes
+from .sql_validator import MYSQL, SQLITE
+
+CR_SERVER_LOST = 2013  # pymysql error code when read_timeout expires mid-query
+
+# overflow(columns, rows, rest): receives a result's first max_rows rows and an iterator over the rest
+Overflow = Callable[[List[str], List[Sequence], Iterator[Sequence]], None]
+
+
+class BackendError(Exception):
+    """A query failed in the backend; the message is safe to show to the student"""
+
+
+class ExecutorBackend:
+    """
+    Runs already-validated student queries against one practice database.
+    SQLExecutor owns validation, the per-session limit, timing and result shaping, so
+    every backend gets those for free and only has to fetch (columns, rows).
+    """
+
+    name = None
+    # Results depend only on the schema version and the query, so query_cache may reuse them
+    cacheable = True
+    # How sql_validator scans string literals; None validates against every dialect
+    dialect = None
+
+    def __init__(self, db_name: str, schema=None, governor=None, **options):
+        """
+        Args:
+            db_name: DatabaseSchema.db_name, e.g. 'practice_hr'
+            schema: the DatabaseSchema, for backends that build the database from it
+            governor: QueryGovernor with the time / row-scan limits to enforce
+            options: the backend's PRACTICE_DB_BACKENDS entry, minus 'BACKEND'
+        """
+        self.db_name = db_name
+        self.schema = schema
+        self.governor = governor
+        self.options = options
+
+    def run(self, query: str, max_rows: int, overflow: Optional[Overflow] = None) -> Tuple[List[str], List[Sequence]]:
+        """
+        Execute the query and return (columns, rows) with at most max_rows rows.
+        Rows are tuples (or lists) in column order; they are never mutated afterwards.
+        When the query has more rows and `overflow` is given, it is called before returning
+        with the rest still being read from the open cursor (see _hand_over); it may stop early.
+        """
+        raise NotImplementedError
+
+    def explain(self, query: str) -> Optional[str]:
+        """The database's query plan as text, or None if the backend has no planner"""
+        return None
+
+
+def _remaining(cursor, chunk: int = 500) -> Iterator[Sequence]:
+    while True:
+        rows = cursor.fetchmany(chunk)
+        if not rows:
+            return
+        yield from rows
+
+
+def _hand_over(overflow: Optional[Overflow], cursor, columns: List[str], rows: List[Sequence]):
+    """Pass rows past the first fetch to overflow(), if there are any"""
+    if overflow is None:
+        return
+    extra = cursor.fetchone()
+    if extra is not None:
+        overflow(columns, rows, itertools.chain([extra], _remaining(cursor)))
+
+
+class MySQLBackend(ExecutorBackend):
+    """Practice database on a MySQL server (settings.DATABASES alias), via the connection pool"""
+
+    name = 'mysql'
+    dialect = MYSQL
+
+    def __init__(self, db_name, schema=None, governor=None, **options):
+        super().__init__(db_name, schema, governor, **options)
+        if db_name not in settings.DATABASES:
+            raise ValueError(f"Invalid database: {db_name}")
+        self.pool = get_pool(
+            db_name,
+            connect_timeout=5,
+            # The server enforces the statement limit; the client waits a little longer
+            read_timeout=int(governor.statement_timeout) + 1,
+            autocommit=True,
+            init_command=governor.mysql_init_command(),
+            # Plain tuples: no per-row dict, and duplicate column names (joins) survive
+            cursorclass=pymysql.cursors.Cursor
+        )
+
+    def run(self, query, max_rows, overflow=None):
+        thread_id = None
+        try:
+            with self.pool.connection() as connection, connection.cursor() as cursor:
+                thread_id = connection.thread_id()
+                if overflow is not None:
+                    # sql_select_limit stops results at MAX_ROWS + 1; let this one reach the spill cap
+                    cursor.execute(f'SET SESSION sql_select_limit = {self.governor.max_spill_rows + 1}')
+                cursor.execute(query)
+                rows = list(cursor.fetchmany(max_rows))
+                columns = [desc[0] for desc in cursor.description] if cursor.description else []
+                _hand_over(overflow, cursor, columns, rows)
+                if overflow is not None:
+                    # A driver error above discards the connection, so only this path needs the reset
+                    cursor.execute(f'SET SESSION sql_select_limit = {self.governor.max_result_rows}')
+                return columns, rows
+        except pymysql.MySQLError as e:
+            if isinstance(e, pymysql.OperationalError) and e.args and e.args[0] == CR_SERVER_LOST and thread_id:
+                # Client-side read timeout: the statement may still be running on the server
+                self.governor.kill_mysql_query(self.pool, thread_id)
+            raise BackendError(str(e)) from e
+        except PoolTimeout as e:
+            raise BackendError(str(e)) from e
+
+    def explain(self, query):
+        try:
+            with self.pool.connection() as connection, connection.cursor() as cursor:
+                cursor.execute('EXPLAIN ' + _strip_semicolon(query))
+                rows = cursor.fetchall()
+                names = [desc[0] for desc in cursor.description]
+        except (pymysql.MySQLError, PoolTimeout) as e:
+            raise BackendError(str(e)) from e
+        # One line per plan row: table, access type, key used, rows examined, Extra ...
+        return '\n'.join(
+            ', '.join(f'{key}={value}' for key, value in zip(names, row) if value is not None) for row in rows
+        )
+
+
+def _strip_semicolon(query: str) -> str:
+    return query.strip().rstrip(';').strip()
+
+
+class _SQLiteBackend(ExecutorBackend):
+    """Shared SQLite execution with the governor's progress-handler limits"""
+
+    dialect = SQLITE
+
+    def _connection(self) -> sqlite3.Connection:
+        raise NotImplementedError
+
+    def run(self, query, max_rows, overflow=None):
+        try:
+            conn = self._connection()
+            with self.governor.sqlite_limits(conn):
+                cursor = conn.execute(query)
+                try:
+                    rows = cursor.fetchmany(max_rows)
+                    columns = [col[0] for col in cursor.description] if cursor.description else []
+                    _hand_over(overflow, cursor, columns, rows)
+                finally:
+                    cursor.close()
+        except sqlite3.Error as e:
+            message = str(e)
+            if message == 'interrupted':
+                message = (
+                    f'Query exceeded the execution limits ({self.governor.statement_timeout:g}s '
+                    'or the row-scan budget) and was stopped'
+                )
+            raise BackendError(message) from e
+        return columns, rows
+
+    def explain(self, query):
+        try:
+            conn = self._connection()
+            with self.governor.sqlite_limits(conn):
+                rows = conn.execute('EXPLAIN QUERY PLAN ' + _strip_semicolon(query)).fetchall()
+        except sqlite3.Error as e:
+            raise BackendError(str(e)) from e
+        # Rows are (id, parent, notused, detail); indent each step under its parent
+        depth = {0: -1}
+        lines = []
+        for node_id, parent, _, detail in rows:
+            depth[node_id] = depth.get(parent, -1) + 1
+            lines.append('  ' * depth[node_id] + detail)
+        return '\n'.join(lines)
+
+
+# Statement steps a student query may take: reading tables, calling functions, recursive CTEs
+_READ_ACTIONS = frozenset([sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE])
+
+
+def _read_only_authorizer(denied_tables):
+    """sqlite3 authorizer allowing only reads, and no reads of `denied_tables` (lower-case names)"""
+    def authorize(action, arg1, arg2, db_name, trigger):
+        if action not in _READ_ACTIONS:
+            return sqlite3.SQLITE_DENY
+        if action == sqlite3.SQLITE_READ and arg1 and arg1.lower() in denied_tables:
+            return sqlite3.SQLITE_DENY
+        return sqlite3.SQLITE_OK
+    return authorize
+
+
+class SQLiteFileBackend(_SQLiteBackend):
+    """
+    Practice data in a SQLite file: either the file at options['PATH'], or the file of a
+    Django SQLite database (options['ALIAS'], default 'default'). Either way the file gets its
+    own read-only connection per thread, never the ORM's, with query_only set and an authorizer
+    that allows reads only. For an ALIAS, reads of the app's own tables (auth_user,
+    django_session, ...) are denied too.
+    """
+
+    name = 'sqlite-file'
+
+    _local = threading.local()
+
+    def _target(self) -> Tuple[str, frozenset]:
+        """(file path, tables students may not read)"""
+        path = self.options.get('PATH')
+        if path is not None:
+            return str(path), frozenset()
+        alias = self.options.get('ALIAS', 'default')
+        db = settings.DATABASES.get(alias, {})
+        if 'sqlite3' not in db.get('ENGINE', '') or not db.get('NAME') or str(db['NAME']).startswith(':memory:'):
+            raise BackendError(f"Practice database '{self.db_name}' is not configured")
+        app_tables = connections[alias].introspection.django_table_names(include_views=True)
+        return str(db['NAME']), frozenset(t.lower() for t in [*app_tables, 'django_migrations'])
+
+    def _connection(self):
+        path, denied = self._target()
+        conns = getattr(self._local, 'conns', None)
+        if conns is None:
+            conns = self._local.conns = {}
+        try:
+            # generate_dataset swaps in a new file; reopen when the path names a different one
+            inode = os.stat(path).st_ino
+        except OSError as e:
+            raise BackendError(f"Practice database '{self.db_name}' is not available") from e
+        entry = conns.get(path)
+        if entry is not None and entry[0] == inode:
+            return entry[1]
+        try:
+            conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+            conn.execute('PRAGMA query_only = ON')
+        except sqlite3.Error as e:
+            raise BackendError(f"Practice database '{self.db_name}' is not available") from e
+        conn.set_authorizer(_read_only_authorizer(denied))
+        if entry is not None:
+            entry[1].close()
+        conns[path] = (inode, conn)
+        return conn
+
+
+class SQLiteMemoryBackend(_SQLiteBackend):
+    """Isolated per-thread in-memory copy of the DatabaseSchema (see sandbox.SandboxRegistry)"""
+
+    name = 'sqlite-memory'
+
+    def __init__(self, db_name, schema=None, governor=None, **options):
+        super().__init__(db_name, schema, governor, **options)
+        if schema is None:
+            raise ValueError('The sqlite-memory backend needs a DatabaseSchema')
+
+    def _connection(self):
+        try:
+            return sandboxes.connection(self.schema)
+        except Exception as e:
+            raise BackendError(str(e)) from e
+
+
+class MockBackend(ExecutorBackend):
+    """
+    Canned results with optional simulated latency, for tests and benchmarking the request path.
+    Options: RESULTS maps a query string to {'columns': [...], 'rows': [...]};
+    DEFAULT is returned for any other query; LATENCY is seconds to sleep per query.
+    """
+
+    name = 'mock'
+    # Its LATENCY stands in for query time when benchmarking, so never skip it
+    cacheable = False
+
+    DEFAULT_RESULT = {'columns': ['result'], 'rows': [[1]]}
+
+    def run(self, query, max_rows, overflow=None):
+        latency = float(self.options.get('LATENCY', 0))
+        if latency:
+            time.sleep(latency)
+        results = self.options.get('RESULTS', {})
+        result = results.get(query.strip().rstrip(';').strip(), self.options.get('DEFAULT', self.DEFAULT_RESULT))
+        columns = list(result['columns'])
+        rows = [list(row) for row in result['rows'][:max_rows]]
+        if overflow is not None and len(result['rows']) > max_rows:
+            overflow(columns, rows, (list(row) for row in result['rows'][max_rows:]))
+        return columns, rows
+
+
+BACKENDS = {
+    cls.name: cls for cls in (MySQLBackend, SQLiteFileBackend, SQLiteMemoryBackend, MockBackend)
+}
+
+
+def register_backend(cls):
+    """Make an ExecutorBackend subclass selectable by its name in PRACTICE_DB_BACKENDS"""
+    BACKENDS[cls.name] = cls
+    return cls
+
+
+def practice_data_path(db_name: str) -> Optional[str]:
+    """Where generate_dataset keeps the SQLite file for a practice database, if PRACTICE_DATA_DIR is set"""
+    data_dir = getattr(settings, 'PRACTICE_DATA_DIR', None)
+    return os.path.join(data_dir, f'{db_name}.sqlite3') if data_dir else None
+
+
+def backend_config(db_name: str, schema=None) -> Dict:
+    """
+    Pick the backend for a practice database:
+    1. an explicit settings.PRACTICE_DB_BACKENDS[db_name] entry
+    2. MySQL if db_name is a MySQL alias in settings.DATABASES
+    3. the SQLite file PRACTICE_DATA_DIR/<db_name>.sqlite3, if generate_dataset wrote one
+       (a generated schema without its file raises BackendError: its seed_sql holds no rows)
+    4. an in-memory sandbox of the schema (PRACTICE_SQLITE_SANDBOX, the default)
+    5. the default Django SQLite database, read-only and without access to the app's tables
+    """
+    configured = getattr(settings, 'PRACTICE_DB_BACKENDS', {}).get(db_name)
+    if configured:
+        return dict(configured)
+    db = settings.DATABASES.get(db_name)
+    if db and 'mysql' in db.get('ENGINE', ''):
+        return {'BACKEND': 'mysql'}
+    path = practice_data_path(db_name)
+    if path is not None and os.path.exists(path):
+        return {'BACKEND': 'sqlite-file', 'PATH': path}
+    if schema is not None and is_generated(schema):
+        raise BackendError(
+            f"The data file of generated dataset '{schema.name}' is missing; rerun manage.py generate_dataset"
+        )
+    if getattr(settings, 'PRACTICE_SQLITE_SANDBOX', True) and schema is not None and schema.schema_sql:
+        return {'BACKEND': 'sqlite-memory'}
+    return {'BACKEND': 'sqlite-file'}
+
+
+def get_backend(db_name: str, schema=None, governor=None) -> ExecutorBackend:
+    options = backend_config(db_name, schema)
+    name = options.pop('BACKEND')
+    cls = BACKENDS.get(name) or (import_string(name) if '.' in name else None)
+    if cls is None:
+        raise ValueError(f"Unknown executor backend '{name}' for {db_name}")
+    return cls(db_name, schema=schema, governor=governor, **options)
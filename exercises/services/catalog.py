@@ -0,0 +1,80 @@
+import hashlib
+import json
+import time
+from typing import Dict, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from rest_framework.utils.encoders import JSONEncoder
+
+from chatsql.metrics import cache_lookup
+from ..models import DatabaseSchema, Exercise
+
+VERSION_KEY = 'catalog:version'
+
+
+def catalog_version() -> str:
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = f'{time.time_ns():x}'
+        # Another worker may have set it first; use whichever won
+        if not cache.add(VERSION_KEY, version, None):
+            version = cache.get(VERSION_KEY, version)
+    return version
+
+
+def bump_catalog_version():
+    """Invalidate every cached catalog; old entries simply expire"""
+    cache.set(VERSION_KEY, f'{time.time_ns():x}', None)
+
+
+def _build_catalog() -> Dict:
+    schemas = DatabaseSchema.objects.annotate(exercise_count=Count('exercises')).order_by('id')
+    exercises = Exercise.objects.select_related('schema').all()
+    return {
+        'schemas': [{
+            'id': s.id,
+            'name': s.name,
+            'display_name': s.display_name,
+            'description': s.description,
+            'exercise_count': s.exercise_count
+        } for s in schemas],
+        'exercises': [{
+            'id': ex.id,
+            'title': ex.title,
+            'difficulty': ex.difficulty,
+            'schema_id': ex.schema_id,
+            'schema': ex.schema.display_name,
+            'tags': ex.tags
+        } for ex in exercises],
+    }
+
+
+def get_catalog() -> Tuple[Dict, str]:
+    """
+    Return (catalog, etag) for the current catalog version, building it on a cache miss.
+    The ETag changes whenever an Exercise or DatabaseSchema is saved or deleted.
+    """
+    version = catalog_version()
+    key = f'catalog:{version}'
+    entry = cache.get(key)
+    cache_lookup('catalog', entry is not None)
+    if entry is None:
+        data = _build_catalog()
+        digest = hashlib.sha1(json.dumps(data, cls=JSONEncoder, sort_keys=True).encode()).hexdigest()[:16]
+        entry = {'data': data, 'etag': f'"{digest}"'}
+        cache.set(key, entry, getattr(settings, 'CATALOG_CACHE_TIMEOUT', 60 * 60))
+    return entry['data'], entry['etag']
+
+
+def etag_matches(request, etag: str) -> bool:
+    """True if the client's If-None-Match already names this ETag"""
+    header = request.headers.get('If-None-Match', '')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    candidates = [tag.strip() for tag in header.split(',')]
+    # Weak validators (W/"...") compare equal for GET revalidation
+    return etag in candidates or f'W/{etag}' in candidates
@@ -0,0 +1,266 @@
+"""
+Synthetic practice datasets (HR, eCommerce, School) at any scale.
+
+Every table is generated lazily, row by row, from its own random.Random seeded with
+(seed, dataset, table), so the same seed and row count always give the same data,
+whatever the target database or batch size. Primary keys run from 1 to the table's
+row count and are created parents first, so every foreign key points at an existing row.
+"""
+import datetime
+import random
+from typing import Callable, Dict, Iterator, NamedTuple, Tuple
+
+FIRST_NAMES = [
+    'Ana', 'Ben', 'Chen', 'Dara', 'Eli', 'Fatima', 'Gus', 'Hana', 'Ivan', 'Jia', 'Kofi', 'Lena',
+    'Mateo', 'Nina', 'Omar', 'Priya', 'Quinn', 'Rosa', 'Sam', 'Tariq', 'Uma', 'Viktor', 'Wen', 'Yara',
+]
+LAST_NAMES = [
+    'Adams', 'Brown', 'Costa', 'Dubois', 'Evans', 'Fischer', 'Garcia', 'Haddad', 'Ito', 'Jensen',
+    'Kim', 'Lopez', 'Moreau', 'Nguyen', 'Okafor', 'Patel', 'Rossi', 'Silva', 'Tanaka', 'Weber',
+]
+CITIES = ['Berlin', 'Chicago', 'Lagos', 'Lima', 'London', 'Mumbai', 'Osaka', 'Paris', 'Seoul', 'Toronto']
+
+_EPOCH = datetime.date(2015, 1, 1).toordinal()
+
+
+def _date(rng: random.Random, days: int = 3650) -> str:
+    return datetime.date.fromordinal(_EPOCH + rng.randrange(days)).isoformat()
+
+
+def _person(rng: random.Random, i: int, domain: str) -> Tuple[str, str, str]:
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    return first, last, f'{first.lower()}.{last.lower()}{i}@{domain}'
+
+
+class Table(NamedTuple):
+    name: str
+    columns: Tuple[str, ...]
+    # Share of the requested row count, and the minimum size for small runs
+    share: float
+    minimum: int
+    # (rng, 1-based id, row counts of every table) -> row
+    row: Callable[[random.Random, int, Dict[str, int]], tuple]
+
+
+class Dataset(NamedTuple):
+    name: str
+    display_name: str
+    description: str
+    tables_sql: str
+    indexes_sql: str
+    tables: Tuple[Table, ...]
+
+    def schema_sql(self, indexes: bool = True) -> str:
+        return self.tables_sql + ('\n' + self.indexes_sql if indexes else '')
+
+    def plan(self, rows: int) -> Dict[str, int]:
+        """Row count per table for about `rows` rows in total"""
+        return {t.name: max(t.minimum, int(rows * t.share)) for t in self.tables}
+
+    def generate(self, table: Table, seed: int, counts: Dict[str, int]) -> Iterator[tuple]:
+        rng = random.Random(f'{seed}:{self.name}:{table.name}')
+        row = table.row
+        for i in range(1, counts[table.name] + 1):
+            yield row(rng, i, counts)
+
+
+# HR
+
+def _department(rng, i, counts):
+    return i, f'Department {i}', rng.choice(CITIES), rng.randrange(100, 5000) * 1000
+
+
+def _employee(rng, i, counts):
+    first, last, email = _person(rng, i, 'corp.example.com')
+    # The first employees are the top of the hierarchy; everyone else reports to an earlier hire
+    manager = rng.randint(1, i - 1) if i > counts['departments'] else None
+    level = rng.choice(('Junior', 'Associate', 'Senior', 'Lead'))
+    title = f"{level} {rng.choice(('Analyst', 'Engineer', 'Designer', 'Manager', 'Accountant'))}"
+    return (i, first, last, email, rng.randint(1, counts['departments']), manager, title,
+            round(rng.uniform(35000, 180000), 2), _date(rng))
+
+
+def _project(rng, i, counts):
+    start = _date(rng)
+    return i, f'Project {i}', rng.randint(1, counts['departments']), start, rng.randrange(10, 500) * 1000
+
+
+def _assignment(rng, i, counts):
+    return (i, rng.randint(1, counts['employees']), rng.randint(1, counts['projects']),
+            rng.choice(('member', 'member', 'member', 'reviewer', 'owner')), rng.randint(1, 400))
+
+
+HR = Dataset(
+    name='hr',
+    display_name='HR',
+    description='Departments, employees with their managers, projects and project assignments',
+    tables_sql="""
+CREATE TABLE departments (id INT PRIMARY KEY, name VARCHAR(100) NOT NULL, location VARCHAR(50), budget INT);
+CREATE TABLE employees (
+    id INT PRIMARY KEY, first_name VARCHAR(50) NOT NULL, last_name VARCHAR(50) NOT NULL, email VARCHAR(100) NOT NULL,
+    department_id INT NOT NULL REFERENCES departments(id), manager_id INT REFERENCES employees(id),
+    job_title VARCHAR(50), salary DECIMAL(10,2), hire_date DATE
+);
+CREATE TABLE projects (
+    id INT PRIMARY KEY, name VARCHAR(100) NOT NULL, department_id INT NOT NULL REFERENCES departments(id),
+    start_date DATE, budget INT
+);
+CREATE TABLE project_assignments (
+    id INT PRIMARY KEY, employee_id INT NOT NULL REFERENCES employees(id),
+    project_id INT NOT NULL REFERENCES projects(id), role VARCHAR(20), hours INT
+);
+""".strip(),
+    indexes_sql="""
+CREATE INDEX employees_department_id ON employees (department_id);
+CREATE INDEX employees_manager_id ON employees (manager_id);
+CREATE INDEX projects_department_id ON projects (department_id);
+CREATE INDEX project_assignments_employee_id ON project_assignments (employee_id);
+CREATE INDEX project_assignments_project_id ON project_assignments (project_id);
+""".strip(),
+    tables=(
+        Table('departments', ('id', 'name', 'location', 'budget'), 0.0005, 5, _department),
+        Table('employees', ('id', 'first_name', 'last_name', 'email', 'department_id', 'manager_id',
+                            'job_title', 'salary', 'hire_date'), 0.4, 20, _employee),
+        Table('projects', ('id', 'name', 'department_id', 'start_date', 'budget'), 0.01, 5, _project),
+        Table('project_assignments', ('id', 'employee_id', 'project_id', 'role', 'hours'), 0.5895, 20, _assignment),
+    ),
+)
+
+
+# eCommerce
+
+CATEGORIES = ['Books', 'Electronics', 'Garden', 'Grocery', 'Home', 'Music', 'Outdoors', 'Sports', 'Toys', 'Clothing']
+
+
+def _customer(rng, i, counts):
+    first, last, email = _person(rng, i, 'mail.example.com')
+    return i, first, last, email, rng.choice(CITIES), _date(rng)
+
+
+def _product(rng, i, counts):
+    category = rng.choice(CATEGORIES)
+    return i, f'{category} item {i}', category, round(rng.uniform(1, 500), 2), rng.randint(0, 1000)
+
+
+def _order(rng, i, counts):
+    status = rng.choice(('delivered', 'delivered', 'delivered', 'shipped', 'pending', 'cancelled'))
+    return i, rng.randint(1, counts['customers']), _date(rng), status
+
+
+def _order_item(rng, i, counts):
+    return (i, rng.randint(1, counts['orders']), rng.randint(1, counts['products']), rng.randint(1, 5),
+            round(rng.uniform(1, 500), 2))
+
+
+ECOMMERCE = Dataset(
+    name='ecommerce',
+    display_name='eCommerce',
+    description='Customers, products, orders and order items',
+    tables_sql="""
+CREATE TABLE customers (
+    id INT PRIMARY KEY, first_name VARCHAR(50) NOT NULL, last_name VARCHAR(50) NOT NULL, email VARCHAR(100) NOT NULL,
+    city VARCHAR(50), signup_date DATE
+);
+CREATE TABLE products (
+    id INT PRIMARY KEY, name VARCHAR(100) NOT NULL, category VARCHAR(50), price DECIMAL(10,2), stock INT
+);
+CREATE TABLE orders (
+    id INT PRIMARY KEY, customer_id INT NOT NULL REFERENCES customers(id), order_date DATE, status VARCHAR(20)
+);
+CREATE TABLE order_items (
+    id INT PRIMARY KEY, order_id INT NOT NULL REFERENCES orders(id), product_id INT NOT NULL REFERENCES products(id),
+    quantity INT NOT NULL, unit_price DECIMAL(10,2) NOT NULL
+);
+""".strip(),
+    indexes_sql="""
+CREATE INDEX orders_customer_id ON orders (customer_id);
+CREATE INDEX order_items_order_id ON order_items (order_id);
+CREATE INDEX order_items_product_id ON order_items (product_id);
+""".strip(),
+    tables=(
+        Table('customers', ('id', 'first_name', 'last_name', 'email', 'city', 'signup_date'), 0.1, 20, _customer),
+        Table('products', ('id', 'name', 'category', 'price', 'stock'), 0.02, 10, _product),
+        Table('orders', ('id', 'customer_id', 'order_date', 'status'), 0.3, 20, _order),
+        Table('order_items', ('id', 'order_id', 'product_id', 'quantity', 'unit_price'), 0.58, 20, _order_item),
+    ),
+)
+
+
+# School
+
+SUBJECTS = ['Art', 'Biology', 'Chemistry', 'Computing', 'Economics', 'English', 'History', 'Math', 'Music', 'Physics']
+
+
+def _teacher(rng, i, counts):
+    first, last, email = _person(rng, i, 'school.example.com')
+    return i, first, last, email, rng.choice(SUBJECTS)
+
+
+def _student(rng, i, counts):
+    first, last, email = _person(rng, i, 'students.example.com')
+    return i, first, last, email, rng.randint(9, 12), _date(rng, 1460)
+
+
+def _course(rng, i, counts):
+    subject = rng.choice(SUBJECTS)
+    return i, f'{subject} {100 + i}', subject, rng.randint(1, counts['teachers']), rng.randint(1, 5)
+
+
+def _enrollment(rng, i, counts):
+    grade = rng.choice((None, 'A', 'A', 'B', 'B', 'B', 'C', 'C', 'D', 'F'))
+    return (i, rng.randint(1, counts['students']), rng.randint(1, counts['courses']),
+            rng.choice(('Fall', 'Spring')) + f' {rng.randint(2019, 2024)}', grade)
+
+
+SCHOOL = Dataset(
+    name='school',
+    display_name='School',
+    description='Teachers, students, courses and enrollments with grades',
+    tables_sql="""
+CREATE TABLE teachers (
+    id INT PRIMARY KEY, first_name VARCHAR(50) NOT NULL, last_name VARCHAR(50) NOT NULL, email VARCHAR(100) NOT NULL,
+    subject VARCHAR(50)
+);
+CREATE TABLE students (
+    id INT PRIMARY KEY, first_name VARCHAR(50) NOT NULL, last_name VARCHAR(50) NOT NULL, email VARCHAR(100) NOT NULL,
+    grade_level INT, enrolled_on DATE
+);
+CREATE TABLE courses (
+    id INT PRIMARY KEY, title VARCHAR(100) NOT NULL, subject VARCHAR(50), teacher_id INT NOT NULL REFERENCES teachers(id),
+    credits INT
+);
+CREATE TABLE enrollments (
+    id INT PRIMARY KEY, student_id INT NOT NULL REFERENCES students(id), course_id INT NOT NULL REFERENCES courses(id),
+    term VARCHAR(20), grade CHAR(1)
+);
+""".strip(),
+    indexes_sql="""
+CREATE INDEX courses_teacher_id ON courses (teacher_id);
+CREATE INDEX enrollments_student_id ON enrollments (student_id);
+CREATE INDEX enrollments_course_id ON enrollments (course_id);
+""".strip(),
+    tables=(
+        Table('teachers', ('id', 'first_name', 'last_name', 'email', 'subject'), 0.005, 5, _teacher),
+        Table('students', ('id', 'first_name', 'last_name', 'email', 'grade_level', 'enrolled_on'), 0.2, 20, _student),
+        Table('courses', ('id', 'title', 'subject', 'teacher_id', 'credits'), 0.01, 10, _course),
+        Table('enrollments', ('id', 'student_id', 'course_id', 'term', 'grade'), 0.785, 20, _enrollment),
+    ),
+)
+
+DATASETS: Dict[str, Dataset] = {d.name: d for d in (HR, ECOMMERCE, SCHOOL)}
+
+# First line of a generated DatabaseSchema's seed_sql, which only records how to regenerate it
+GENERATED_MARKER = '-- Generated by: manage.py generate_dataset'
+
+
+def is_generated(schema) -> bool:
+    """Whether generate_dataset wrote the schema's data, so its seed_sql holds no rows"""
+    return (schema.seed_sql or '').startswith(GENERATED_MARKER)
+
+
+def size_label(rows: int) -> str:
+    """10000 -> '10k', 2500000 -> '2_5m'"""
+    for unit, size in (('m', 1_000_000), ('k', 1_000)):
+        if rows >= size:
+            return f'{rows / size:g}'.replace('.', '_') + unit
+    return str(rows)
@@ -1,138 +1,272 @@
-import pymysql
+import hashlib
+import logging
+import threading
 import time
-from typing import Dict, List, Tuple
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
 from django.conf import settings
+from chatsql.metrics import timed
+from .backends import BackendError, Overflow, get_backend
+from .query_cache import get_cached_query_result, query_cache_key, store_query_result
+from .slow_queries import log_slow_query, slow_query_threshold
+from .sql_validator import has_top_level_order_by, top_level_order_by, validate_sql
+
+logger = logging.getLogger(__name__)
+
+
+class QueryLimitExceeded(Exception):
+    """Raised when a query is refused by the QueryGovernor before it runs"""
+
+
+class QueryGovernor:
+    """
+    Resource limits for student queries so one runaway query can't starve the shared server:
+    - a server-side per-statement time limit (MySQL MAX_EXECUTION_TIME, SQLite progress handler)
+    - a row-scan cap (MySQL max_join_size, SQLite VM step budget) and a row-count cap
+    - a cap on concurrently running queries per session
+    - KILL QUERY on the server when the client side gives up waiting
+    """
+    
+    DEFAULTS = {
+        'STATEMENT_TIMEOUT': 5,             # seconds
+        'MAX_JOIN_SIZE': 1000000,           # rows MySQL may estimate to examine
+        'MAX_RESULT_ROWS': 1001,            # sql_select_limit; MAX_ROWS + 1 so truncation is detectable
+        'MAX_SPILL_ROWS': 100000,           # rows fetched in all when a result is spilled for paging
+        'MAX_CONCURRENT_PER_SESSION': 2,
+        'SQLITE_MAX_STEPS': 50000000,       # virtual machine instructions per statement
+        'SQLITE_CHECK_INTERVAL': 10000,     # instructions between progress handler calls
+    }
+    
+    def __init__(self, **options):
+        conf = {**self.DEFAULTS, **options}
+        self.statement_timeout = float(conf['STATEMENT_TIMEOUT'])
+        self.max_join_size = int(conf['MAX_JOIN_SIZE'])
+        self.max_result_rows = int(conf['MAX_RESULT_ROWS'])
+        self.max_spill_rows = int(conf['MAX_SPILL_ROWS'])
+        self.max_concurrent_per_session = int(conf['MAX_CONCURRENT_PER_SESSION'])
+        self.sqlite_max_steps = int(conf['SQLITE_MAX_STEPS'])
+        self.sqlite_check_interval = int(conf['SQLITE_CHECK_INTERVAL'])
+        self._running = defaultdict(int)
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def session_slot(self, session_key: Optional[str]):
+        """Hold one of the session's concurrent-query slots; queries without a session are not limited"""
+        if session_key is None:
+            yield
+            return
+        with self._lock:
+            if self._running[session_key] >= self.max_concurrent_per_session:
+                raise QueryLimitExceeded(
+                    'Too many queries running for this session; wait for the previous one to finish'
+                )
+            self._running[session_key] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._running[session_key] -= 1
+                if not self._running[session_key]:
+                    del self._running[session_key]
+    
+    def mysql_init_command(self) -> str:
+        """Session settings applied once to every pooled MySQL connection"""
+        return (
+            f"SET SESSION MAX_EXECUTION_TIME = {int(self.statement_timeout * 1000)}, "
+            f"SESSION max_join_size = {self.max_join_size}, "
+            f"SESSION sql_select_limit = {self.max_result_rows}"
+        )
+    
+    def kill_mysql_query(self, pool, thread_id: int):
+        """Stop a statement the client abandoned so it doesn't keep burning server CPU"""
+        try:
+            with pool.connection() as conn, conn.cursor() as cursor:
+                cursor.execute('KILL QUERY %s', (thread_id,))
+        except Exception:
+            logger.warning('Could not kill query on %s (thread %s)', pool.alias, thread_id, exc_info=True)
+    
+    @contextmanager
+    def sqlite_limits(self, raw_connection):
+        """Abort SQLite statements past the time limit or step budget via a progress handler"""
+        deadline = time.monotonic() + self.statement_timeout
+        max_calls = max(1, self.sqlite_max_steps // self.sqlite_check_interval)
+        calls = 0
+        
+        def handler():
+            nonlocal calls
+            calls += 1
+            # Non-zero aborts the statement with "interrupted"
+            return calls > max_calls or time.monotonic() > deadline
+        
+        raw_connection.set_progress_handler(handler, self.sqlite_check_interval)
+        try:
+            yield
+        finally:
+            raw_connection.set_progress_handler(None, 0)
+
+
+_governor = None
+
+
+def get_governor() -> QueryGovernor:
+    global _governor
+    if _governor is None:
+        _governor = QueryGovernor(**{
+            'STATEMENT_TIMEOUT': SQLExecutor.MAX_EXECUTION_TIME,
+            'MAX_RESULT_ROWS': SQLExecutor.MAX_ROWS + 1,
+            'MAX_SPILL_ROWS': getattr(settings, 'RESULT_SPILL_MAX_ROWS', 100000),
+            **getattr(settings, 'PRACTICE_QUERY_LIMITS', {}),
+        })
+    return _governor
+
 
 class SQLExecutor:
     """Secure SQL query executor for practice databases"""
     
-    DANGEROUS_KEYWORDS = [
-        'DROP', 'DELETE', 'UPDATE', 'INSERT', 'ALTER', 
-        'CREATE', 'TRUNCATE', 'GRANT', 'REVOKE', 'EXEC'
-    ]
-    
     MAX_EXECUTION_TIME = 5  # seconds
     MAX_ROWS = 1000
     
-    def __init__(self, db_name: str):
+    def __init__(self, db_name: str, schema=None, exercise_id: int = None):
         """
         Initialize executor for specific practice database
         Args:
             db_name: 'practice_hr', 'practice_ecommerce', or 'practice_school'
+            schema: the DatabaseSchema, used by backends that build the database from it
+            exercise_id: recorded with slow queries (see slow_queries.log_slow_query)
+        The backend (MySQL, SQLite file, in-memory sandbox, mock) is chosen per db_name;
+        see backends.backend_config. Raises BackendError if the database can't be served at all.
         """
-        if db_name not in settings.DATABASES:
-            raise ValueError(f"Invalid database: {db_name}")
-        
-        self.db_config = settings.DATABASES[db_name]
         self.db_name = db_name
+        self.exercise_id = exercise_id
+        self.governor = get_governor()
+        self.backend = get_backend(db_name, schema, self.governor)
     
     def validate_query(self, query: str) -> Tuple[bool, str]:
         """
-        Validate SQL query for security
+        Validate SQL query for security (see sql_validator.validate_sql)
         Returns: (is_valid, error_message)
         """
-        query_upper = query.strip().upper()
-        
-        # Must start with SELECT
-        if not query_upper.startswith('SELECT'):
-            return False, "Only SELECT queries are allowed"
-        
-        # Check for dangerous keywords
-        for keyword in self.DANGEROUS_KEYWORDS:
-            if keyword in query_upper:
-                return False, f"Keyword '{keyword}' is not allowed"
-        
-        # Check for comment-based injection
-        if '--' in query or '/*' in query or '*/' in query:
-            return False, "Comments are not allowed in queries"
-        
-        # Check for semicolon (multiple statements)
-        if query.count(';') > 1:
-            return False, "Multiple statements are not allowed"
-        
-        return True, ""
+        verdict = validate_sql(query, dialect=self.backend.dialect)
+        return verdict.valid, verdict.message
     
-    def execute(self, query: str) -> Dict:
+    def execute(self, query: str, session_key: str = None, overflow: Optional[Overflow] = None) -> Dict:
         """
         Execute SQL query and return results
+        Args:
+            session_key: caller's session, used for the per-session concurrency limit
+            overflow: given rows past MAX_ROWS while the query is still being read (see
+                ExecutorBackend.run); returns (rows it took, whether rows were left over), or None
         Returns: {
             'success': bool,
             'columns': List[str],
             'rows': List[List],
             'row_count': int,
+            'truncated': bool (the query returned more than MAX_ROWS rows; only MAX_ROWS are kept),
+            'total_estimate': int or None (total rows; when truncated, the rows `overflow` took),
+            'total_is_lower_bound': bool (rows were left over past total_estimate),
             'execution_time': float,
+            'cached': bool (served from the query result cache),
             'error': str (if failed)
         }
         """
         # Validate query
-        is_valid, error = self.validate_query(query)
-        if not is_valid:
+        verdict = validate_sql(query, dialect=self.backend.dialect)
+        if not verdict.valid:
             return {
                 'success': False,
-                'error': error,
+                'error': verdict.message,
+                'validation_errors': [e.as_dict() for e in verdict.errors],
                 'columns': [],
                 'rows': [],
                 'row_count': 0,
                 'execution_time': 0
             }
         
-        connection = None
         start_time = time.time()
         
-        try:
-            # Connect to database
-            connection = pymysql.connect(
-                host=self.db_config['HOST'],
-                user=self.db_config['USER'],
-                password=self.db_config['PASSWORD'],
-                database=self.db_config['NAME'],
-                port=int(self.db_config.get('PORT', 3306)),
-                connect_timeout=5,
-                read_timeout=self.MAX_EXECUTION_TIME,
-                cursorclass=pymysql.cursors.DictCursor
-            )
-            
-            with connection.cursor() as cursor:
-                # Execute query with timeout
-                cursor.execute(query)
-                
-                # Fetch results (limited)
-                rows = cursor.fetchmany(self.MAX_ROWS)
-                
-                # Get column names
-                columns = [desc[0] for desc in cursor.description] if cursor.description else []
-                
-                # Convert to list of lists for JSON serialization
-                row_list = [list(row.values()) for row in rows]
-                
-                execution_time = time.time() - start_time
-                
-                return {
-                    'success': True,
-                    'columns': columns,
-                    'rows': row_list,
-                    'row_count': len(row_list),
-                    'execution_time': round(execution_time, 3),
-                    'error': None
-                }
+        cache_key = query_cache_key(self.backend, query)
+        cached = get_cached_query_result(cache_key, query)
+        # The cache keeps MAX_ROWS rows, so a truncated result runs again for the overflow
+        if cached is not None and not (overflow is not None and cached['truncated']):
+            return {
+                'success': True,
+                'columns': list(cached['columns']),
+                'rows': cached['rows'],
+                'row_count': len(cached['rows']),
+                'truncated': cached['truncated'],
+                'total_estimate': cached['total_estimate'],
+                'total_is_lower_bound': cached['total_is_lower_bound'],
+                'execution_time': round(time.time() - start_time, 3),
+                'cached': True,
+                'error': None
+            }
         
-        except pymysql.MySQLError as e:
+        taken = []
+
+        def take(columns, rows, rest):
+            taken.append(overflow(columns, rows, rest))
+
+        try:
+            with self.governor.session_slot(session_key), timed('practice_db'):
+                if overflow is None:
+                    # One extra row tells a full result from a truncated one
+                    columns, row_list = self.backend.run(query, self.MAX_ROWS + 1)
+                else:
+                    columns, row_list = self.backend.run(query, self.MAX_ROWS, take)
+        except (BackendError, QueryLimitExceeded) as e:
+            execution_time = time.time() - start_time
+            self._check_slow(query, execution_time, error=str(e))
             return {
                 'success': False,
                 'error': str(e),
                 'columns': [],
                 'rows': [],
                 'row_count': 0,
-                'execution_time': round(time.time() - start_time, 3)
+                'execution_time': round(execution_time, 3)
             }
         
-        finally:
-            if connection:
-                connection.close()
+        truncated = bool(taken) or len(row_list) > self.MAX_ROWS
+        row_list = row_list[:self.MAX_ROWS]
+        if not truncated:
+            total_estimate, lower_bound = len(row_list), False
+        elif taken and taken[0] is not None:
+            total_estimate, lower_bound = taken[0]
+        else:
+            total_estimate, lower_bound = None, False
+
+        execution_time = time.time() - start_time
+        self._check_slow(query, execution_time, row_count=len(row_list))
+        store_query_result(cache_key, query, columns, row_list, truncated, total_estimate, lower_bound)
+        
+        return {
+            'success': True,
+            'columns': columns,
+            'rows': row_list,
+            'row_count': len(row_list),
+            'truncated': truncated,
+            'total_estimate': total_estimate,
+            'total_is_lower_bound': lower_bound,
+            'execution_time': round(execution_time, 3),
+            'cached': False,
+            'error': None
+        }
+    
+    def _check_slow(self, query: str, execution_time: float, row_count: int = 0, error: str = None):
+        threshold = slow_query_threshold()
+        if threshold is not None and execution_time >= threshold:
+            log_slow_query(self.backend, query, self.exercise_id, execution_time, row_count, error)
     
-    def compare_results(self, user_result: Dict, expected_result: Dict) -> Dict:
+    @classmethod
+    def compare_results(cls, user_result: Dict, expected_result: Dict, ordered: bool = False,
+                        order_by: Optional[List] = None) -> Dict:
         """
         Compare user query result with expected result
+        Rows are compared as a multiset of 64-bit row digests with columns matched
+        by name. When `ordered` is set (expected query has ORDER BY), `order_by` holds its
+        items (see sql_validator.top_level_order_by): rows must follow the order of those sort
+        keys, while rows that tie on them may come in any order. If no sort key maps onto the
+        expected columns, order is not checked.
         Returns: {
             'correct': bool,
             'message': str,
@@ -160,6 +294,14 @@ class SQLExecutor:
                 }
             }
         
+        positions = cls._column_positions(user_result['columns'], expected_result['columns'])
+        if positions is None:
+            return {
+                'correct': False,
+                'message': 'Column names do not match',
+                'diff': {'duplicate_columns': True}
+            }
+        
         # Compare row count
         if user_result['row_count'] != expected_result['row_count']:
             return {
@@ -168,16 +310,28 @@ class SQLExecutor:
                 'diff': None
             }
         
-        # Compare actual data (normalize for comparison)
-        user_data_normalized = self._normalize_result(user_result)
-        expected_data_normalized = self._normalize_result(expected_result)
+        expected_rows = expected_result['rows']
+        identity = range(len(expected_result['columns']))
         
-        if user_data_normalized != expected_data_normalized:
-            return {
-                'correct': False,
-                'message': 'Query results do not match expected output',
-                'diff': None
-            }
+        sort_key = cls._sort_key_positions(order_by or [], expected_result['columns']) if ordered else []
+        if sort_key:
+            mismatch = cls._first_ordered_mismatch(user_result['rows'], positions, expected_rows, identity, sort_key)
+            if mismatch is not None:
+                same_rows = cls._first_unordered_mismatch(user_result['rows'], positions, expected_rows, identity) is None
+                return {
+                    'correct': False,
+                    'message': 'Rows are not in the expected order' if same_rows
+                    else 'Query results do not match expected output',
+                    'diff': {'first_mismatch': mismatch}
+                }
+        else:
+            mismatch = cls._first_unordered_mismatch(user_result['rows'], positions, expected_rows, identity)
+            if mismatch is not None:
+                return {
+                    'correct': False,
+                    'message': 'Query results do not match expected output',
+                    'diff': {'first_mismatch': mismatch}
+                }
         
         return {
             'correct': True,
@@ -185,11 +339,112 @@ class SQLExecutor:
             'diff': None
         }
     
-    def _normalize_result(self, result: Dict) -> set:
-        """Normalize result for comparison (handle row order)"""
-        rows = []
-        for row in result['rows']:
-            # Convert each row to tuple (hashable) and sort
-            row_tuple = tuple(sorted(str(val) for val in row))
-            rows.append(row_tuple)
-        return set(rows)
+    @staticmethod
+    def _column_positions(user_columns: List[str], expected_columns: List[str]) -> Optional[List[int]]:
+        """
+        Map each expected column to its index in the user result, by name.
+        Repeated names (e.g. two `id` columns from a join) are matched in order.
+        Returns None if the column multisets differ.
+        """
+        indices = defaultdict(deque)
+        for i, name in enumerate(user_columns):
+            indices[name].append(i)
+        positions = []
+        for name in expected_columns:
+            if not indices[name]:
+                return None
+            positions.append(indices[name].popleft())
+        if any(indices.values()):
+            return None
+        return positions
+    
+    @staticmethod
+    def _row_digest(row, positions) -> int:
+        """64-bit digest of a row's values, taken in expected-column order"""
+        h = hashlib.blake2b(digest_size=8)
+        for i in positions:
+            val = row[i]
+            # Length-prefix each value so ('ab', 'c') and ('a', 'bc') hash differently
+            text = '\x00' if val is None else str(val)
+            h.update(f'{len(text)}:{text};'.encode('utf-8', 'surrogatepass'))
+        return int.from_bytes(h.digest(), 'little')
+    
+    @staticmethod
+    def _sort_key_positions(order_by: List, columns: List[str]) -> List[int]:
+        """
+        Expected-column indices of the longest ORDER BY prefix that names result columns
+        (by name, case-insensitively and unambiguously, or by position)
+        """
+        lowered = [c.lower() for c in columns]
+        key = []
+        for item in order_by:
+            if isinstance(item, int):
+                if not 1 <= item <= len(columns):
+                    break
+                key.append(item - 1)
+            elif item is not None and lowered.count(item.lower()) == 1:
+                key.append(lowered.index(item.lower()))
+            else:
+                break
+        return key
+    
+    @classmethod
+    def _first_ordered_mismatch(cls, user_rows, positions, expected_rows, identity, sort_key) -> Optional[Dict]:
+        """
+        Walk both results in lockstep, one run of expected rows with equal sort keys at a time.
+        Rows in a run tie, so the run is compared as a multiset; order is only enforced between runs.
+        """
+        total = min(len(user_rows), len(expected_rows))
+        start = 0
+        while start < total:
+            run_key = cls._row_digest(expected_rows[start], sort_key)
+            end = start + 1
+            while end < total and cls._row_digest(expected_rows[end], sort_key) == run_key:
+                end += 1
+            run = expected_rows[start:end]
+            remaining = Counter(cls._row_digest(row, identity) for row in run)
+            for index in range(start, end):
+                user_row = user_rows[index]
+                digest = cls._row_digest(user_row, positions)
+                if remaining[digest] == 0:
+                    expected_row = next(row for row in run if remaining[cls._row_digest(row, identity)] > 0)
+                    return {
+                        'row_index': index,
+                        'expected_row': list(expected_row),
+                        'actual_row': [user_row[i] for i in positions]
+                    }
+                remaining[digest] -= 1
+            start = end
+        return None
+    
+    @classmethod
+    def _first_unordered_mismatch(cls, user_rows, positions, expected_rows, identity) -> Optional[Dict]:
+        """
+        Multiset comparison: count expected row digests, then consume them with the
+        user rows and stop at the first user row that has no remaining match.
+        Assumes both results have the same row count.
+        """
+        remaining = Counter(cls._row_digest(row, identity) for row in expected_rows)
+        for user_row in user_rows:
+            digest = cls._row_digest(user_row, positions)
+            if remaining[digest] == 0:
+                # Equal row counts, so at least one expected row is still unmatched
+                missing = next(
+                    row for row in expected_rows if remaining[cls._row_digest(row, identity)] > 0
+                )
+                return {
+                    'unexpected_row': [user_row[i] for i in positions],
+                    'missing_row': list(missing)
+                }
+            remaining[digest] -= 1
+        return None
+    
+    @staticmethod
+    def has_order_by(query: str) -> bool:
+        """True if the query has an ORDER BY outside of any parentheses or string literals"""
+        return has_top_level_order_by(query)
+    
+    @staticmethod
+    def order_by_items(query: str) -> Optional[List]:
+        """The query's top-level ORDER BY items, or None without one (see sql_validator.top_level_order_by)"""
+        return top_level_order_by(query)
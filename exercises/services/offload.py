@@ -0,0 +1,62 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict
+
+from django.conf import settings
+from django.db import close_old_connections
+
+_executors: Dict[str, ThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+
+# name -> (settings attribute for the worker count, default)
+POOLS = {
+    'offload': ('ASYNC_OFFLOAD_WORKERS', 32),
+    'parallel': ('PARALLEL_QUERY_WORKERS', 16),
+}
+
+
+def _get_executor(name: str) -> ThreadPoolExecutor:
+    executor = _executors.get(name)
+    if executor is None:
+        with _executors_lock:
+            executor = _executors.get(name)
+            if executor is None:
+                setting, default = POOLS[name]
+                executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, setting, default),
+                    thread_name_prefix=f'chatsql-{name}'
+                )
+                _executors[name] = executor
+    return executor
+
+
+def _call(func, args, kwargs):
+    try:
+        return func(*args, **kwargs)
+    finally:
+        # Worker threads outlive the request, so drop their DB connections like a request would
+        close_old_connections()
+
+
+async def run_offloaded(func, *args, **kwargs):
+    """
+    Run blocking work (DB queries, AI calls) on the bounded offload pool.
+    Coroutines beyond ASYNC_OFFLOAD_WORKERS wait for a free thread without holding one.
+    """
+    loop = asyncio.get_running_loop()
+    # Carry context variables (e.g. the request's metrics) into the worker thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        _get_executor('offload'), functools.partial(context.run, _call, func, args, kwargs)
+    )
+
+
+def run_in_parallel(func, *args, **kwargs) -> Future:
+    """
+    Start blocking work on the parallel-query pool and return its Future.
+    Kept separate from the offload pool so offloaded requests can fan out without deadlocking it.
+    """
+    return _get_executor('parallel').submit(contextvars.copy_context().run, _call, func, args, kwargs)
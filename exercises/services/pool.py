@@ -0,0 +1,217 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+import pymysql
+from django.conf import settings
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the wait timeout"""
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of pymysql connections for one practice database"""
+
+    DEFAULTS = {
+        'MAX_SIZE': 10,           # open connections per alias
+        'MAX_IDLE_TIME': 300,     # seconds before an idle connection is evicted
+        'WAIT_TIMEOUT': 3,        # seconds to wait for a free connection
+        'HEALTH_CHECK_AFTER': 30, # ping connections idle for longer than this
+    }
+
+    def __init__(self, alias: str, db_config: Dict, connect_kwargs: Dict = None, **options):
+        """
+        Args:
+            alias: settings.DATABASES key, e.g. 'practice_hr'
+            db_config: the settings.DATABASES entry for the alias
+            connect_kwargs: extra keyword arguments for pymysql.connect
+            options: overrides for DEFAULTS (MAX_SIZE, MAX_IDLE_TIME, ...)
+        """
+        self.alias = alias
+        self.db_config = db_config
+        self.connect_kwargs = connect_kwargs or {}
+        conf = {**self.DEFAULTS, **options}
+        self.max_size = int(conf['MAX_SIZE'])
+        self.max_idle_time = float(conf['MAX_IDLE_TIME'])
+        self.wait_timeout = float(conf['WAIT_TIMEOUT'])
+        self.health_check_after = float(conf['HEALTH_CHECK_AFTER'])
+
+        self._idle = []  # stack of (connection, last_used); most recently used last
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self._metrics = {
+            'created': 0,
+            'reused': 0,
+            'discarded': 0,
+            'evicted': 0,
+            'health_check_failures': 0,
+            'timeouts': 0,
+            'total_wait_time': 0.0,
+        }
+
+    def _connect(self):
+        return pymysql.connect(
+            host=self.db_config['HOST'],
+            user=self.db_config['USER'],
+            password=self.db_config['PASSWORD'],
+            database=self.db_config['NAME'],
+            port=int(self.db_config.get('PORT') or 3306),
+            **self.connect_kwargs
+        )
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _evict_idle(self, now: float) -> list:
+        """Drop connections idle past MAX_IDLE_TIME. Caller holds the lock."""
+        stale = [c for c, last_used in self._idle if now - last_used > self.max_idle_time]
+        if stale:
+            self._idle = [(c, t) for c, t in self._idle if now - t <= self.max_idle_time]
+            self._metrics['evicted'] += len(stale)
+        return stale
+
+    def _is_healthy(self, conn, last_used: float, now: float) -> bool:
+        if now - last_used < self.health_check_after:
+            return True
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            self._count('health_check_failures')
+            return False
+
+    def acquire(self):
+        """Borrow a connection, opening a new one if below MAX_SIZE"""
+        start = time.monotonic()
+        deadline = start + self.wait_timeout
+        stale = []
+        try:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    stale.extend(self._evict_idle(now))
+                    if self._idle:
+                        conn, last_used = self._idle.pop()
+                        self._in_use += 1
+                        break
+                    if self._in_use < self.max_size:
+                        conn, last_used = None, None
+                        self._in_use += 1
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._metrics['timeouts'] += 1
+                        raise PoolTimeout(
+                            f"No connection available for '{self.alias}' within {self.wait_timeout}s"
+                        )
+                    self._cond.wait(remaining)
+                self._metrics['total_wait_time'] += time.monotonic() - start
+        finally:
+            for c in stale:
+                self._close_quietly(c)
+
+        # Health checks and connects happen outside the lock
+        try:
+            if conn is not None:
+                if self._is_healthy(conn, last_used, time.monotonic()):
+                    self._count('reused')
+                    return conn
+                self._close_quietly(conn)
+                self._count('discarded')
+            conn = self._connect()
+            self._count('created')
+            return conn
+        except Exception:
+            self._release_slot()
+            raise
+
+    def _count(self, name: str):
+        with self._cond:
+            self._metrics[name] += 1
+
+    def _release_slot(self):
+        with self._cond:
+            self._in_use -= 1
+            self._cond.notify()
+
+    def release(self, conn, discard: bool = False):
+        """Return a borrowed connection; broken connections should be discarded"""
+        if discard or not conn.open:
+            self._close_quietly(conn)
+            with self._cond:
+                self._metrics['discarded'] += 1
+                self._in_use -= 1
+                self._cond.notify()
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._in_use -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a with-block"""
+        conn = self.acquire()
+        discard = False
+        try:
+            yield conn
+        except pymysql.MySQLError:
+            # The session state is unknown after a driver error; don't hand it out again
+            discard = True
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    def close(self):
+        """Close all idle connections (borrowed ones are closed on release)"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    def metrics(self) -> Dict:
+        with self._cond:
+            return {
+                **self._metrics,
+                'alias': self.alias,
+                'max_size': self.max_size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+            }
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias: str, **connect_kwargs) -> ConnectionPool:
+    """Return the process-wide pool for a settings.DATABASES alias, creating it on first use"""
+    pool = _pools.get(alias)
+    if pool is not None:
+        return pool
+    with _pools_lock:
+        pool = _pools.get(alias)
+        if pool is None:
+            options = getattr(settings, 'PRACTICE_DB_POOL', {})
+            pool = ConnectionPool(alias, settings.DATABASES[alias], connect_kwargs, **options)
+            _pools[alias] = pool
+        return pool
+
+
+def pool_metrics() -> Dict[str, Dict]:
+    """Metrics for every pool opened in this process, keyed by alias"""
+    return {alias: pool.metrics() for alias, pool in list(_pools.items())}
+
+
+def close_all_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
@@ -0,0 +1,157 @@
+import bisect
+import time
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from chatsql.metrics import cache_lookup
+from ..models import UserProgress
+from .write_behind import CoalescingWriter
+
+KEY_PREFIX = 'progress'
+
+
+def _version_key(session_id: str) -> str:
+    return f'{KEY_PREFIX}:{session_id}:version'
+
+
+def _cache_key(session_id: str, version: int) -> str:
+    return f'{KEY_PREFIX}:{session_id}:{version}'
+
+
+def _timeout() -> int:
+    return getattr(settings, 'PROGRESS_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def _version(session_id: str) -> int:
+    """The session's current progress version; bumping it invalidates the cached entry"""
+    key = _version_key(session_id)
+    version = cache.get(key)
+    if version is None:
+        # Start from a fresh value, so an entry cached under an evicted version is never read again
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def _load(session_id: str) -> Dict:
+    """
+    One query for all of a session's progress rows.
+    completed is the sorted list of solved exercise ids.
+    """
+    completed = []
+    attempts = {}
+    rows = UserProgress.objects.filter(session_id=session_id).values_list('exercise_id', 'completed', 'attempts')
+    for exercise_id, done, count in rows:
+        if done:
+            completed.append(exercise_id)
+        if count:
+            attempts[exercise_id] = count
+    return {'completed': sorted(completed), 'attempts': attempts}
+
+
+def get_session_progress(session_id: Optional[str]) -> Dict:
+    """Return {'completed': [exercise_id, ...], 'attempts': {exercise_id: n}} for a session, cached"""
+    if not session_id:
+        return {'completed': [], 'attempts': {}}
+    key = _cache_key(session_id, _version(session_id))
+    progress = cache.get(key)
+    cache_lookup('progress', progress is not None)
+    if progress is None:
+        progress = _load(session_id)
+        # A write that lands after the load bumps the version, so this entry is never read stale
+        cache.set(key, progress, _timeout())
+    return _with_pending(session_id, progress)
+
+
+def _with_pending(session_id: str, progress: Dict) -> Dict:
+    """
+    Add the session's attempts still buffered in attempt_writer. The cached entry only
+    holds what is in the database, so it is copied rather than changed.
+    """
+    pending = [(key[1], item['attempts']) for key, item in attempt_writer.snapshot() if key[0] == session_id]
+    if not pending:
+        return progress
+    attempts = dict(progress['attempts'])
+    for exercise_id, count in pending:
+        attempts[exercise_id] = attempts.get(exercise_id, 0) + count
+    return {'completed': progress['completed'], 'attempts': attempts}
+
+
+def is_completed(progress: Dict, exercise_id: int) -> bool:
+    completed = progress['completed']
+    i = bisect.bisect_left(completed, exercise_id)
+    return i < len(completed) and completed[i] == exercise_id
+
+
+def _invalidate(session_id: str):
+    # incr is atomic, unlike patching the cached entry in place, so concurrent writers
+    # can't lose each other's updates; the next read rebuilds from the database
+    try:
+        cache.incr(_version_key(session_id))
+    except ValueError:
+        pass  # no version yet, so nothing is cached for the session
+
+
+def mark_completed(session_id: str, exercise_id: int):
+    """Invalidate the session's cached progress after a correct submission"""
+    _invalidate(session_id)
+
+
+def forget_session_progress(session_id: str):
+    _invalidate(session_id)
+
+
+def _merge_attempts(old: Dict, new: Dict) -> Dict:
+    return {'attempts': old['attempts'] + new['attempts'], 'last_query': new['last_query']}
+
+
+def _write_attempts(batch: Dict[Tuple[str, int], Dict]):
+    """
+    Apply buffered attempts as one bulk upsert: create any missing rows with attempts=0,
+    then add each delta with F('attempts') so concurrent writers never lose increments.
+    """
+    sessions = {session_id for session_id, _ in batch}
+    exercise_ids = {exercise_id for _, exercise_id in batch}
+
+    def existing():
+        rows = UserProgress.objects.filter(session_id__in=sessions, exercise_id__in=exercise_ids)
+        return {(up.session_id, up.exercise_id): up for up in rows.only('id', 'session_id', 'exercise_id')}
+
+    with transaction.atomic():
+        rows = existing()
+        missing = [key for key in batch if key not in rows]
+        if missing:
+            UserProgress.objects.bulk_create(
+                [UserProgress(session_id=s, exercise_id=e, attempts=0) for s, e in missing],
+                ignore_conflicts=True
+            )
+            rows = existing()
+
+        now = timezone.now()
+        updates = []
+        for key, delta in batch.items():
+            up = rows.get(key)
+            if up is None:  # the exercise was deleted meanwhile
+                continue
+            up.attempts = F('attempts') + delta['attempts']
+            up.last_query = delta['last_query']
+            up.updated_at = now
+            updates.append(up)
+        UserProgress.objects.bulk_update(updates, ['attempts', 'last_query', 'updated_at'], batch_size=500)
+
+    # Only now do the cached entries lag the database; until here readers added the buffered counts
+    for session_id in sessions:
+        _invalidate(session_id)
+
+
+attempt_writer = CoalescingWriter('progress', _write_attempts, _merge_attempts)
+
+
+def queue_attempt(session_id: str, exercise_id: int, query: str):
+    """Count an attempt without a database write on the request path"""
+    attempt_writer.add((session_id, exercise_id), {'attempts': 1, 'last_query': query})
@@ -0,0 +1,139 @@
+import hashlib
+import pickle
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from django.conf import settings
+
+from chatsql.metrics import cache_lookup
+from .result_cache import schema_version
+from .sql_validator import canonical_query
+
+# Result columns named like this come from the schema or an alias, not from how the
+# select-list expression was typed, so any spelling of the query produces them
+_PLAIN_COLUMN_RE = re.compile(r'^\w+$')
+
+
+class QueryResultCache:
+    """
+    In-process LRU of successful practice query results, bounded by their total pickled size.
+    Keys combine the practice database, the schema version and the canonical query text, so
+    reseeding or editing a schema starts a fresh set of entries and old ones age out.
+    """
+
+    def __init__(self, max_bytes: int, max_entry_bytes: int, timeout: float):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.timeout = timeout
+        self._data = OrderedDict()  # key -> (expires, size, entry)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str, query: str) -> Optional[Dict]:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] <= now:
+                self._discard(key)
+                item = None
+            entry = item[2] if item is not None else None
+            # Unaliased expressions (COUNT(*), price * 2) take their column name from the query
+            # as typed, so those entries only serve the exact text that produced them
+            if entry is not None and entry['query'] != query and not entry['plain_columns']:
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, query: str, columns, rows, truncated: bool = False, total_estimate: int = None,
+            total_is_lower_bound: bool = False):
+        entry = {
+            'query': query,
+            'columns': columns,
+            'rows': rows,
+            'truncated': truncated,
+            'total_estimate': total_estimate,
+            'total_is_lower_bound': total_is_lower_bound,
+            'plain_columns': all(_PLAIN_COLUMN_RE.match(str(name)) for name in columns),
+        }
+        size = len(pickle.dumps((columns, rows), pickle.HIGHEST_PROTOCOL))
+        if size > self.max_entry_bytes:
+            return
+        with self._lock:
+            self._discard(key)
+            self._data[key] = (time.monotonic() + self.timeout, size, entry)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._data:
+                self._discard(next(iter(self._data)))
+                self.evictions += 1
+
+    def _discard(self, key: str):
+        item = self._data.pop(key, None)
+        if item is not None:
+            self._bytes -= item[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._data),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_query_cache() -> QueryResultCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = QueryResultCache(
+                    max_bytes=int(getattr(settings, 'QUERY_RESULT_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+                    max_entry_bytes=int(getattr(settings, 'QUERY_RESULT_CACHE_MAX_ENTRY_BYTES', 1024 * 1024)),
+                    timeout=float(getattr(settings, 'QUERY_RESULT_CACHE_TIMEOUT', 60 * 60)),
+                )
+    return _cache
+
+
+def query_cache_key(backend, query: str) -> Optional[str]:
+    """Cache key for a query on a backend, or None if its results can't be cached"""
+    if not getattr(settings, 'QUERY_RESULT_CACHE_ENABLED', True) or not backend.cacheable or backend.schema is None:
+        return None
+    digest = hashlib.blake2b(canonical_query(query).encode('utf-8', 'surrogatepass'), digest_size=16).hexdigest()
+    return f'{backend.db_name}:{schema_version(backend.schema)}:{digest}'
+
+
+def get_cached_query_result(key: Optional[str], query: str) -> Optional[Dict]:
+    if key is None:
+        return None
+    entry = get_query_cache().get(key, query)
+    cache_lookup('query_result', entry is not None)
+    return entry
+
+
+def store_query_result(key: Optional[str], query: str, columns, rows, truncated: bool = False,
+                       total_estimate: int = None, total_is_lower_bound: bool = False):
+    if key is not None:
+        get_query_cache().put(key, query, columns, rows, truncated, total_estimate, total_is_lower_bound)
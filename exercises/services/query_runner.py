@@ -0,0 +1,127 @@
+import time
+import uuid
+from typing import Callable, Dict, Tuple
+
+from django.utils import timezone
+
+from ..models import UserProgress
+from .backends import BackendError
+from .executor import SQLExecutor
+from .offload import run_in_parallel
+from .progress import mark_completed, queue_attempt
+from .result_cache import get_cached_expected_result, store_expected_result
+from .result_spill import OverflowSpill, paginate_result
+
+
+def _unavailable(message: str) -> Callable[..., Dict]:
+    """A runner that fails every query with `message`, shaped like a failed SQLExecutor.execute"""
+    def run(query: str, session_key: str = None, overflow=None) -> Dict:
+        return {'success': False, 'error': message, 'columns': [], 'rows': [], 'row_count': 0, 'execution_time': 0}
+    return run
+
+
+def get_runner(exercise) -> Callable[..., Dict]:
+    """SQLExecutor.execute for the exercise's practice database, whichever backend serves it"""
+    try:
+        return SQLExecutor(exercise.schema.db_name, exercise.schema, exercise.id).execute
+    except BackendError as e:
+        return _unavailable(str(e))
+
+
+def ensure_session_key(session) -> str:
+    """Return the session key, creating the session if the client has none yet"""
+    if not session.session_key:
+        session.create()
+    return session.session_key
+
+
+def record_attempt(session_id: str, exercise, query: str):
+    """Count an attempt and remember the query; written to UserProgress in the background"""
+    queue_attempt(session_id, exercise.id, query)
+
+
+def execute_exercise_query(exercise, query: str, session, page_size: int = None) -> Dict:
+    """
+    Run a student query for an exercise and track the attempt. Returns the executor result,
+    cut to its first `page_size` rows plus a result_handle for the rest when page_size is given;
+    rows past SQLExecutor.MAX_ROWS then go straight to the spill as well.
+    """
+    session_id = ensure_session_key(session)
+    overflow = OverflowSpill(session_id) if page_size else None
+    result = get_runner(exercise)(query, session_key=session_id, overflow=overflow)
+    record_attempt(session_id, exercise, query)
+    if page_size:
+        result = paginate_result(result, session_id, page_size, overflow.handle)
+    return result
+
+
+def _timed(run: Callable[..., Dict], query: str, session_key: str = None) -> Tuple[Dict, float]:
+    start = time.perf_counter()
+    result = run(query, session_key=session_key)
+    return result, round((time.perf_counter() - start) * 1000, 1)
+
+
+def run_submission_queries(exercise, query: str, session_key: str = None) -> Tuple[Dict, Dict, Dict]:
+    """
+    Run the user query and the reference query for a submission.
+    On an expected-result cache miss both run concurrently, each on its own connection.
+    Only the user query counts against the session's concurrency limit.
+    Returns (user_result, expected_result, timings).
+    """
+    run = get_runner(exercise)
+    start = time.perf_counter()
+
+    expected_result = get_cached_expected_result(exercise)
+    expected_ms = None
+    if expected_result is None:
+        expected_future = run_in_parallel(_timed, run, exercise.expected_sql)
+        user_result, user_ms = _timed(run, query, session_key)
+        raw_expected, expected_ms = expected_future.result()
+        expected_result = store_expected_result(exercise, raw_expected) or raw_expected
+    else:
+        user_result, user_ms = _timed(run, query, session_key)
+
+    timings = {
+        'user_query_ms': user_ms,
+        'expected_query_ms': expected_ms,
+        'expected_cached': expected_ms is None,
+        'concurrent': expected_ms is not None,
+        'total_ms': round((time.perf_counter() - start) * 1000, 1),
+    }
+    return user_result, expected_result, timings
+
+
+def submit_exercise_query(exercise, query: str, session) -> Dict:
+    """Run and grade a submission. Returns the response payload."""
+    user_result, expected_result, timings = run_submission_queries(exercise, query, session.session_key)
+
+    order_by = SQLExecutor.order_by_items(exercise.expected_sql)
+    comparison = SQLExecutor.compare_results(
+        user_result,
+        expected_result,
+        ordered=order_by is not None,
+        order_by=order_by
+    )
+
+    # Update progress
+    session_id = session.session_key or str(uuid.uuid4())
+
+    if comparison['correct']:
+        UserProgress.objects.update_or_create(
+            session_id=session_id,
+            exercise=exercise,
+            defaults={
+                'completed': True,
+                'last_query': query,
+                'completed_at': timezone.now()
+            }
+        )
+        mark_completed(session_id, exercise.id)
+
+    return {
+        'correct': comparison['correct'],
+        'message': comparison['message'],
+        'user_result': user_result,
+        'diff': comparison.get('diff'),
+        'timings': timings
+    }
@@ -0,0 +1,62 @@
+import hashlib
+from typing import Dict, Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+from chatsql.metrics import cache_lookup
+
+KEY_PREFIX = 'expected_result'
+
+
+def _cache_key(exercise_id: int) -> str:
+    return f'{KEY_PREFIX}:{exercise_id}'
+
+
+def schema_version(schema) -> str:
+    """Version string that changes whenever the schema definition or its seed data changes"""
+    seed_hash = hashlib.sha256((schema.schema_sql + '\n' + schema.seed_sql).encode('utf-8')).hexdigest()[:16]
+    updated = schema.updated_at.isoformat() if schema.updated_at else ''
+    return f'{updated}:{seed_hash}'
+
+
+def expected_fingerprint(exercise) -> str:
+    """Identifies one (exercise, reference solution, schema version) combination"""
+    sql_hash = hashlib.sha256(exercise.expected_sql.encode('utf-8')).hexdigest()[:16]
+    return f'{exercise.id}:{sql_hash}:{schema_version(exercise.schema)}'
+
+
+def _normalize(result: Dict) -> Dict:
+    """Keep only what compare_results needs from an executor result"""
+    return {
+        'success': True,
+        'columns': list(result['columns']),
+        'rows': [list(row) for row in result['rows']],
+        'row_count': result['row_count'],
+        'error': None,
+    }
+
+
+def get_cached_expected_result(exercise) -> Optional[Dict]:
+    """Return the cached reference result for an exercise, or None if missing or stale"""
+    entry = cache.get(_cache_key(exercise.id))
+    hit = bool(entry) and entry.get('fingerprint') == expected_fingerprint(exercise)
+    cache_lookup('expected_result', hit)
+    return entry['result'] if hit else None
+
+
+def store_expected_result(exercise, result: Dict) -> Optional[Dict]:
+    """Cache a successful reference result; failed runs are never cached"""
+    if not result.get('success'):
+        return None
+    normalized = _normalize(result)
+    cache.set(
+        _cache_key(exercise.id),
+        {'fingerprint': expected_fingerprint(exercise), 'result': normalized},
+        getattr(settings, 'EXPECTED_RESULT_CACHE_TIMEOUT', 60 * 60 * 24),
+    )
+    return normalized
+
+
+def invalidate_expected_results(exercise_ids: Iterable[int]):
+    cache.delete_many([_cache_key(pk) for pk in exercise_ids])
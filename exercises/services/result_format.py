@@ -0,0 +1,97 @@
+"""
+Wire formats for query results.
+
+The default 'rows' format is the executor result as is: `rows` is a list of rows, each a
+list of values. The opt-in 'columnar' format sends one array per column plus a type code
+per column, and truncates long text values, which keeps large results much smaller:
+
+    {"format": "columnar", "columns": ["id", "name"], "types": ["int", "text"],
+     "data": [[1, 2], ["Ann", "Bo..."]], "truncated_values": [[1, 1, 5000]], "row_count": 2, ...}
+
+`truncated_values` lists [column index, row index, full length] for every shortened value;
+`truncated` keeps its executor meaning (rows past SQLExecutor.MAX_ROWS were dropped).
+"""
+import datetime
+import decimal
+from typing import Dict, List, Optional
+
+from django.conf import settings
+
+ROWS = 'rows'
+COLUMNAR = 'columnar'
+FORMATS = (ROWS, COLUMNAR)
+
+# Checked in order, so bool comes before int and datetime before date
+TYPE_CODES = (
+    (bool, 'bool'),
+    (int, 'int'),
+    (float, 'float'),
+    (decimal.Decimal, 'decimal'),
+    (str, 'text'),
+    (datetime.datetime, 'datetime'),
+    (datetime.date, 'date'),
+    (datetime.time, 'time'),
+    (datetime.timedelta, 'interval'),
+    ((bytes, bytearray, memoryview), 'bytes'),
+)
+
+
+def requested_format(value: Optional[str]) -> str:
+    """The result format a client asked for; anything unknown falls back to 'rows'"""
+    return value if value in FORMATS else ROWS
+
+
+def type_code(values) -> str:
+    """Type code shared by a column's non-null values: 'null' if there are none, 'mixed' if they differ"""
+    code = None
+    for value in values:
+        if value is None:
+            continue
+        for cls, name in TYPE_CODES:
+            if isinstance(value, cls):
+                break
+        else:
+            name = 'text'
+        if code is None:
+            code = name
+        elif code != name:
+            # int and float mix freely in numeric expressions
+            if {code, name} <= {'int', 'float'}:
+                code = 'float'
+                continue
+            return 'mixed'
+    return code or 'null'
+
+
+def to_columnar(result: Dict, max_value_length: int = None) -> Dict:
+    """Columnar copy of an executor result; the result itself is not modified"""
+    if max_value_length is None:
+        max_value_length = int(getattr(settings, 'RESULT_MAX_VALUE_LENGTH', 1000))
+    columns = result.get('columns') or []
+    rows = result.get('rows') or []
+    data: List[list] = [list(col) for col in zip(*rows)] if rows else [[] for _ in columns]
+    types = [type_code(values) for values in data]
+    truncated_values = []
+    if max_value_length:
+        for c, values in enumerate(data):
+            if types[c] not in ('text', 'mixed'):
+                continue
+            for r, value in enumerate(values):
+                if isinstance(value, str) and len(value) > max_value_length:
+                    truncated_values.append([c, r, len(value)])
+                    values[r] = value[:max_value_length]
+    encoded = {key: value for key, value in result.items() if key != 'rows'}
+    encoded.update({
+        'format': COLUMNAR,
+        'types': types,
+        'data': data,
+        'truncated_values': truncated_values,
+    })
+    return encoded
+
+
+def encode_result(result: Dict, fmt: str) -> Dict:
+    """The executor result in the requested wire format"""
+    if fmt == COLUMNAR and result.get('success'):
+        return to_columnar(result)
+    return result
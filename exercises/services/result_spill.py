@@ -0,0 +1,216 @@
+"""
+Short-lived server-side copies of large query results, so the execute endpoint can send one
+page and serve the rest on demand (GET /api/results/<handle>/).
+
+Each result is spilled to a JSON-lines file in RESULT_SPILL_DIR: a header line with the
+columns and row count, then one line per row. A page is read by skipping lines, so serving it
+never loads the whole result. Rows past SQLExecutor.MAX_ROWS are written as the query is read
+(see OverflowSpill), up to RESULT_SPILL_MAX_ROWS rows. Files expire after RESULT_SPILL_TTL seconds and the oldest are removed
+once they take more than RESULT_SPILL_MAX_BYTES. The directory may be shared by every worker
+on a host, so a handle works whichever worker serves the next page.
+"""
+import hashlib
+import itertools
+import json
+import os
+import re
+import secrets
+import tempfile
+import threading
+import time
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from rest_framework.utils.encoders import JSONEncoder
+
+from .executor import SQLExecutor, get_governor
+
+_HANDLE_RE = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+SUFFIX = '.jsonl'
+# Room left in the header line for the row count, filled in once the rows are written
+_TOTAL_WIDTH = 32
+
+
+class Spilled(NamedTuple):
+    handle: str
+    total: int
+    capped: bool  # the result had more rows than the file holds
+
+
+def _owner(session_key: Optional[str]) -> str:
+    return hashlib.sha256((session_key or '').encode('utf-8')).hexdigest()[:16]
+
+
+class ResultSpill:
+    def __init__(self, directory: str, ttl: float, max_bytes: int, max_entry_bytes: int, sweep_interval: float = 30):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.sweep_interval = sweep_interval
+        self._last_sweep = 0.0
+        self._lock = threading.Lock()
+
+    def _path(self, handle: str) -> str:
+        return os.path.join(self.directory, handle + SUFFIX)
+
+    def save(self, session_key: Optional[str], columns, rows: Iterable, required: int = 0,
+             max_rows: Optional[int] = None) -> Optional[Spilled]:
+        """
+        Spill a result, or return None if it can't be written. `rows` may be read lazily from the
+        database. Writing stops, and the spill is capped, after max_rows rows or max_entry_bytes;
+        stopping before `required` rows (those the caller already holds) fails instead.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        handle = secrets.token_urlsafe(18)
+        path = self._path(handle)
+        encoder = JSONEncoder(ensure_ascii=False)
+        total = 0
+        capped = False
+        try:
+            with open(path + '.tmp', 'wb') as f:
+                header = encoder.encode({'owner': _owner(session_key), 'columns': list(columns)})
+                head = (header[:-1] + ', "total": ').encode('utf-8')
+                f.write(head + b' ' * _TOTAL_WIDTH + b'}\n')
+                size = len(head) + _TOTAL_WIDTH + 2
+                for row in rows:
+                    line = (encoder.encode(list(row)) + '\n').encode('utf-8')
+                    size += len(line)
+                    if total == max_rows or size > self.max_entry_bytes:
+                        if total < required:
+                            raise OverflowError
+                        capped = True
+                        break
+                    f.write(line)
+                    total += 1
+                f.seek(len(head))
+                f.write(f'{total}, "capped": {"true" if capped else "false"}'.encode('ascii'))
+            # Readers never see a half-written file
+            os.replace(path + '.tmp', path)
+        except (OSError, OverflowError):
+            try:
+                os.remove(path + '.tmp')
+            except OSError:
+                pass
+            return None
+        self._maybe_sweep()
+        return Spilled(handle, total, capped)
+
+    def load_page(self, handle: str, session_key: Optional[str], offset: int, limit: int) -> Optional[Dict]:
+        """
+        Rows [offset, offset + limit) of a spilled result, or None if the handle is unknown,
+        expired or belongs to another session
+        """
+        if not _HANDLE_RE.match(handle or ''):
+            return None
+        path = self._path(handle)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with open(path, encoding='utf-8') as f:
+                header = json.loads(f.readline())
+                if header['owner'] != _owner(session_key):
+                    return None
+                rows = [json.loads(line) for line in itertools.islice(f, offset, offset + limit)]
+        except (OSError, ValueError, KeyError):
+            return None
+        return {'columns': header['columns'], 'rows': rows, 'total': header['total'], 'capped': header['capped']}
+
+    def _maybe_sweep(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_sweep < self.sweep_interval:
+                return
+            self._last_sweep = now
+        self.sweep()
+
+    def sweep(self):
+        """Remove expired spill files, then the oldest ones while the total is over max_bytes"""
+        try:
+            entries = []
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith(SUFFIX):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            return
+        now = time.time()
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, path in entries:
+            if now - mtime <= self.ttl and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+_spill = None
+_spill_lock = threading.Lock()
+
+
+def get_spill() -> ResultSpill:
+    global _spill
+    if _spill is None:
+        with _spill_lock:
+            if _spill is None:
+                _spill = ResultSpill(
+                    directory=str(getattr(settings, 'RESULT_SPILL_DIR', None)
+                                  or os.path.join(tempfile.gettempdir(), 'chatsql-results')),
+                    ttl=float(getattr(settings, 'RESULT_SPILL_TTL', 600)),
+                    max_bytes=int(getattr(settings, 'RESULT_SPILL_MAX_BYTES', 256 * 1024 * 1024)),
+                    max_entry_bytes=int(getattr(settings, 'RESULT_SPILL_MAX_ENTRY_BYTES', 16 * 1024 * 1024)),
+                )
+    return _spill
+
+
+def page_size(value=None) -> int:
+    """Requested page size, clamped to 1..MAX_ROWS; RESULT_PAGE_SIZE when not given"""
+    default = int(getattr(settings, 'RESULT_PAGE_SIZE', 100))
+    try:
+        size = int(value) if value not in (None, '') else default
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, SQLExecutor.MAX_ROWS))
+
+
+class OverflowSpill:
+    """
+    SQLExecutor.execute overflow hook: writes a result that runs past MAX_ROWS to a spill file
+    as it is read, up to RESULT_SPILL_MAX_ROWS rows, so the rows past MAX_ROWS can be paged too
+    """
+
+    def __init__(self, session_key: Optional[str]):
+        self.session_key = session_key
+        self.handle = None
+
+    def __call__(self, columns, rows, rest) -> Optional[Tuple[int, bool]]:
+        spilled = get_spill().save(self.session_key, columns, itertools.chain(rows, rest), required=len(rows),
+                                   max_rows=get_governor().max_spill_rows)
+        if spilled is None:
+            return None
+        self.handle = spilled.handle
+        return spilled.total, spilled.capped
+
+
+def paginate_result(result: Dict, session_key: Optional[str], size: int, handle: Optional[str] = None) -> Dict:
+    """
+    First page of an executor result plus a `result_handle` for the rest.
+    `handle` is the spill OverflowSpill already wrote for a truncated result; otherwise the rows
+    held are spilled here. row_count stays the number of rows held; results that fit one page,
+    failed queries and results that can't be spilled are returned whole.
+    """
+    rows = result.get('rows') or []
+    if not result.get('success'):
+        return result
+    if handle is None:
+        if len(rows) <= size:
+            return result
+        spilled = get_spill().save(session_key, result['columns'], rows, required=len(rows))
+        if spilled is None:
+            return result
+        handle = spilled.handle
+    return {**result, 'rows': rows[:size], 'page_size': size, 'result_handle': handle}
@@ -0,0 +1,84 @@
+import sqlite3
+import threading
+
+from .result_cache import schema_version
+
+
+class SandboxError(Exception):
+    """Raised when a DatabaseSchema can't be materialized into SQLite"""
+
+
+class SandboxRegistry:
+    """
+    In-memory SQLite copies of each DatabaseSchema.
+    Every schema is built once into a template database from schema_sql/seed_sql; each
+    worker thread then gets its own read-only clone made with the SQLite backup API,
+    so student queries never touch the app's database file or its locks.
+    """
+
+    def __init__(self):
+        self._templates = {}  # schema id -> (version, connection, lock)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _build_template(self, schema) -> sqlite3.Connection:
+        conn = sqlite3.connect(':memory:', check_same_thread=False)
+        try:
+            if schema.schema_sql:
+                conn.executescript(schema.schema_sql)
+            if schema.seed_sql:
+                conn.executescript(schema.seed_sql)
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.close()
+            raise SandboxError(f"Could not build sandbox for schema '{schema.name}': {e}") from e
+        return conn
+
+    def _get_template(self, schema, version: str):
+        entry = self._templates.get(schema.id)
+        if entry is not None and entry[0] == version:
+            return entry
+        with self._lock:
+            entry = self._templates.get(schema.id)
+            if entry is None or entry[0] != version:
+                if entry is not None:
+                    self._close_template(entry)
+                entry = (version, self._build_template(schema), threading.Lock())
+                self._templates[schema.id] = entry
+            return entry
+
+    def connection(self, schema) -> sqlite3.Connection:
+        """Return this thread's read-only clone of the schema, refreshing it if the schema changed"""
+        version = schema_version(schema)
+        clones = getattr(self._local, 'clones', None)
+        if clones is None:
+            clones = self._local.clones = {}
+        clone = clones.get(schema.id)
+        if clone is not None and clone[0] == version:
+            return clone[1]
+
+        _, template, template_lock = self._get_template(schema, version)
+        conn = sqlite3.connect(':memory:')
+        with template_lock:
+            template.backup(conn)
+        conn.execute('PRAGMA query_only = ON')
+        if clone is not None:
+            clone[1].close()
+        clones[schema.id] = (version, conn)
+        return conn
+
+    def discard(self, schema_id: int):
+        """Drop a schema's template; thread clones are refreshed lazily on their next use"""
+        with self._lock:
+            entry = self._templates.pop(schema_id, None)
+        if entry is not None:
+            self._close_template(entry)
+
+    @staticmethod
+    def _close_template(entry):
+        # Wait for any in-flight clone of this template to finish first
+        with entry[2]:
+            entry[1].close()
+
+
+sandboxes = SandboxRegistry()
@@ -0,0 +1,346 @@
+"""
+Loading a DatabaseSchema's schema_sql and seed_sql into a database.
+
+On SQLite the scripts run whole through executescript(), in one transaction. On MySQL
+scripts are split into statements by a quote- and comment-aware regex; INSERT ... VALUES
+statements made only of literals are parsed and replayed as batched executemany() calls,
+grouped by table and column list, and anything else runs as written. Each target records the hash of the SQL it
+last loaded per schema in SEED_STATE_TABLE, so unchanged schemas are skipped.
+"""
+import decimal
+import functools
+import hashlib
+import re
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from django.db import connections, transaction
+from django.db.utils import load_backend
+from django.utils import timezone
+
+from .sql_validator import COMMENT, QUOTED_IDENT, WORD, tokenize
+
+SEED_STATE_TABLE = 'chatsql_seed_state'
+
+
+class SeedResult(NamedTuple):
+    schema: str
+    alias: str
+    skipped: bool
+    statements: int = 0
+    rows: int = 0
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def seed_hash(schema) -> str:
+    return hashlib.sha256((schema.schema_sql + '\0' + schema.seed_sql).encode('utf-8')).hexdigest()
+
+
+# Quoted spans and comments are skipped whole, so only real statement separators match ';'
+_SPLIT_RE = re.compile(r"""
+      '(?:[^'\\]|\\.|'')*'
+    | "(?:[^"\\]|\\.|"")*"
+    | `(?:[^`]|``)*`
+    | --[^\n]* | \#[^\n]* | /\*.*?\*/
+    | (;)
+""", re.VERBOSE | re.DOTALL)
+
+_LEADING_COMMENTS_RE = re.compile(r'(?:\s+|--[^\n]*|\#[^\n]*|/\*.*?\*/)*', re.DOTALL)
+
+_INSERT_RE = re.compile(
+    r'INSERT\s+INTO\s+(`(?:[^`]|``)+`|[A-Za-z_][\w$]*)\s*\(([^()\'"]*)\)\s*VALUES?\s*', re.IGNORECASE
+)
+
+_IS_INSERT_RE = re.compile(r'(?:\s+|--[^\n]*|\#[^\n]*|/\*.*?\*/)*INSERT\b', re.IGNORECASE | re.DOTALL)
+
+# One literal: a single-quoted string without backslash escapes, a number, NULL, TRUE or FALSE
+_VALUE = r"""('[^'\\]*(?:''[^'\\]*)*'|[-+]?\s*(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?|(?i:NULL|TRUE|FALSE))"""
+
+_WORD_VALUES = {'NULL': None, 'TRUE': 1, 'FALSE': 0}
+
+
+@functools.lru_cache(maxsize=64)
+def _row_re(width: int) -> re.Pattern:
+    """Regex for one `(v1, ..., vN)` tuple plus the comma after it, if any"""
+    values = r'\s*,\s*'.join([_VALUE] * width)
+    return re.compile(r'\s*\(\s*' + values + r'\s*\)\s*(,?)')
+
+
+def _value(text: str):
+    first = text[0]
+    if first == "'":
+        text = text[1:-1]
+        return text.replace("''", "'") if "''" in text else text
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    if first.isalpha():
+        return _WORD_VALUES[text.upper()]
+    # Decimal keeps DECIMAL columns exact
+    return decimal.Decimal(text.replace(' ', ''))
+
+
+def split_statements(sql: str) -> Iterator[str]:
+    """Statements of a script, without their semicolons; blank and comment-only statements are dropped"""
+    start = 0
+    for m in _SPLIT_RE.finditer(sql or ''):
+        if m.group(1):
+            statement = sql[start:m.start()]
+            start = m.end()
+            if _LEADING_COMMENTS_RE.match(statement).end() < len(statement):
+                yield statement.strip()
+    statement = (sql or '')[start:]
+    if _LEADING_COMMENTS_RE.match(statement).end() < len(statement):
+        yield statement.strip()
+
+
+def _ident(tok) -> str:
+    return tok.value[1:-1].replace('``', '`') if tok.kind == QUOTED_IDENT else tok.value
+
+
+def table_names(schema_sql: str) -> List[str]:
+    """Tables created by a schema script, in creation order"""
+    names = []
+    for statement in split_statements(schema_sql):
+        tokens = [t for t in tokenize(statement) if t.kind != COMMENT][:8]
+        words = [t.value.upper() if t.kind == WORD else None for t in tokens]
+        if words[:1] != ['CREATE'] or 'TABLE' not in words:
+            continue
+        i = words.index('TABLE') + 1
+        while i < len(tokens) and tokens[i].kind == WORD and tokens[i].value.upper() in ('IF', 'NOT', 'EXISTS'):
+            i += 1
+        if i < len(tokens):
+            names.append(_ident(tokens[i]))
+    return names
+
+
+def parse_insert(statement: str) -> Optional[Tuple[str, Tuple[str, ...], List[tuple]]]:
+    """
+    (table, columns, rows) for `INSERT INTO t (a, b) VALUES (1, 'x'), (2, NULL)`, or None if
+    the statement is anything else (no column list, expressions, INSERT ... SELECT, backslash
+    escapes, whose meaning differs between MySQL and SQLite)
+    """
+    pos = _LEADING_COMMENTS_RE.match(statement).end()
+    header = _INSERT_RE.match(statement, pos)
+    if header is None:
+        return None
+    table = header.group(1)
+    table = table[1:-1].replace('``', '`') if table.startswith('`') else table
+    columns = tuple(c.strip().strip('`') for c in header.group(2).split(','))
+    if not all(columns):
+        return None
+    row_re = _row_re(len(columns))
+    rows = []
+    pos, end = header.end(), len(statement)
+    more = True
+    try:
+        while more and pos < end:
+            m = row_re.match(statement, pos)
+            if m is None:
+                return None
+            groups = m.groups()
+            rows.append(tuple(map(_value, groups[:-1])))
+            more = bool(groups[-1])
+            pos = m.end()
+    except decimal.InvalidOperation:
+        return None
+    if pos < end or more:
+        return None
+    return table, columns, rows
+
+
+def _quote(connection, name: str) -> str:
+    return connection.ops.quote_name(name)
+
+
+def insert_rows(connection, cursor, table: str, columns: Sequence[str], rows: Iterable[Sequence],
+                batch_size: int = 5000) -> int:
+    """Insert rows (any iterable, consumed lazily) in executemany() batches; returns the row count"""
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        _quote(connection, table),
+        ', '.join(_quote(connection, c) for c in columns),
+        ', '.join(['%s'] * len(columns)),
+    )
+    count = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            cursor.executemany(sql, batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        cursor.executemany(sql, batch)
+        count += len(batch)
+    return count
+
+
+@contextmanager
+def bulk_load(connection, cursor):
+    """
+    Session settings for fast bulk loads, restored afterwards:
+    SQLite skips fsyncs and foreign key checks and uses a larger page cache;
+    MySQL skips foreign key and unique checks.
+    """
+    vendor = connection.vendor
+    if vendor == 'sqlite':
+        cursor.execute('PRAGMA synchronous')
+        synchronous = cursor.fetchone()[0]
+        cursor.execute('PRAGMA foreign_keys')
+        foreign_keys = cursor.fetchone()[0]
+        cursor.execute('PRAGMA cache_size')
+        cache_size = cursor.fetchone()[0]
+        cursor.execute('PRAGMA synchronous = OFF')
+        cursor.execute('PRAGMA foreign_keys = OFF')
+        cursor.execute('PRAGMA cache_size = -65536')
+        try:
+            yield
+        finally:
+            cursor.execute(f'PRAGMA synchronous = {int(synchronous)}')
+            cursor.execute(f'PRAGMA foreign_keys = {int(foreign_keys)}')
+            cursor.execute(f'PRAGMA cache_size = {int(cache_size)}')
+    elif vendor == 'mysql':
+        cursor.execute('SET @chatsql_fk = @@foreign_key_checks, @chatsql_uc = @@unique_checks')
+        cursor.execute('SET SESSION foreign_key_checks = 0, SESSION unique_checks = 0')
+        try:
+            yield
+        finally:
+            cursor.execute('SET SESSION foreign_key_checks = @chatsql_fk, SESSION unique_checks = @chatsql_uc')
+    else:
+        yield
+
+
+def sqlite_file_connection(path, alias: str = 'dataset'):
+    """A Django connection to a SQLite file that is not in DATABASES, for insert_rows() and bulk_load()"""
+    databases = connections.configure_settings({
+        'default': {}, alias: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': str(path)},
+    })
+    return load_backend(databases[alias]['ENGINE']).DatabaseWrapper(databases[alias], alias)
+
+
+def _ensure_state_table(connection, cursor):
+    cursor.execute(
+        f'CREATE TABLE IF NOT EXISTS {SEED_STATE_TABLE} ('
+        'schema_name VARCHAR(50) PRIMARY KEY, sql_hash CHAR(64) NOT NULL, applied_at VARCHAR(40) NOT NULL)'
+    )
+
+
+def applied_hash(connection, cursor, schema_name: str) -> Optional[str]:
+    _ensure_state_table(connection, cursor)
+    cursor.execute(f'SELECT sql_hash FROM {SEED_STATE_TABLE} WHERE schema_name = %s', [schema_name])
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def record_applied(connection, cursor, schema_name: str, sql_hash: str):
+    _ensure_state_table(connection, cursor)
+    cursor.execute(f'DELETE FROM {SEED_STATE_TABLE} WHERE schema_name = %s', [schema_name])
+    cursor.execute(
+        f'INSERT INTO {SEED_STATE_TABLE} (schema_name, sql_hash, applied_at) VALUES (%s, %s, %s)',
+        [schema_name, sql_hash, timezone.now().isoformat()]
+    )
+
+
+def _app_tables(connection) -> set:
+    """Lower-cased names of the tables Django and the seeding itself own on a connection"""
+    names = connection.introspection.django_table_names() + ['django_migrations', SEED_STATE_TABLE]
+    return {name.lower() for name in names}
+
+
+def _run_script(connection, cursor, sql: str, batch_size: int) -> Tuple[int, int]:
+    """Run a script, batching literal INSERTs; returns (statements, rows inserted)"""
+    statements = rows = 0
+    pending_key, pending_rows = None, []
+
+    def flush():
+        nonlocal rows, pending_rows
+        if pending_rows:
+            rows += insert_rows(connection, cursor, pending_key[0], pending_key[1], pending_rows, batch_size)
+            pending_rows = []
+
+    for statement in split_statements(sql):
+        statements += 1
+        parsed = parse_insert(statement)
+        if parsed is not None:
+            key = parsed[:2]
+            if key != pending_key:
+                flush()
+                pending_key = key
+            pending_rows.extend(parsed[2])
+            if len(pending_rows) >= batch_size:
+                flush()
+            continue
+        flush()
+        cursor.execute(statement)
+        if _IS_INSERT_RE.match(statement) and cursor.rowcount and cursor.rowcount > 0:
+            rows += cursor.rowcount
+    flush()
+    return statements, rows
+
+
+def _load_sqlite(connection, cursor, schema, tables: List[str], sql_hash: str) -> Tuple[int, int]:
+    """
+    Drop, create and seed in one executescript() call, which beats parsing the scripts here.
+    executescript() commits any open transaction first, so the script opens its own rather
+    than running under atomic(). Returns (statements, rows changed).
+    """
+    db = connection.connection
+    drops = ''.join(f'DROP TABLE IF EXISTS {_quote(connection, table)};\n' for table in reversed(tables))
+    before = db.total_changes
+    try:
+        # The newlines keep a trailing -- comment from swallowing what follows
+        cursor.executescript(f'BEGIN;\n{drops}{schema.schema_sql or ""}\n;\n{schema.seed_sql or ""}\n;')
+        rows = db.total_changes - before
+        record_applied(connection, cursor, schema.name, sql_hash)
+        cursor.execute('COMMIT')
+    except Exception:
+        if db.in_transaction:
+            cursor.execute('ROLLBACK')
+        raise
+    statements = sum(1 for _ in split_statements(schema.schema_sql)) + sum(1 for _ in split_statements(schema.seed_sql))
+    return statements, rows
+
+
+def apply_schema(schema, alias: str = 'default', force: bool = False, batch_size: int = 5000) -> SeedResult:
+    """
+    (Re)create a schema's tables on `alias` and load its seed data, unless that exact SQL was
+    already loaded there. Existing tables of the schema are dropped first, so re-runs succeed;
+    a schema that creates one of the app's own tables is refused rather than dropping it.
+    """
+    connection = connections[alias]
+    sql_hash = seed_hash(schema)
+    try:
+        tables = table_names(schema.schema_sql)
+        clashes = [table for table in tables if table.lower() in _app_tables(connection)]
+        if clashes:
+            raise ValueError(
+                f"schema_sql creates {', '.join(clashes)}, which the app uses on '{alias}'; rename the table(s)"
+            )
+        with connection.cursor() as cursor:
+            if not force and applied_hash(connection, cursor, schema.name) == sql_hash:
+                return SeedResult(schema.name, alias, skipped=True)
+            start = time.perf_counter()
+            # SQLite only honours PRAGMA foreign_keys outside a transaction
+            with bulk_load(connection, cursor):
+                if connection.vendor == 'sqlite':
+                    statements, rows = _load_sqlite(connection, cursor, schema, tables, sql_hash)
+                else:
+                    # MySQL commits DDL implicitly, so there the drop/create part is not atomic
+                    with transaction.atomic(using=alias):
+                        for table in reversed(tables):
+                            cursor.execute(f'DROP TABLE IF EXISTS {_quote(connection, table)}')
+                        statements, _ = _run_script(connection, cursor, schema.schema_sql, batch_size)
+                        seed_statements, rows = _run_script(connection, cursor, schema.seed_sql, batch_size)
+                        statements += seed_statements
+                        record_applied(connection, cursor, schema.name, sql_hash)
+            seconds = time.perf_counter() - start
+    except Exception as e:
+        return SeedResult(schema.name, alias, skipped=False, error=str(e))
+    return SeedResult(schema.name, alias, False, statements, rows, seconds)
@@ -0,0 +1,59 @@
+import hashlib
+import logging
+from typing import List, Optional
+
+from django.conf import settings
+
+from ..models import Exercise, SlowQuery
+from .backends import BackendError
+from .sql_validator import query_fingerprint
+from .write_behind import BatchWriter
+
+logger = logging.getLogger(__name__)
+
+
+def slow_query_threshold() -> Optional[float]:
+    """Seconds after which a practice query is logged; None when the slow-query log is off"""
+    threshold = getattr(settings, 'SLOW_QUERY_THRESHOLD', 0.5)
+    return float(threshold) if threshold else None
+
+
+def _write_slow_queries(batch: List[SlowQuery]):
+    # The exercise FK is SET_NULL, so detach entries whose exercise was deleted before the flush
+    exercise_ids = {entry.exercise_id for entry in batch if entry.exercise_id is not None}
+    live = set(Exercise.objects.filter(id__in=exercise_ids).values_list('id', flat=True))
+    for entry in batch:
+        if entry.exercise_id not in live:
+            entry.exercise_id = None
+    SlowQuery.objects.bulk_create(batch, batch_size=500)
+
+
+slow_query_writer = BatchWriter('slow_queries', _write_slow_queries)
+
+
+def log_slow_query(backend, query: str, exercise_id: Optional[int], execution_time: float,
+                   row_count: int = 0, error: str = None):
+    """
+    Queue a SlowQuery for a query that ran past the threshold.
+    The plan is taken right away on the same backend (EXPLAIN only plans, it doesn't run the query),
+    so it reflects the data the query actually ran against.
+    """
+    plan = ''
+    if getattr(settings, 'SLOW_QUERY_EXPLAIN', True):
+        try:
+            plan = backend.explain(query) or ''
+        except BackendError as e:
+            plan = f'EXPLAIN failed: {e}'
+    normalized = query_fingerprint(query)
+    slow_query_writer.add(SlowQuery(
+        exercise_id=exercise_id,
+        db_name=backend.db_name,
+        fingerprint=hashlib.sha256(normalized.encode('utf-8')).hexdigest()[:32],
+        normalized_query=normalized,
+        query=query,
+        execution_time=round(execution_time, 4),
+        row_count=row_count,
+        error=error or '',
+        plan=plan,
+    ))
+    logger.info('Slow query on %s (exercise %s, %.3fs): %s', backend.db_name, exercise_id, execution_time, normalized)
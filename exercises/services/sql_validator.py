@@ -0,0 +1,390 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Iterator, List, NamedTuple, Optional, Tuple, Union
+
+# Token kinds
+WORD = 'word'                  # keyword or bare identifier
+QUOTED_IDENT = 'quoted_ident'  # `backticked` identifier
+STRING = 'string'              # 'single' or "double" quoted literal
+NUMBER = 'number'
+COMMENT = 'comment'            # -- ..., # ..., /* ... */
+SEMICOLON = 'semicolon'
+PUNCT = 'punct'                # operators, parentheses, commas, dots
+UNTERMINATED = 'unterminated'  # string, identifier or comment missing its closing delimiter
+
+DANGEROUS_KEYWORDS = frozenset([
+    'DROP', 'DELETE', 'UPDATE', 'INSERT', 'ALTER',
+    'CREATE', 'TRUNCATE', 'GRANT', 'REVOKE', 'EXEC',
+    'REPLACE', 'PRAGMA', 'ATTACH', 'DETACH', 'LOAD', 'CALL', 'HANDLER',
+])
+
+# REPLACE(str, from, to) is a string function in both MySQL and SQLite
+FUNCTION_KEYWORDS = frozenset(['REPLACE'])
+
+# Refused only where a statement starts: elsewhere SET is part of an expression such as
+# CAST(x AS CHAR CHARACTER SET utf8mb4), and UPDATE ... SET is caught by UPDATE
+STATEMENT_KEYWORDS = frozenset(['SET'])
+
+# SELECT ... INTO OUTFILE / DUMPFILE writes the result to a file on the database server
+INTO_KEYWORDS = frozenset(['OUTFILE', 'DUMPFILE'])
+
+# SQL dialects the validator knows how to scan; None checks a query against all of them
+MYSQL = 'mysql'
+SQLITE = 'sqlite'
+
+ALLOWED_FIRST_KEYWORDS = frozenset(['SELECT', 'WITH'])
+
+# Keywords whose case never shows up in a result (unlike NULL, TRUE or function names,
+# which name the column of an unaliased expression)
+CLAUSE_KEYWORDS = frozenset([
+    'SELECT', 'WITH', 'RECURSIVE', 'DISTINCT', 'ALL', 'FROM', 'WHERE', 'GROUP', 'BY', 'HAVING',
+    'ORDER', 'ASC', 'DESC', 'LIMIT', 'OFFSET', 'JOIN', 'INNER', 'LEFT', 'RIGHT', 'FULL', 'OUTER',
+    'CROSS', 'NATURAL', 'ON', 'USING', 'AS', 'UNION', 'INTERSECT', 'EXCEPT', 'AND', 'OR', 'NOT',
+    'IN', 'IS', 'LIKE', 'BETWEEN', 'EXISTS', 'CASE', 'WHEN', 'THEN', 'ELSE', 'END',
+])
+
+
+class Token(NamedTuple):
+    kind: str
+    value: str
+    pos: int  # offset of the first character in the query
+
+
+class ValidationError(NamedTuple):
+    message: str
+    pos: int
+
+    def as_dict(self):
+        return {'message': self.message, 'position': self.pos}
+
+
+class ValidationResult(NamedTuple):
+    valid: bool
+    errors: Tuple[ValidationError, ...]
+
+    @property
+    def message(self) -> str:
+        return self.errors[0].message if self.errors else ''
+
+
+# One alternation per token kind, tried in order; every character matches some branch,
+# so finditer walks the query in a single pass inside the regex engine
+_TOKEN_RE = re.compile(r"""
+     (?P<ws>\s+)
+    |(?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+    |(?P<number>\d[\d.eE]*|\.\d[\d.eE]*)
+    |(?P<string>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*")
+    |(?P<quoted_ident>`(?:[^`]|``)*`)
+    |(?P<comment>--[^\n]*|\#[^\n]*|/\*.*?\*/)
+    |(?P<semicolon>;)
+    |(?P<unterminated>['"`].*|/\*.*)
+    |(?P<punct>.)
+""", re.VERBOSE | re.DOTALL)
+
+
+def tokenize(query: str) -> Iterator[Token]:
+    """Single-pass SQL tokenizer (MySQL/SQLite flavoured). Whitespace is skipped."""
+    for m in _TOKEN_RE.finditer(query):
+        kind = m.lastgroup
+        if kind != 'ws':
+            yield Token(kind, m.group(), m.start())
+
+
+# Validation only needs words, quoted spans, comments, semicolons, dots, parentheses and
+# commas, so it uses a leaner pattern than tokenize(): whitespace, numbers and operators are
+# skipped by the regex engine itself, and the single capturing group flags an unterminated span.
+# String literals follow the dialect: MySQL treats \ as an escape character, SQLite does not
+# (and also quotes identifiers in [brackets]), so one pattern for both would let a quote hide
+# the rest of the statement from the validator.
+_SCAN_TEMPLATE = r"""
+      [A-Za-z_][\w$]*
+    | {strings}
+    | `(?:[^`]|``)*`
+    | --[^\n]* | \#[^\n]* | /\*.*?\*/
+    | ({unterminated}.*|/\*.*)
+    | [;.(),]
+"""
+
+_SCAN_RES = {
+    MYSQL: re.compile(_SCAN_TEMPLATE.format(
+        strings=r"""'(?:[^'\\]|\\.|'')*' | "(?:[^"\\]|\\.|"")*" """,
+        unterminated=r"""['"`]""",
+    ), re.VERBOSE | re.DOTALL),
+    SQLITE: re.compile(_SCAN_TEMPLATE.format(
+        strings=r"""'(?:[^']|'')*' | "(?:[^"]|"")*" | \[[^\]]*\]""",
+        unterminated=r"""['"`[]""",
+    ), re.VERBOSE | re.DOTALL),
+}
+
+_COMMENT_STARTS = frozenset('-#/')
+
+
+def _validate(query: str, dialect: str) -> ValidationResult:
+    errors: List[ValidationError] = []
+    first_pos = len(query) - len(query.lstrip())
+    first = True
+    prev_dot = False
+    prev_word = None
+    statement_start = False
+    # After a leading WITH: parenthesis depth, and whether a CTE's ')' just closed at the
+    # top level, so the next top-level token is a ',' (next CTE), AS (after a column list)
+    # or the start of the statement the CTEs belong to, which has to be a SELECT
+    with_prefix = False
+    depth = 0
+    closed = False
+
+    for m in _SCAN_RES[dialect].finditer(query):
+        text = m.group()
+        c = text[0]
+        word = text.upper() if c.isalpha() or c == '_' else None
+        if first:
+            first = False
+            if m.start() != first_pos or word not in ALLOWED_FIRST_KEYWORDS:
+                errors.append(ValidationError('Only SELECT queries are allowed', first_pos))
+                break
+            with_prefix = word == 'WITH'
+            continue
+        if m.lastindex:
+            what = 'comment' if c == '/' else 'quoted string or identifier'
+            errors.append(ValidationError(f'Unterminated {what}', m.start()))
+            break
+        if closed:
+            closed = False
+            if word == 'SELECT':
+                with_prefix = False
+            elif c != ',' and word != 'AS':
+                errors.append(ValidationError('Only SELECT queries are allowed', m.start()))
+                break
+        if c == ';':
+            rest = query[m.end():].lstrip(' \t\r\n;')
+            if rest:
+                errors.append(ValidationError('Multiple statements are not allowed', len(query) - len(rest)))
+                break
+        elif c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+            closed = with_prefix and depth == 0
+        elif c in _COMMENT_STARTS:
+            errors.append(ValidationError('Comments are not allowed in queries', m.start()))
+        elif word in DANGEROUS_KEYWORDS and not prev_dot:
+            # a keyword after a dot (`t.update`) is a qualified column name
+            if word not in FUNCTION_KEYWORDS or not query[m.end():].lstrip().startswith('('):
+                errors.append(ValidationError(f"Keyword '{word}' is not allowed", m.start()))
+        elif word in STATEMENT_KEYWORDS and statement_start:
+            errors.append(ValidationError(f"Keyword '{word}' is not allowed", m.start()))
+        elif word in INTO_KEYWORDS and prev_word == 'INTO':
+            errors.append(ValidationError(f"Keyword 'INTO {word}' is not allowed", m.start()))
+        prev_dot = c == '.'
+        prev_word = word
+        statement_start = c == ';'
+
+    if first or (with_prefix and not errors):
+        errors.append(ValidationError('Only SELECT queries are allowed', first_pos))
+    return ValidationResult(not errors, tuple(errors))
+
+
+class _VerdictCache:
+    """Thread-safe LRU of validation results keyed by a digest of the query text"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            result = self._data.get(key)
+            if result is not None:
+                self._data.move_to_end(key)
+            return result
+
+    def put(self, key, result):
+        with self._lock:
+            self._data[key] = result
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_verdicts = _VerdictCache(maxsize=4096)
+
+
+def _validate_dialects(query: str, dialect: Optional[str]) -> ValidationResult:
+    for name in (dialect,) if dialect else (MYSQL, SQLITE):
+        result = _validate(query, name)
+        if not result.valid:
+            return result
+    return result
+
+
+def validate_sql(query: str, use_cache: bool = True, dialect: Optional[str] = None) -> ValidationResult:
+    """
+    Validate that a query is a single read-only SELECT statement
+    `dialect` (MYSQL or SQLITE) sets how string literals are scanned; without one the
+    query has to pass as both.
+    Returns a ValidationResult with every error found and its character offset
+    """
+    if not use_cache:
+        return _validate_dialects(query, dialect)
+    key = hashlib.blake2b(f'{dialect}\0{query}'.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+    result = _verdicts.get(key)
+    if result is None:
+        result = _validate_dialects(query, dialect)
+        _verdicts.put(key, result)
+    return result
+
+
+def has_top_level_order_by(query: str) -> bool:
+    """True if the query has an ORDER BY outside of any parentheses (subqueries, window specs)"""
+    depth = 0
+    prev_order = False
+    for tok in tokenize(query):
+        if tok.kind == PUNCT:
+            if tok.value == '(':
+                depth += 1
+            elif tok.value == ')':
+                depth -= 1
+        elif tok.kind == WORD and depth == 0:
+            word = tok.value.upper()
+            if prev_order and word == 'BY':
+                return True
+            prev_order = word == 'ORDER'
+            continue
+        prev_order = False
+    return False
+
+
+# Words that end an ORDER BY list, and modifiers that don't change which values are compared
+_ORDER_BY_END = frozenset(['LIMIT', 'OFFSET', 'FETCH', 'FOR', 'LOCK'])
+_ORDER_MODIFIERS = frozenset(['ASC', 'DESC', 'NULLS', 'FIRST', 'LAST'])
+
+
+def _order_item(tokens: List[Token]) -> Optional[Union[str, int]]:
+    while tokens and tokens[-1].kind == WORD and tokens[-1].value.upper() in _ORDER_MODIFIERS:
+        tokens = tokens[:-1]
+    if len(tokens) == 1 and tokens[0].kind == NUMBER and tokens[0].value.isdigit():
+        return int(tokens[0].value)
+    # `col` or `t.col`, possibly quoted: the result column it names
+    names = tokens[::2]
+    if not names or any(t.kind == PUNCT and t.value == '.' for t in names) or \
+            any(t.kind != PUNCT or t.value != '.' for t in tokens[1::2]):
+        return None
+    last = names[-1]
+    if last.kind == WORD:
+        return last.value
+    if last.kind == QUOTED_IDENT or (last.kind == STRING and last.value[0] == '"'):
+        quote = last.value[0]
+        return last.value[1:-1].replace(quote * 2, quote)
+    return None
+
+
+def top_level_order_by(query: str) -> Optional[List[Optional[Union[str, int]]]]:
+    """
+    Items of the query's outermost ORDER BY (outside any parentheses), or None without one.
+    Each item is the column name for `col` or `t.col`, the position for `2`, or None for
+    anything else (expressions, COLLATE).
+    """
+    tokens = [t for t in tokenize(query) if t.kind != COMMENT]
+    depth = 0
+    start = None
+    for i, tok in enumerate(tokens):
+        if tok.kind == PUNCT and tok.value in '()':
+            depth += 1 if tok.value == '(' else -1
+        elif depth == 0 and tok.kind == WORD and tok.value.upper() == 'BY' and i and \
+                tokens[i - 1].kind == WORD and tokens[i - 1].value.upper() == 'ORDER':
+            start = i + 1
+    if start is None:
+        return None
+    items, current = [], []
+    depth = 0
+    for tok in tokens[start:]:
+        if tok.kind == PUNCT and tok.value in '()':
+            depth += 1 if tok.value == '(' else -1
+            if depth < 0:
+                break
+        elif depth == 0 and (tok.kind == SEMICOLON or (tok.kind == WORD and tok.value.upper() in _ORDER_BY_END)):
+            break
+        elif depth == 0 and tok.kind == PUNCT and tok.value == ',':
+            items.append(_order_item(current))
+            current = []
+            continue
+        current.append(tok)
+    items.append(_order_item(current))
+    return items
+
+
+def query_fingerprint(query: str) -> str:
+    """
+    Canonical form of a student query: literals become ?, comments and whitespace are
+    dropped, identifiers and keywords are upper-cased and unquoted, so
+    `select Name from employees where id = 7` and `SELECT  name FROM employees WHERE id=12`
+    share a fingerprint
+    """
+    if not query:
+        return ''
+    parts = []
+    for tok in tokenize(query):
+        if tok.kind in (STRING, NUMBER):
+            parts.append('?')
+        elif tok.kind == QUOTED_IDENT:
+            parts.append(tok.value[1:-1].replace('``', '`').upper())
+        elif tok.kind != COMMENT:
+            parts.append(tok.value.upper())
+    # A trailing semicolon doesn't change the query
+    while parts and parts[-1] == ';':
+        parts.pop()
+    return ' '.join(parts)
+
+
+# Clause keywords that end a select list at its own parenthesis depth
+_SELECT_LIST_END = frozenset(['FROM', 'WHERE', 'GROUP', 'HAVING', 'ORDER', 'LIMIT', 'UNION', 'INTERSECT', 'EXCEPT'])
+
+
+def canonical_query(query: str) -> str:
+    """
+    The query with comments, a trailing semicolon, whitespace between tokens and the case of
+    clause keywords normalized. Unlike query_fingerprint, literals and identifiers are kept,
+    so two queries with the same canonical form return the same rows under the same column names.
+    Select lists are kept as typed, since unaliased expressions and aliases (`AS left`) name
+    the result columns, and so is a keyword used as an identifier (after AS, or around a dot).
+    """
+    tokens = [tok for tok in tokenize(query) if tok.kind != COMMENT]
+    parts = []
+    depth = 0
+    list_depth = None  # paren depth of the select list being copied as typed, if any
+    list_start = None
+    for i, tok in enumerate(tokens):
+        value = tok.value
+        upper = value.upper() if tok.kind == WORD else None
+        if value == '(':
+            depth += 1
+        elif value == ')':
+            depth -= 1
+        if list_depth is not None and (
+                depth < list_depth or tok.kind == SEMICOLON or (depth == list_depth and upper in _SELECT_LIST_END)):
+            list_depth = None
+        if i == list_start and upper in ('DISTINCT', 'ALL'):
+            parts.append(upper)
+            list_start += 1
+            continue
+        if list_depth is not None or upper not in CLAUSE_KEYWORDS:
+            parts.append(value)
+            continue
+        previous = tokens[i - 1].value if i else ''
+        following = tokens[i + 1].value if i + 1 < len(tokens) else ''
+        if previous.upper() == 'AS' or previous == '.' or following == '.':
+            parts.append(value)
+            continue
+        parts.append(upper)
+        if upper == 'SELECT':
+            list_depth, list_start = depth, i + 1
+    while parts and parts[-1] == ';':
+        parts.pop()
+    return ' '.join(parts)
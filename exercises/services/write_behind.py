@@ -0,0 +1,184 @@
+import atexit
+import logging
+import os
+import threading
+from typing import Callable, Dict, Hashable, List
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+_writers: List['BatchWriter'] = []
+
+
+class BatchWriter:
+    """
+    Buffers writes in process and hands them to `handler` in batches from a background thread.
+    A batch is flushed every WRITE_BEHIND_INTERVAL seconds, or as soon as WRITE_BEHIND_MAX_PENDING
+    items are waiting. A batch whose handler raises is put back and retried on the next flush;
+    everything still buffered is flushed when the process exits.
+    With WRITE_BEHIND_ENABLED = False every add() is written immediately (tests, scripts).
+    """
+
+    def __init__(self, name: str, handler: Callable[[list], None]):
+        self.name = name
+        self.handler = handler
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._stopping = False
+        self._in_flight = []
+        self._reset()
+        _writers.append(self)
+
+    # Buffer operations; subclasses change how items accumulate
+
+    def _reset(self):
+        self._pending = []
+
+    def _put(self, item):
+        self._pending.append(item)
+
+    def _take(self) -> list:
+        batch = self._pending
+        self._reset()
+        return batch
+
+    def _requeue(self, batch: list):
+        self._pending[:0] = batch
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _items(self, batch) -> list:
+        return list(batch)
+
+    # Public API
+
+    def _write_through(self) -> bool:
+        return self._stopping or not getattr(settings, 'WRITE_BEHIND_ENABLED', True)
+
+    def add(self, item):
+        if self._write_through():
+            self.handler([item])
+            return
+        with self._lock:
+            self._put(item)
+            pending = len(self)
+            self._ensure_thread()
+        if pending >= getattr(settings, 'WRITE_BEHIND_MAX_PENDING', 1000):
+            self._wake.set()
+
+    def flush(self) -> int:
+        """Write everything buffered now; returns the number of items written"""
+        with self._flush_lock:
+            with self._lock:
+                batch = self._take()
+                self._in_flight = self._items(batch)
+            if not batch:
+                return 0
+            try:
+                self.handler(batch)
+            except Exception:
+                logger.exception('Write-behind flush of %d %s item(s) failed; will retry', len(batch), self.name)
+                with self._lock:
+                    self._requeue(batch)
+                    self._in_flight = []
+                return 0
+            with self._lock:
+                self._in_flight = []
+            return len(batch)
+
+    def snapshot(self) -> list:
+        """
+        Items not yet known to be written, oldest first: the batch being flushed, then the
+        buffer. Lets readers see their own pending writes without forcing a flush.
+        """
+        with self._lock:
+            return self._in_flight + self._items(self._pending)
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the flusher thread and write whatever is left"""
+        self._stopping = True
+        self._wake.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout)
+        self.flush()
+
+    def _ensure_thread(self):
+        # Started lazily, and again in a forked worker, which inherits the buffer but not the thread
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name=f'chatsql-write-{self.name}', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        interval = getattr(settings, 'WRITE_BEHIND_INTERVAL', 1.0)
+        while not self._stopping:
+            self._wake.wait(interval)
+            self._wake.clear()
+            if self._stopping:
+                break
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+
+class CoalescingWriter(BatchWriter):
+    """
+    BatchWriter that keeps one pending entry per key: add(key, item) folds `item` into
+    whatever is already buffered for `key` with merge(old, new).
+    """
+
+    def __init__(self, name: str, handler: Callable[[Dict], None], merge: Callable):
+        self.merge = merge
+        super().__init__(name, handler)
+
+    def _reset(self):
+        self._pending = {}
+
+    def _items(self, batch) -> list:
+        return list(batch.items())
+
+    def _put(self, entry):
+        key, item = entry
+        old = self._pending.get(key)
+        self._pending[key] = item if old is None else self.merge(old, item)
+
+    def _requeue(self, batch: Dict):
+        # Entries added since the failed flush are newer, so they merge on top
+        newer = self._pending
+        self._pending = dict(batch)
+        for key, item in newer.items():
+            self._put((key, item))
+
+    def add(self, key: Hashable, item):
+        if self._write_through():
+            self.handler({key: item})
+            return
+        super().add((key, item))
+
+
+def pending_writes() -> Dict[str, int]:
+    """Buffered entries per writer name"""
+    return {writer.name: len(writer) for writer in _writers}
+
+
+def flush_all() -> int:
+    """Flush every write-behind buffer in this process, e.g. before reading what they write"""
+    return sum(writer.flush() for writer in _writers)
+
+
+@atexit.register
+def _shutdown():
+    for writer in _writers:
+        try:
+            writer.stop()
+        except Exception:
+            logger.exception('Could not flush %s writes at exit', writer.name)
@@ -0,0 +1,27 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import DatabaseSchema, Exercise, UserProgress
+from .services.catalog import bump_catalog_version
+from .services.progress import forget_session_progress
+from .services.result_cache import invalidate_expected_results
+from .services.sandbox import sandboxes
+
+
+@receiver([post_save, post_delete], sender=Exercise)
+def exercise_changed(sender, instance, **kwargs):
+    invalidate_expected_results([instance.id])
+    bump_catalog_version()
+
+
+@receiver([post_save, post_delete], sender=DatabaseSchema)
+def schema_changed(sender, instance, **kwargs):
+    # On delete, cascaded exercises send their own post_delete
+    invalidate_expected_results(Exercise.objects.filter(schema_id=instance.id).values_list('id', flat=True))
+    sandboxes.discard(instance.id)
+    bump_catalog_version()
+
+
+@receiver(post_delete, sender=UserProgress)
+def progress_deleted(sender, instance, **kwargs):
+    forget_session_progress(instance.session_id)
@@ -0,0 +1,1053 @@
+import datetime
+import decimal
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from unittest import mock
+
+import pymysql
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import AsyncClient, Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from .models import DatabaseSchema, Exercise, UserProgress
+from .services import backends as backends_module
+from .services import executor as executor_module
+from .services import progress as progress_module
+from .services import result_spill as result_spill_module
+from .services.backends import BackendError, MySQLBackend, SQLiteFileBackend, SQLiteMemoryBackend
+from .services.datasets import is_generated
+from .services.executor import QueryGovernor, QueryLimitExceeded, SQLExecutor
+from .services.pool import ConnectionPool, PoolTimeout
+from .services.progress import attempt_writer, get_session_progress, is_completed, mark_completed, queue_attempt
+from .services.query_cache import get_query_cache
+from .services.query_runner import get_runner, run_submission_queries
+from .services.result_cache import get_cached_expected_result, store_expected_result
+from .services.result_format import COLUMNAR, encode_result, requested_format, to_columnar, type_code
+from .services.result_spill import ResultSpill
+from .services.seeding import SEED_STATE_TABLE, apply_schema
+from .services.sql_validator import MYSQL, SQLITE, canonical_query, validate_sql
+from .services.write_behind import CoalescingWriter, _writers, flush_all, pending_writes
+
+SCHEMA_SQL = """
+CREATE TABLE employees (id INT PRIMARY KEY, name VARCHAR(50) NOT NULL, salary INT);
+"""
+
+SEED_SQL = """
+INSERT INTO employees (id, name, salary) VALUES (1, 'Ana', 50000), (2, 'Ben', 62000), (3, 'Chen', 48000);
+"""
+
+
+def create_exercise(**fields) -> Exercise:
+    schema = DatabaseSchema.objects.create(
+        name='test_hr', display_name='Test HR', description='Employees', db_name='practice_test_hr',
+        schema_sql=SCHEMA_SQL, seed_sql=SEED_SQL,
+    )
+    return Exercise.objects.create(**{
+        'schema': schema,
+        'title': 'Well paid',
+        'description': 'Employees earning over 49000, by id',
+        'difficulty': 'easy',
+        'expected_sql': 'SELECT id, name FROM employees WHERE salary > 49000 ORDER BY id',
+        **fields,
+    })
+
+
+# The offload pool runs the views' database work on its own threads, which cannot see a
+# TestCase's uncommitted transaction
+@override_settings(WRITE_BEHIND_ENABLED=False, PRACTICE_DATA_DIR=None, PRACTICE_DB_BACKENDS={})
+class AsyncViewTests(TransactionTestCase):
+    """The /api/async/ endpoints"""
+
+    def setUp(self):
+        cache.clear()
+        self.exercise = create_exercise()
+        self.client = AsyncClient()
+
+    async def post(self, path, body, **extra):
+        return await self.client.post(path, body, content_type='application/json', **extra)
+
+    async def test_execute(self):
+        response = await self.post(f'/api/async/exercises/{self.exercise.id}/execute/',
+                                   {'query': 'SELECT name FROM employees ORDER BY id'})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertIsNone(data['error'])
+        self.assertEqual(data['columns'], ['name'])
+        self.assertEqual(data['rows'], [['Ana'], ['Ben'], ['Chen']])
+
+    async def test_execute_rejects_writes(self):
+        response = await self.post(f'/api/async/exercises/{self.exercise.id}/execute/',
+                                   {'query': 'DELETE FROM employees'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['error'])
+
+    async def test_submit_correct(self):
+        response = await self.post(f'/api/async/exercises/{self.exercise.id}/submit/',
+                                   {'query': 'SELECT id, name FROM employees WHERE salary >= 50000 ORDER BY id'})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['correct'])
+        self.assertEqual(data['user_result']['rows'], [[1, 'Ana'], [2, 'Ben']])
+
+    async def test_submit_wrong(self):
+        response = await self.post(f'/api/async/exercises/{self.exercise.id}/submit/',
+                                   {'query': 'SELECT id, name FROM employees ORDER BY id'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()['correct'])
+
+    async def test_ai(self):
+        response = await self.post(f'/api/async/exercises/{self.exercise.id}/ai/', {'message': 'Where do I start?'})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['response'])
+        self.assertFalse(data['cached'])
+
+    async def test_unknown_exercise(self):
+        for path, body in (('execute', {'query': 'SELECT 1'}), ('submit', {'query': 'SELECT 1'}),
+                           ('ai', {'message': 'hi'})):
+            with self.subTest(path=path):
+                response = await self.post(f'/api/async/exercises/999999/{path}/', body)
+                self.assertEqual(response.status_code, 404)
+
+    async def test_invalid_json(self):
+        for path in ('execute', 'submit', 'ai'):
+            for body in ('{not json', '[1, 2]'):
+                with self.subTest(path=path, body=body):
+                    response = await self.post(f'/api/async/exercises/{self.exercise.id}/{path}/', body)
+                    self.assertEqual(response.status_code, 400)
+                    self.assertEqual(response.json()['error'], 'Invalid JSON body')
+
+    async def test_missing_fields(self):
+        for path, error in (('execute', 'Query is required'), ('submit', 'Query is required'),
+                            ('ai', 'message or user_query or error is required')):
+            with self.subTest(path=path):
+                response = await self.post(f'/api/async/exercises/{self.exercise.id}/{path}/', {})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['error'], error)
+
+    async def test_query_must_be_a_string(self):
+        for path in ('execute', 'submit'):
+            for query in (42, ['SELECT 1'], {'sql': 'SELECT 1'}):
+                with self.subTest(path=path, query=query):
+                    response = await self.post(f'/api/async/exercises/{self.exercise.id}/{path}/', {'query': query})
+                    self.assertEqual(response.status_code, 400)
+                    self.assertEqual(response.json()['error'], 'Query must be a string')
+
+    async def test_get_not_allowed(self):
+        response = await self.client.get(f'/api/async/exercises/{self.exercise.id}/execute/')
+        self.assertEqual(response.status_code, 405)
+
+
+@override_settings(WRITE_BEHIND_ENABLED=False, PRACTICE_DATA_DIR=None, PRACTICE_DB_BACKENDS={})
+class QueryViewTests(TestCase):
+    """The execute and submit endpoints"""
+
+    def setUp(self):
+        cache.clear()
+        self.exercise = create_exercise()
+
+    def post(self, path, body):
+        return self.client.post(f'/api/exercises/{self.exercise.id}/{path}/', body, content_type='application/json')
+
+    def test_execute(self):
+        response = self.post('execute', {'query': '  SELECT name FROM employees ORDER BY id  '})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['rows'], [['Ana'], ['Ben'], ['Chen']])
+
+    def test_query_must_be_a_string(self):
+        for path in ('execute', 'submit'):
+            for body, error in (({'query': 42}, 'Query must be a string'),
+                                ({'query': ['SELECT 1']}, 'Query must be a string'),
+                                ({'query': None}, 'Query is required'),
+                                ({}, 'Query is required')):
+                with self.subTest(path=path, body=body):
+                    response = self.post(path, body)
+                    self.assertEqual(response.status_code, 400)
+                    self.assertEqual(response.json()['error'], error)
+
+
+class FakeConnection:
+    """Stands in for a pymysql connection in ConnectionPool tests"""
+
+    def __init__(self):
+        self.open = True
+        self.healthy = True
+
+    def ping(self, reconnect=False):
+        if not self.healthy:
+            raise pymysql.OperationalError(2006, 'MySQL server has gone away')
+
+    def close(self):
+        self.open = False
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """Checkout, return and replacement of pooled connections"""
+
+    def pool(self, **options):
+        pool = ConnectionPool('practice_test', {}, **{'MAX_SIZE': 2, 'WAIT_TIMEOUT': 0.05, **options})
+        self.connections = []
+
+        def connect():
+            conn = FakeConnection()
+            self.connections.append(conn)
+            return conn
+
+        self.enterContext(mock.patch.object(pool, '_connect', connect))
+        return pool
+
+    def test_returned_connections_are_reused(self):
+        pool = self.pool()
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            self.assertIs(second, first)
+        metrics = pool.metrics()
+        self.assertEqual((metrics['created'], metrics['reused'], metrics['in_use'], metrics['idle']), (1, 1, 0, 1))
+
+    def test_waits_for_a_free_connection_then_times_out(self):
+        pool = self.pool(WAIT_TIMEOUT=5)
+        first, second = pool.acquire(), pool.acquire()
+        threading.Timer(0.05, pool.release, [first]).start()
+        self.assertIs(pool.acquire(), first)
+
+        pool.wait_timeout = 0.05
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        self.assertEqual(pool.metrics()['timeouts'], 1)
+        pool.release(second)
+        self.assertIs(pool.acquire(), second)
+
+    def test_driver_errors_discard_the_connection(self):
+        pool = self.pool()
+        with self.assertRaises(pymysql.OperationalError):
+            with pool.connection():
+                raise pymysql.OperationalError(2013, 'Lost connection')
+        closed = self.connections[0]
+        self.assertFalse(closed.open)
+        with pool.connection() as conn:
+            self.assertIsNot(conn, closed)
+        self.assertEqual((pool.metrics()['discarded'], pool.metrics()['in_use']), (1, 0))
+
+    def test_closed_connections_are_not_returned_to_the_pool(self):
+        pool = self.pool()
+        conn = pool.acquire()
+        conn.close()
+        pool.release(conn)
+        self.assertEqual((pool.metrics()['idle'], pool.metrics()['in_use']), (0, 0))
+
+    def test_failed_health_check_replaces_the_connection(self):
+        pool = self.pool(HEALTH_CHECK_AFTER=0)
+        with pool.connection() as conn:
+            conn.healthy = False
+        with pool.connection() as replacement:
+            self.assertIsNot(replacement, conn)
+        self.assertFalse(conn.open)
+        self.assertEqual(pool.metrics()['health_check_failures'], 1)
+
+    def test_idle_connections_expire(self):
+        pool = self.pool(MAX_IDLE_TIME=0)
+        with pool.connection() as conn:
+            pass
+        with pool.connection() as fresh:
+            self.assertIsNot(fresh, conn)
+        self.assertFalse(conn.open)
+        self.assertEqual(pool.metrics()['evicted'], 1)
+
+    def test_failed_connect_frees_the_slot(self):
+        pool = self.pool(MAX_SIZE=1)
+        with mock.patch.object(pool, '_connect', side_effect=pymysql.OperationalError(2003, "Can't connect")):
+            with self.assertRaises(pymysql.OperationalError):
+                pool.acquire()
+        self.assertEqual(pool.metrics()['in_use'], 0)
+        pool.release(pool.acquire())
+
+
+class FakeMySQLConnection:
+    """Records statements; raises `error` from every execute when set"""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.executed = []
+
+    def thread_id(self):
+        return 42
+
+    @contextmanager
+    def cursor(self):
+        yield self
+
+    def execute(self, sql, args=None):
+        self.executed.append((sql, args))
+        if self.error is not None:
+            raise self.error
+
+
+class FakePool:
+    alias = 'practice_test'
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    @contextmanager
+    def connection(self):
+        yield self.conn
+
+
+def forever() -> str:
+    return 'WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT COUNT(*) FROM n'
+
+
+class QueryGovernorTests(SimpleTestCase):
+    """Per-session concurrency, SQLite time and step limits, and KILL QUERY on MySQL"""
+
+    def test_session_slots(self):
+        governor = QueryGovernor(MAX_CONCURRENT_PER_SESSION=1)
+        with governor.session_slot('s1'), governor.session_slot('s2'), governor.session_slot(None):
+            with self.assertRaises(QueryLimitExceeded):
+                with governor.session_slot('s1'):
+                    pass
+        with self.assertRaises(ValueError), governor.session_slot('s1'):
+            raise ValueError
+        with governor.session_slot('s1'):
+            pass
+        self.assertEqual(dict(governor._running), {})
+
+    def run_sqlite(self, governor, query):
+        conn = sqlite3.connect(':memory:')
+        self.addCleanup(conn.close)
+        with governor.sqlite_limits(conn):
+            return conn.execute(query).fetchall()
+
+    def test_sqlite_step_budget(self):
+        governor = QueryGovernor(STATEMENT_TIMEOUT=60, SQLITE_MAX_STEPS=100000, SQLITE_CHECK_INTERVAL=1000)
+        with self.assertRaisesMessage(sqlite3.OperationalError, 'interrupted'):
+            self.run_sqlite(governor, forever())
+        self.assertEqual(self.run_sqlite(governor, 'SELECT 1'), [(1,)])
+
+    def test_sqlite_time_limit(self):
+        governor = QueryGovernor(STATEMENT_TIMEOUT=0.05, SQLITE_MAX_STEPS=10 ** 12)
+        start = time.monotonic()
+        with self.assertRaisesMessage(sqlite3.OperationalError, 'interrupted'):
+            self.run_sqlite(governor, forever())
+        self.assertLess(time.monotonic() - start, 5)
+
+    def test_mysql_session_settings(self):
+        governor = QueryGovernor(STATEMENT_TIMEOUT=2.5, MAX_JOIN_SIZE=1000, MAX_RESULT_ROWS=11)
+        self.assertEqual(
+            governor.mysql_init_command(),
+            'SET SESSION MAX_EXECUTION_TIME = 2500, SESSION max_join_size = 1000, SESSION sql_select_limit = 11',
+        )
+
+    def test_kill_query(self):
+        conn = FakeMySQLConnection()
+        QueryGovernor().kill_mysql_query(FakePool(conn), 42)
+        self.assertEqual(conn.executed, [('KILL QUERY %s', (42,))])
+
+        conn.error = pymysql.OperationalError(2013, 'Lost connection')
+        with self.assertLogs('exercises.services.executor', 'WARNING'):
+            QueryGovernor().kill_mysql_query(FakePool(conn), 42)
+
+    def test_client_timeout_kills_the_statement(self):
+        backend = MySQLBackend.__new__(MySQLBackend)
+        backend.governor = mock.Mock()
+        backend.pool = FakePool(FakeMySQLConnection(pymysql.OperationalError(2013, 'Lost connection')))
+        with self.assertRaisesMessage(BackendError, 'Lost connection'):
+            backend.run('SELECT SLEEP(60)', 10)
+        backend.governor.kill_mysql_query.assert_called_once_with(backend.pool, 42)
+
+        backend.governor.reset_mock()
+        backend.pool.conn.error = pymysql.ProgrammingError(1064, 'You have an error in your SQL syntax')
+        with self.assertRaises(BackendError):
+            backend.run('SELECT', 10)
+        backend.governor.kill_mysql_query.assert_not_called()
+
+
+class SQLiteFileBackendTests(SimpleTestCase):
+    """Student queries on a SQLite file get a read-only connection that can't see the app's tables"""
+
+    def setUp(self):
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir)
+        self.path = os.path.join(data_dir, 'app.sqlite3')
+        with sqlite3.connect(self.path) as conn:
+            conn.executescript(
+                SCHEMA_SQL + SEED_SQL + "CREATE TABLE auth_user (username TEXT, password TEXT);"
+                "INSERT INTO auth_user VALUES ('admin', 'pbkdf2_sha256$secret');"
+            )
+        conn.close()
+
+    def backend(self, **options):
+        return SQLiteFileBackend('practice_app', governor=QueryGovernor(), **options)
+
+    def alias_backend(self):
+        # An ALIAS naming a Django SQLite database; its table list comes from the test database
+        self.enterContext(mock.patch.dict(settings.DATABASES, {
+            'practice_app': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': self.path},
+        }))
+        self.enterContext(mock.patch.object(backends_module, 'connections', {'practice_app': connection}))
+        return self.backend(ALIAS='practice_app')
+
+    def employees(self):
+        with sqlite3.connect(self.path) as conn:
+            rows = conn.execute('SELECT COUNT(*) FROM employees').fetchone()[0]
+        conn.close()
+        return rows
+
+    def test_reads(self):
+        backend = self.alias_backend()
+        self.assertEqual(backend.run('SELECT name FROM employees ORDER BY id', 10)[1], [('Ana',), ('Ben',), ('Chen',)])
+        query = f'SELECT upper(name) FROM ({numbers(3)}) AS n, employees'
+        self.assertEqual(len(backend.run(query, 100)[1]), 9)
+
+    def test_app_tables_are_denied(self):
+        backend = self.alias_backend()
+        for query in ('SELECT username, password FROM auth_user',
+                      'SELECT * FROM employees WHERE name IN (SELECT username FROM AUTH_USER)'):
+            with self.subTest(query=query), self.assertRaisesMessage(BackendError, 'prohibited'):
+                backend.run(query, 10)
+
+    def test_path_backend_reads_every_table(self):
+        self.assertEqual(self.backend(PATH=self.path).run('SELECT username FROM auth_user', 10)[1], [('admin',)])
+
+    def test_writes_are_refused(self):
+        for backend in (self.alias_backend(), self.backend(PATH=self.path)):
+            for query in ('DELETE FROM employees', "INSERT INTO employees (id, name) VALUES (9, 'Eve')",
+                          'CREATE TABLE t (x)', "ATTACH DATABASE ':memory:' AS other", 'PRAGMA query_only = OFF'):
+                with self.subTest(backend=backend.options, query=query), self.assertRaises(BackendError):
+                    backend.run(query, 10)
+        self.assertEqual(self.employees(), 3)
+
+    def test_alias_must_be_a_sqlite_file(self):
+        with self.assertRaisesMessage(BackendError, 'is not configured'):
+            self.backend(ALIAS='missing').run('SELECT 1', 10)
+
+
+@override_settings(PRACTICE_DATA_DIR=None, PRACTICE_DB_BACKENDS={})
+class GovernedExecutionTests(TestCase):
+    """Runaway student queries come back as errors, not hung requests"""
+
+    def test_runaway_query_is_stopped(self):
+        exercise = create_exercise()
+        governor = QueryGovernor(STATEMENT_TIMEOUT=0.05)
+        with mock.patch.object(executor_module, '_governor', governor):
+            result = get_runner(exercise)(forever(), session_key='s1')
+        self.assertFalse(result['success'])
+        self.assertIn('exceeded the execution limits', result['error'])
+        self.assertEqual(dict(governor._running), {})
+
+
+@override_settings(WRITE_BEHIND_ENABLED=True, WRITE_BEHIND_INTERVAL=3600, WRITE_BEHIND_MAX_PENDING=1000)
+class CoalescingWriterTests(SimpleTestCase):
+    """Buffering, coalescing and retry of write-behind batches, flushed by hand"""
+
+    def setUp(self):
+        self.batches = []
+        self.fail = False
+        self.writer = CoalescingWriter('test', self.handle, lambda old, new: old + new)
+
+    def tearDown(self):
+        _writers.remove(self.writer)
+
+    def handle(self, batch):
+        if self.fail:
+            raise RuntimeError('database is down')
+        self.batches.append(dict(batch))
+
+    def test_coalesces_per_key(self):
+        for key, n in (('a', 1), ('b', 10), ('a', 2), ('a', 3)):
+            self.writer.add(key, n)
+        self.assertEqual(len(self.writer), 2)
+        self.assertEqual(self.batches, [])
+        self.assertEqual(self.writer.flush(), 2)
+        self.assertEqual(self.batches, [{'a': 6, 'b': 10}])
+        self.assertEqual(len(self.writer), 0)
+        self.assertEqual(self.writer.flush(), 0)
+
+    def test_failed_flush_is_retried_with_newer_items_merged(self):
+        self.writer.add('a', 1)
+        self.fail = True
+        with self.assertLogs('exercises.services.write_behind', 'ERROR'):
+            self.assertEqual(self.writer.flush(), 0)
+        self.writer.add('a', 2)
+        self.writer.add('b', 5)
+        self.assertEqual(self.writer.snapshot(), [('a', 3), ('b', 5)])
+        self.fail = False
+        self.assertEqual(self.writer.flush(), 2)
+        self.assertEqual(self.batches, [{'a': 3, 'b': 5}])
+
+    def test_write_through_when_disabled(self):
+        with self.settings(WRITE_BEHIND_ENABLED=False):
+            self.writer.add('a', 1)
+        self.assertEqual(self.batches, [{'a': 1}])
+        self.assertEqual(len(self.writer), 0)
+
+    def test_flush_all(self):
+        self.writer.add('a', 1)
+        self.assertEqual(pending_writes()['test'], 1)
+        flush_all()
+        self.assertEqual(self.batches, [{'a': 1}])
+
+
+@override_settings(WRITE_BEHIND_ENABLED=True, WRITE_BEHIND_INTERVAL=3600, WRITE_BEHIND_MAX_PENDING=1000)
+class AttemptTrackingTests(TestCase):
+    """Attempts are buffered, reach UserProgress in one bulk flush and invalidate the cached progress"""
+
+    def setUp(self):
+        cache.clear()
+        self.exercise = create_exercise()
+        self.other = Exercise.objects.create(
+            schema=self.exercise.schema, title='Everyone', description='All employees', difficulty='easy',
+            expected_sql='SELECT * FROM employees',
+        )
+        attempt_writer.flush()
+
+    def test_attempts_are_buffered_and_coalesced(self):
+        for query in ('SELECT 1', 'SELECT 2', 'SELECT 3'):
+            queue_attempt('s1', self.exercise.id, query)
+        queue_attempt('s1', self.other.id, 'SELECT 4')
+        self.assertFalse(UserProgress.objects.exists())
+        self.assertEqual(len(attempt_writer), 2)
+
+        with self.assertNumQueries(6):  # savepoint, select, bulk insert, select, bulk update, release
+            self.assertEqual(attempt_writer.flush(), 2)
+        progress = UserProgress.objects.get(session_id='s1', exercise=self.exercise)
+        self.assertEqual((progress.attempts, progress.last_query), (3, 'SELECT 3'))
+        self.assertEqual(UserProgress.objects.get(session_id='s1', exercise=self.other).attempts, 1)
+
+    def test_flush_adds_to_existing_rows(self):
+        UserProgress.objects.create(session_id='s1', exercise=self.exercise, attempts=4, completed=True)
+        queue_attempt('s1', self.exercise.id, 'SELECT 1')
+        queue_attempt('s1', self.exercise.id, 'SELECT 2')
+        attempt_writer.flush()
+        progress = UserProgress.objects.get(session_id='s1', exercise=self.exercise)
+        self.assertEqual((progress.attempts, progress.completed, progress.last_query), (6, True, 'SELECT 2'))
+
+    def test_cached_progress_sees_buffered_attempts(self):
+        UserProgress.objects.create(session_id='s1', exercise=self.exercise, attempts=4)
+        self.assertEqual(get_session_progress('s1')['attempts'], {self.exercise.id: 4})
+        queue_attempt('s1', self.exercise.id, 'SELECT 1')
+        queue_attempt('s1', self.exercise.id, 'SELECT 2')
+        queue_attempt('s2', self.exercise.id, 'SELECT 3')
+        # Buffered attempts neither invalidate the cached entry nor force a flush
+        with self.assertNumQueries(0):
+            self.assertEqual(get_session_progress('s1')['attempts'], {self.exercise.id: 6})
+        self.assertEqual(len(attempt_writer), 2)
+
+        attempt_writer.flush()
+        with self.assertNumQueries(1):
+            self.assertEqual(get_session_progress('s1')['attempts'], {self.exercise.id: 6})
+        with self.assertNumQueries(0):
+            self.assertEqual(get_session_progress('s1')['attempts'], {self.exercise.id: 6})
+
+
+@override_settings(PRACTICE_DATA_DIR=None, PRACTICE_DB_BACKENDS={})
+class ExpectedResultCacheTests(TestCase):
+    """Reference results are cached per exercise and dropped when the exercise or its schema changes"""
+
+    def setUp(self):
+        cache.clear()
+        self.exercise = create_exercise()
+
+    def submit(self, exercise=None):
+        exercise = Exercise.objects.select_related('schema').get(id=(exercise or self.exercise).id)
+        return run_submission_queries(exercise, 'SELECT id, name FROM employees')
+
+    def test_second_submission_uses_the_cache(self):
+        _, expected, timings = self.submit()
+        self.assertFalse(timings['expected_cached'])
+        self.assertEqual(expected['rows'], [[1, 'Ana'], [2, 'Ben']])
+        _, cached, timings = self.submit()
+        self.assertTrue(timings['expected_cached'])
+        self.assertEqual(cached, expected)
+
+    def test_failed_results_are_not_cached(self):
+        self.assertIsNone(store_expected_result(self.exercise, {'success': False, 'error': 'boom'}))
+        self.assertIsNone(get_cached_expected_result(self.exercise))
+
+    def test_editing_the_exercise_invalidates(self):
+        self.submit()
+        self.exercise.expected_sql = 'SELECT id, name FROM employees WHERE salary < 49000'
+        self.exercise.save()
+        _, expected, timings = self.submit()
+        self.assertFalse(timings['expected_cached'])
+        self.assertEqual(expected['rows'], [[3, 'Chen']])
+
+    def test_editing_the_schema_invalidates(self):
+        self.submit()
+        schema = self.exercise.schema
+        schema.seed_sql += "INSERT INTO employees (id, name, salary) VALUES (4, 'Dee', 70000);"
+        schema.save()
+        _, expected, timings = self.submit()
+        self.assertFalse(timings['expected_cached'])
+        self.assertEqual(expected['rows'], [[1, 'Ana'], [2, 'Ben'], [4, 'Dee']])
+
+    def test_updates_that_skip_signals_miss_on_the_fingerprint(self):
+        self.submit()
+        Exercise.objects.filter(id=self.exercise.id).update(expected_sql='SELECT id, name FROM employees WHERE id = 3')
+        _, expected, timings = self.submit()
+        self.assertFalse(timings['expected_cached'])
+        self.assertEqual(expected['rows'], [[3, 'Chen']])
+
+
+class CatalogTests(TestCase):
+    """Schema and exercise lists come from the cached catalog and revalidate with ETags"""
+
+    def setUp(self):
+        cache.clear()
+        self.exercise = create_exercise()
+
+    def test_not_modified(self):
+        response = self.client.get('/api/catalog/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([ex['id'] for ex in response.json()['exercises']], [self.exercise.id])
+        etag = response['ETag']
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        for header in (etag, f'W/{etag}', f'"other", {etag}', '*'):
+            with self.subTest(header=header), self.assertNumQueries(0):
+                response = self.client.get('/api/catalog/', HTTP_IF_NONE_MATCH=header)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+                self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get('/api/catalog/', HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_edits_change_the_etag(self):
+        etag = self.client.get('/api/schemas/')['ETag']
+        self.exercise.title = 'Renamed'
+        self.exercise.save()
+        response = self.client.get('/api/catalog/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['exercises'][0]['title'], 'Renamed')
+
+        etag = response['ETag']
+        self.exercise.delete()
+        response = self.client.get('/api/catalog/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.json()['exercises']), (200, []))
+
+    def test_exercise_list_etag_covers_progress(self):
+        session = self.client.session
+        session.save()
+        response = self.client.get('/api/exercises/')
+        etag = response['ETag']
+        self.assertIn('Cookie', response['Vary'])
+        self.assertEqual(self.client.get('/api/exercises/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        UserProgress.objects.create(session_id=session.session_key, exercise=self.exercise, completed=True)
+        mark_completed(session.session_key, self.exercise.id)
+        response = self.client.get('/api/exercises/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertTrue(response.json()[0]['completed'])
+
+
+class ProgressCacheTests(TestCase):
+    """Completed exercises in the session's cached progress"""
+
+    def setUp(self):
+        cache.clear()
+        self.exercise = create_exercise()
+
+    def complete(self, session_id, exercise):
+        UserProgress.objects.update_or_create(session_id=session_id, exercise=exercise, defaults={'completed': True})
+        mark_completed(session_id, exercise.id)
+
+    def test_completed_ids(self):
+        big = Exercise.objects.create(id=10 ** 9, schema=self.exercise.schema, title='Big id', description='',
+                                      difficulty='easy', expected_sql='SELECT 1')
+        self.assertEqual(get_session_progress('s1')['completed'], [])
+        self.complete('s1', big)
+        self.complete('s1', self.exercise)
+        progress = get_session_progress('s1')
+        self.assertEqual(progress['completed'], [self.exercise.id, big.id])
+        self.assertTrue(is_completed(progress, big.id))
+        self.assertFalse(is_completed(progress, big.id - 1))
+        self.assertEqual(get_session_progress('s2')['completed'], [])
+
+    def test_write_during_rebuild_is_not_lost(self):
+        # A reader loads the progress, a submission lands, then the reader caches what it loaded
+        load = progress_module._load
+
+        def load_then_complete(session_id):
+            progress = load(session_id)
+            self.complete(session_id, self.exercise)
+            return progress
+
+        with mock.patch.object(progress_module, '_load', load_then_complete):
+            self.assertEqual(get_session_progress('s1')['completed'], [])
+        self.assertEqual(get_session_progress('s1')['completed'], [self.exercise.id])
+
+    def test_forget(self):
+        self.complete('s1', self.exercise)
+        self.assertTrue(is_completed(get_session_progress('s1'), self.exercise.id))
+        UserProgress.objects.filter(session_id='s1').delete()
+        self.assertEqual(get_session_progress('s1')['completed'], [])
+
+
+# SQLite refuses bulk_load()'s PRAGMAs inside a TestCase transaction
+class ApplySchemaTests(TransactionTestCase):
+    """Loading a DatabaseSchema into the default database"""
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS employees')
+            cursor.execute(f'DROP TABLE IF EXISTS {SEED_STATE_TABLE}')
+
+    def test_loads_schema_and_seed(self):
+        schema = create_exercise().schema
+        result = apply_schema(schema)
+        self.assertIsNone(result.error)
+        self.assertEqual(result.rows, 3)
+        self.assertTrue(apply_schema(schema).skipped)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM employees')
+            self.assertEqual(cursor.fetchone()[0], 3)
+
+    def test_failed_seed_rolls_back(self):
+        schema = create_exercise().schema
+        apply_schema(schema)
+        schema.seed_sql += "\nINSERT INTO employees (id, name, salary) VALUES (9, 'Dee', 1);\nINSERT INTO missing VALUES (1);"
+        result = apply_schema(schema)
+        self.assertIn('missing', result.error)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM employees')
+            self.assertEqual(cursor.fetchone()[0], 3)
+
+    def test_refuses_to_drop_app_tables(self):
+        exercise = create_exercise()
+        schema = DatabaseSchema(name='clash', schema_sql='CREATE TABLE Exercises (id INT PRIMARY KEY);', seed_sql='')
+        result = apply_schema(schema)
+        self.assertIn('Exercises', result.error)
+        self.assertTrue(Exercise.objects.filter(id=exercise.id).exists())
+
+
+def result(columns, rows):
+    return {'success': True, 'columns': columns, 'rows': rows, 'row_count': len(rows)}
+
+
+class CompareResultsTests(SimpleTestCase):
+    """Grading compares rows as a multiset, and checks order only between rows that differ on the sort key"""
+
+    def compare(self, user, expected, expected_sql=None):
+        order_by = SQLExecutor.order_by_items(expected_sql) if expected_sql else None
+        return SQLExecutor.compare_results(user, expected, ordered=order_by is not None, order_by=order_by)
+
+    def test_unordered_multiset(self):
+        expected = result(['id', 'name'], [[1, 'Ana'], [2, 'Ben'], [2, 'Ben']])
+        self.assertTrue(self.compare(result(['name', 'id'], [['Ben', 2], ['Ana', 1], ['Ben', 2]]), expected)['correct'])
+        verdict = self.compare(result(['id', 'name'], [[1, 'Ana'], [1, 'Ana'], [2, 'Ben']]), expected)
+        self.assertFalse(verdict['correct'])
+        self.assertEqual(verdict['diff']['first_mismatch'], {'unexpected_row': [1, 'Ana'], 'missing_row': [2, 'Ben']})
+
+    def test_values_are_not_confused(self):
+        for user_rows, expected_rows in (
+            ([['ab', 'c']], [['a', 'bc']]),
+            ([[None, 'x']], [['None', 'x']]),
+        ):
+            with self.subTest(rows=user_rows):
+                verdict = self.compare(result(['a', 'b'], user_rows), result(['a', 'b'], expected_rows))
+                self.assertFalse(verdict['correct'])
+
+    def test_ties_may_come_in_any_order(self):
+        sql = 'SELECT dept, name FROM employees ORDER BY dept'
+        expected = result(['dept', 'name'], [['hr', 'Ana'], ['hr', 'Ben'], ['it', 'Chen'], ['it', 'Dee']])
+        user = result(['dept', 'name'], [['hr', 'Ben'], ['hr', 'Ana'], ['it', 'Dee'], ['it', 'Chen']])
+        self.assertTrue(self.compare(user, expected, sql)['correct'])
+
+    def test_order_between_sort_keys_is_checked(self):
+        sql = 'SELECT dept, name FROM employees ORDER BY 1 DESC'
+        expected = result(['dept', 'name'], [['it', 'Chen'], ['hr', 'Ana'], ['hr', 'Ben']])
+        user = result(['dept', 'name'], [['hr', 'Ana'], ['it', 'Chen'], ['hr', 'Ben']])
+        verdict = self.compare(user, expected, sql)
+        self.assertFalse(verdict['correct'])
+        self.assertEqual(verdict['message'], 'Rows are not in the expected order')
+        self.assertEqual(verdict['diff']['first_mismatch']['row_index'], 0)
+
+    def test_wrong_rows_under_order_by(self):
+        sql = 'SELECT dept, name FROM employees ORDER BY dept, name'
+        expected = result(['dept', 'name'], [['hr', 'Ana'], ['hr', 'Ben']])
+        verdict = self.compare(result(['dept', 'name'], [['hr', 'Ana'], ['hr', 'Bob']]), expected, sql)
+        self.assertEqual(verdict['message'], 'Query results do not match expected output')
+
+    def test_order_by_columns_outside_the_result_are_not_checked(self):
+        sql = 'SELECT name FROM employees ORDER BY salary'
+        expected = result(['name'], [['Chen'], ['Ana'], ['Ben']])
+        self.assertTrue(self.compare(result(['name'], [['Ana'], ['Ben'], ['Chen']]), expected, sql)['correct'])
+
+    def test_columns_and_row_counts(self):
+        expected = result(['id', 'id'], [[1, 2]])
+        self.assertEqual(self.compare(result(['id'], [[1]]), expected)['message'], 'Column names do not match')
+        self.assertEqual(self.compare(result(['id', 'id'], [[1, 2], [1, 2]]), expected)['message'],
+                         'Row count mismatch: expected 1, got 2')
+        self.assertTrue(self.compare(result(['id', 'id'], [[1, 2]]), expected)['correct'])
+
+
+class ValidateSQLTests(SimpleTestCase):
+    """Only single read-only SELECT statements get through"""
+
+    def assertAllowed(self, query, dialect=None):
+        verdict = validate_sql(query, use_cache=False, dialect=dialect)
+        self.assertTrue(verdict.valid, verdict.message)
+
+    def assertBlocked(self, query, message, dialect=None):
+        verdict = validate_sql(query, use_cache=False, dialect=dialect)
+        self.assertFalse(verdict.valid)
+        self.assertIn(message, verdict.message)
+
+    def test_writes_are_blocked(self):
+        for query, message in (
+            ('DELETE FROM employees', 'Only SELECT'),
+            ('SELECT * FROM employees WHERE id IN (SELECT id FROM x); DROP TABLE x', 'Multiple statements'),
+            ('WITH x AS (SELECT 1) DELETE FROM employees', 'Only SELECT'),
+            ('WITH x AS (SELECT 1) UPDATE employees SET salary = 0', 'Only SELECT'),
+            ('WITH x AS (DELETE FROM employees RETURNING id) SELECT * FROM x', "'DELETE'"),
+            ('WITH RECURSIVE x(n) AS (SELECT 1), y AS (SELECT 2) INSERT INTO t SELECT * FROM y', 'Only SELECT'),
+            ('SELECT * FROM employees INTO OUTFILE \'/tmp/x\'', "'INTO OUTFILE'"),
+            ('SELECT name INTO DUMPFILE \'/tmp/x\' FROM employees', "'INTO DUMPFILE'"),
+            ('SET @x = 1', 'Only SELECT'),
+        ):
+            with self.subTest(query=query):
+                self.assertBlocked(query, message)
+
+    def test_keywords_inside_expressions(self):
+        for query in (
+            'SELECT CAST(name AS CHAR CHARACTER SET utf8mb4) FROM employees',
+            'SELECT CONVERT(name USING utf8mb4) FROM employees',
+            'SELECT CONVERT(name, CHAR CHARACTER SET latin1) FROM employees',
+            "SELECT REPLACE(name, 'a', 'b') FROM employees",
+            'SELECT e.update, e.set FROM events e',
+            'WITH x AS (SELECT 1 AS n) SELECT n FROM x',
+        ):
+            with self.subTest(query=query):
+                self.assertAllowed(query)
+
+    def test_strings_and_comments(self):
+        self.assertAllowed("SELECT 'DROP TABLE employees; --' AS s")
+        self.assertAllowed('SELECT "it\'s; DELETE" AS s', dialect=MYSQL)
+        self.assertBlocked('SELECT 1 -- DROP TABLE employees', 'Comments are not allowed')
+        self.assertBlocked('SELECT 1 /* x */', 'Comments are not allowed')
+        self.assertBlocked("SELECT 'unterminated", 'Unterminated')
+        # A backslash escapes the quote in MySQL only, so SQLite sees the DROP outside the string
+        query = "SELECT 'a\\'; DROP TABLE employees; SELECT '"
+        self.assertAllowed(query, dialect=MYSQL)
+        self.assertBlocked(query, 'Multiple statements', dialect=SQLITE)
+        self.assertBlocked(query, 'Multiple statements')
+
+    def test_multiple_statements(self):
+        self.assertAllowed('SELECT 1;')
+        self.assertAllowed('SELECT 1; ;\n')
+        self.assertBlocked('SELECT 1; SELECT 2', 'Multiple statements')
+        self.assertBlocked('SELECT 1; SET @x = 1', 'Multiple statements')
+
+
+class CanonicalQueryTests(SimpleTestCase):
+    """Queries that share a canonical form share result cache entries, so they must name columns alike"""
+
+    def test_keyword_case_and_layout(self):
+        self.assertEqual(
+            canonical_query('select id from t\n  where a in (1, 2) order by id desc; -- done'),
+            canonical_query('SELECT id FROM t WHERE a IN (1, 2) ORDER BY id DESC'),
+        )
+        self.assertEqual(canonical_query('select distinct a from t'), canonical_query('SELECT DISTINCT a FROM t'))
+
+    def test_select_lists_and_aliases_keep_their_case(self):
+        for a, b in (
+            ('SELECT a AS left FROM t', 'SELECT a AS LEFT FROM t'),
+            ('SELECT a and b FROM t', 'SELECT a AND b FROM t'),
+            ('SELECT * FROM (SELECT a or b FROM t) x', 'SELECT * FROM (SELECT a OR b FROM t) x'),
+            ('SELECT end.a FROM t AS end', 'SELECT end.a FROM t AS END'),
+        ):
+            with self.subTest(query=a):
+                self.assertNotEqual(canonical_query(a), canonical_query(b))
+
+
+class GenerateDatasetTests(TestCase):
+    """generate_dataset writes a SQLite file that student queries then run on"""
+
+    def setUp(self):
+        cache.clear()
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir)
+        self.enterContext(self.settings(PRACTICE_DATA_DIR=self.data_dir, PRACTICE_DB_BACKENDS={}))
+
+    def generate(self, *args):
+        call_command('generate_dataset', *args, stdout=io.StringIO())
+
+    def test_queries_run_on_the_file(self):
+        self.generate('hr', '--rows', '200', '--name', 'hr_test')
+        schema = DatabaseSchema.objects.get(name='hr_test')
+        self.assertTrue(is_generated(schema))
+        exercise = Exercise.objects.create(schema=schema, title='Count', description='', difficulty='easy',
+                                           expected_sql='SELECT COUNT(*) AS n FROM employees')
+        result = get_runner(exercise)('SELECT COUNT(*) AS n FROM employees')
+        self.assertTrue(result['success'])
+        self.assertEqual([list(row) for row in result['rows']], [[80]])
+
+        os.remove(os.path.join(self.data_dir, 'practice_hr_test.sqlite3'))
+        result = get_runner(exercise)('SELECT COUNT(*) AS n FROM employees')
+        self.assertFalse(result['success'])
+        self.assertIn('rerun manage.py generate_dataset', result['error'])
+
+    def test_rejects_bad_names(self):
+        for name in ('x' * 42, '../etc', 'hr test'):
+            with self.subTest(name=name), self.assertRaises(CommandError):
+                self.generate('hr', '--rows', '200', '--name', name)
+        self.assertFalse(DatabaseSchema.objects.exists())
+        self.assertEqual(os.listdir(self.data_dir), [])
+
+
+def numbers(n: int) -> str:
+    return f'WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < {n}) SELECT i FROM n'
+
+
+@override_settings(WRITE_BEHIND_ENABLED=False, PRACTICE_DATA_DIR=None, PRACTICE_DB_BACKENDS={})
+class ResultSpillTests(TestCase):
+    """Execute results paged through /api/results/<handle>/, including rows past MAX_ROWS"""
+
+    def setUp(self):
+        cache.clear()
+        get_query_cache().clear()
+        self.exercise = create_exercise()
+        spill_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spill_dir)
+        spill = ResultSpill(spill_dir, ttl=600, max_bytes=10 ** 8, max_entry_bytes=10 ** 7)
+        self.enterContext(mock.patch.object(result_spill_module, '_spill', spill))
+        self.enterContext(mock.patch.object(executor_module, '_governor', QueryGovernor(MAX_SPILL_ROWS=1500)))
+
+    def execute(self, query, page_size=100):
+        response = self.client.post(f'/api/exercises/{self.exercise.id}/execute/',
+                                    {'query': query, 'page_size': page_size}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def page(self, handle, offset, limit=100, client=None):
+        return (client or self.client).get(f'/api/results/{handle}/', {'offset': offset, 'limit': limit})
+
+    def test_small_results_are_not_spilled(self):
+        data = self.execute('SELECT name FROM employees ORDER BY id')
+        self.assertEqual(data['rows'], [['Ana'], ['Ben'], ['Chen']])
+        self.assertNotIn('result_handle', data)
+
+    def test_pages(self):
+        data = self.execute(numbers(250))
+        self.assertEqual((data['row_count'], len(data['rows']), data['truncated']), (250, 100, False))
+        page = self.page(data['result_handle'], 200).json()
+        self.assertEqual(page['rows'], [[i] for i in range(201, 251)])
+        self.assertEqual((page['row_count'], page['has_more']), (250, False))
+
+    def test_rows_past_max_rows_are_spilled_without_a_second_run(self):
+        run = SQLiteMemoryBackend.run
+        with mock.patch.object(SQLiteMemoryBackend, 'run', autospec=True, side_effect=run) as spy:
+            data = self.execute(numbers(1200))
+        self.assertEqual(spy.call_count, 1)
+        self.assertEqual((data['row_count'], len(data['rows']), data['truncated']), (1000, 100, True))
+        self.assertEqual((data['total_estimate'], data['total_is_lower_bound']), (1200, False))
+        page = self.page(data['result_handle'], 1100).json()
+        self.assertEqual(page['rows'], [[i] for i in range(1101, 1201)])
+        self.assertFalse(page['has_more'])
+
+    def test_spill_cap_gives_a_lower_bound(self):
+        data = self.execute(numbers(5000))
+        self.assertEqual((data['total_estimate'], data['total_is_lower_bound']), (1500, True))
+        page = self.page(data['result_handle'], 1450).json()
+        self.assertEqual(page['rows'], [[i] for i in range(1451, 1501)])
+        self.assertEqual((page['row_count'], page['total_is_lower_bound'], page['has_more']), (1500, True, False))
+
+    def test_cached_truncated_result_runs_again_for_the_spill(self):
+        get_runner(self.exercise)(numbers(1200))
+        data = self.execute(numbers(1200))
+        self.assertFalse(data['cached'])
+        self.assertEqual(self.page(data['result_handle'], 1150).json()['rows'][-1], [1200])
+
+    def test_handles_are_scoped_to_the_session(self):
+        handle = self.execute(numbers(250))['result_handle']
+        self.assertEqual(self.page(handle, 100).status_code, 200)
+        self.assertEqual(self.page(handle, 100, client=Client()).status_code, 404)
+        self.assertEqual(self.page('x' * 24, 0).status_code, 404)
+        self.assertEqual(self.page('../../etc/passwd', 0).status_code, 404)
+
+
+def from_columnar(encoded):
+    return [list(row) for row in zip(*encoded['data'])]
+
+
+@override_settings(WRITE_BEHIND_ENABLED=False, PRACTICE_DATA_DIR=None, PRACTICE_DB_BACKENDS={})
+class ResultFormatTests(TestCase):
+    """The columnar wire format decodes back to the rows format"""
+
+    def setUp(self):
+        cache.clear()
+        get_query_cache().clear()
+        self.exercise = create_exercise()
+
+    def execute(self, query, fmt=None, **extra):
+        body = {'query': query}
+        if fmt:
+            body['result_format'] = fmt
+        response = self.client.post(f'/api/exercises/{self.exercise.id}/execute/', body,
+                                    content_type='application/json', **extra)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_round_trip(self):
+        rows = [
+            [1, 'Ana', 1.5, decimal.Decimal('2.50'), True, datetime.date(2024, 1, 2), None],
+            [2, 'Ben', 3, decimal.Decimal('0'), False, datetime.date(2024, 3, 4), 'x'],
+        ]
+        result = {'success': True, 'columns': list('abcdefg'), 'rows': rows, 'row_count': 2, 'truncated': False}
+        encoded = encode_result(result, requested_format('columnar'))
+        self.assertEqual(encoded['types'], ['int', 'text', 'float', 'decimal', 'bool', 'date', 'text'])
+        self.assertEqual(from_columnar(encoded), rows)
+        self.assertEqual((encoded['columns'], encoded['row_count'], encoded['truncated']), (list('abcdefg'), 2, False))
+        self.assertEqual(encoded['truncated_values'], [])
+        self.assertIs(result['rows'], rows)
+        self.assertEqual(type_code([None, None]), 'null')
+        self.assertEqual(type_code([1, 'a']), 'mixed')
+
+    def test_rows_is_the_default(self):
+        result = {'success': True, 'columns': ['a'], 'rows': [[1]]}
+        for fmt in (None, 'rows', 'csv'):
+            with self.subTest(fmt=fmt):
+                self.assertIs(encode_result(result, requested_format(fmt)), result)
+        failed = {'success': False, 'error': 'no such table: x'}
+        self.assertIs(encode_result(failed, COLUMNAR), failed)
+
+    def test_long_text_is_cut(self):
+        result = {'success': True, 'columns': ['id', 'note'], 'rows': [[1, 'short'], [2, 'y' * 50]]}
+        encoded = to_columnar(result, max_value_length=10)
+        self.assertEqual(encoded['data'][1], ['short', 'y' * 10])
+        self.assertEqual(encoded['truncated_values'], [[1, 1, 50]])
+        self.assertEqual(result['rows'][1][1], 'y' * 50)
+
+    def test_execute_view(self):
+        query = 'SELECT id, name, salary FROM employees ORDER BY id'
+        rows = self.execute(query).json()
+        columnar = self.execute(query, 'columnar').json()
+        self.assertEqual(columnar['format'], 'columnar')
+        self.assertEqual(columnar['types'], ['int', 'text', 'int'])
+        self.assertEqual(from_columnar(columnar), rows['rows'])
+        self.assertEqual(columnar['columns'], rows['columns'])
+
+    def test_truncated_flag_survives(self):
+        data = self.execute(numbers(1200), 'columnar').json()
+        self.assertIs(data['truncated'], True)
+        self.assertEqual(data['truncated_values'], [])
+        self.assertEqual(data['data'][0][-1], 100)
+
+    def test_compressed_round_trip(self):
+        query = f"SELECT i, 'employee number ' || i AS label FROM ({numbers(100)})"
+        response = self.execute(query, 'columnar', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        data = json.loads(gzip.decompress(response.content))
+        self.assertEqual(from_columnar(data), self.execute(query).json()['rows'])
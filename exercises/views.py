@@ -1,54 +1,93 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.utils.encoders import JSONEncoder
+from django.http import Http404, JsonResponse
 from django.shortcuts import get_object_or_404
-from django.db import models as dj_models
-from django.utils import timezone
-from .models import DatabaseSchema, Exercise, UserProgress
-from .services.executor import SQLExecutor
-import uuid
-from django.db import connection
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from .models import Exercise
+from .services.catalog import etag_matches, get_catalog
+from .services.offload import run_offloaded
+from .services.progress import get_session_progress, is_completed
+from .services.query_runner import execute_exercise_query, submit_exercise_query
+from .services.result_format import encode_result, requested_format
+from .services.result_spill import get_spill, page_size
+import hashlib
+import json
+from typing import Optional
+
+def catalog_response(request, data, etag):
+    """Response carrying the catalog ETag, or an empty 304 if the client already has it"""
+    if etag_matches(request, etag):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(data)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+def result_format(request, data):
+    """Result wire format asked for with `result_format` in the body or query string ('rows' or 'columnar')"""
+    return requested_format(data.get('result_format') or request.GET.get('result_format'))
+
+def progress_etag(etag, progress):
+    if not progress['completed'] and not progress['attempts']:
+        return etag
+    digest = hashlib.sha1(repr((progress['completed'], sorted(progress['attempts'].items()))).encode()).hexdigest()[:8]
+    return f'{etag[:-1]}-{digest}"'
 
 class SchemaListView(APIView):
     """GET /api/schemas/ - List all database schemas"""
     
     def get(self, request):
-        schemas = DatabaseSchema.objects.all()
-        data = [{
-            'id': s.id,
-            'name': s.name,
-            'display_name': s.display_name,
-            'description': s.description,
-            'exercise_count': s.exercises.count()
-        } for s in schemas]
-        return Response(data)
+        catalog, etag = get_catalog()
+        return catalog_response(request, catalog['schemas'], etag)
 
 class ExerciseListView(APIView):
     """GET /api/exercises/?schema_id=1&difficulty=easy"""
     
     def get(self, request):
-        exercises = Exercise.objects.select_related('schema').all()
+        catalog, etag = get_catalog()
+        exercises = catalog['exercises']
         
         # Filter by schema
         schema_id = request.query_params.get('schema_id')
         if schema_id:
-            exercises = exercises.filter(schema_id=schema_id)
+            exercises = [ex for ex in exercises if str(ex['schema_id']) == schema_id]
         
         # Filter by difficulty
         difficulty = request.query_params.get('difficulty')
         if difficulty:
-            exercises = exercises.filter(difficulty=difficulty)
+            exercises = [ex for ex in exercises if ex['difficulty'] == difficulty]
+        
+        # Completion comes from the session's cached progress, never a query per exercise
+        progress = get_session_progress(request.session.session_key)
+        attempts = progress['attempts']
         
         data = [{
-            'id': ex.id,
-            'title': ex.title,
-            'difficulty': ex.difficulty,
-            'schema': ex.schema.display_name,
-            'tags': ex.tags,
-            'completed': False  # TODO: Check user progress
+            'id': ex['id'],
+            'title': ex['title'],
+            'difficulty': ex['difficulty'],
+            'schema': ex['schema'],
+            'tags': ex['tags'],
+            'completed': is_completed(progress, ex['id']),
+            'attempts': attempts.get(ex['id'], 0)
         } for ex in exercises]
         
-        return Response(data)
+        # The list is per session, so its validator covers the session's progress too
+        etag = progress_etag(etag, progress)
+        response = catalog_response(request, data, etag)
+        response['Vary'] = 'Cookie'
+        return response
+
+class CatalogView(APIView):
+    """GET /api/catalog/ - Schemas and exercises in one response"""
+    
+    def get(self, request):
+        catalog, etag = get_catalog()
+        return catalog_response(request, catalog, etag)
 
 class ExerciseDetailView(APIView):
     """GET /api/exercises/{id}/ - Get exercise details"""
@@ -79,7 +118,9 @@ class ExecuteQueryView(APIView):
     
     def post(self, request, exercise_id):
         exercise = get_object_or_404(Exercise.objects.select_related('schema'), id=exercise_id)
-        query = request.data.get('query', '').strip()
+        query = query_text(request.data)
+        if query is None:
+            return Response({'error': 'Query must be a string'}, status=status.HTTP_400_BAD_REQUEST)
         
         if not query:
             return Response(
@@ -87,62 +128,18 @@ class ExecuteQueryView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Execute query using SQLExecutor if configured, otherwise run against default DB
-        try:
-            executor = SQLExecutor(exercise.schema.db_name)
-            result = executor.execute(query)
-        except ValueError:
-            # Fallback: execute against default DB (SQLite) using Django connection
-            start = timezone.now()
-            try:
-                with connection.cursor() as cursor:
-                    cursor.execute(query)
-                    rows = cursor.fetchmany(SQLExecutor.MAX_ROWS)
-                    columns = [col[0] for col in cursor.description] if cursor.description else []
-                    row_list = [list(row) for row in rows]
-                exec_time = (timezone.now() - start).total_seconds()
-                result = {
-                    'success': True,
-                    'columns': columns,
-                    'rows': row_list,
-                    'row_count': len(row_list),
-                    'execution_time': round(exec_time, 3),
-                    'error': None
-                }
-            except Exception as e:
-                exec_time = (timezone.now() - start).total_seconds()
-                result = {
-                    'success': False,
-                    'error': str(e),
-                    'columns': [],
-                    'rows': [],
-                    'row_count': 0,
-                    'execution_time': round(exec_time, 3)
-                }
-        
-        # Track attempt (get or create session)
-        session_id = request.session.session_key
-        if not session_id:
-            request.session.create()
-            session_id = request.session.session_key
-        
-        # Update or create progress: increment attempts if exists, else create with attempts=1
-        try:
-            up = UserProgress.objects.get(session_id=session_id, exercise=exercise)
-            up.last_query = query
-            up.attempts = dj_models.F('attempts') + 1
-            up.save(update_fields=['last_query', 'attempts'])
-        except UserProgress.DoesNotExist:
-            UserProgress.objects.create(session_id=session_id, exercise=exercise, last_query=query, attempts=1)
-        
-        return Response(result)
+        size = page_size(request.data.get('page_size') or request.GET.get('page_size'))
+        result = execute_exercise_query(exercise, query, request.session, page_size=size)
+        return Response(encode_result(result, result_format(request, request.data)))
 
 class SubmitQueryView(APIView):
     """POST /api/exercises/{id}/submit/ - Submit and validate query"""
     
     def post(self, request, exercise_id):
         exercise = get_object_or_404(Exercise.objects.select_related('schema'), id=exercise_id)
-        query = request.data.get('query', '').strip()
+        query = query_text(request.data)
+        if query is None:
+            return Response({'error': 'Query must be a string'}, status=status.HTTP_400_BAD_REQUEST)
         
         if not query:
             return Response(
@@ -150,64 +147,106 @@ class SubmitQueryView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Execute both user query and expected query, with fallback to default DB
+        payload = submit_exercise_query(exercise, query, request.session)
+        payload['user_result'] = encode_result(payload['user_result'], result_format(request, request.data))
+        return Response(payload)
+
+class ResultPageView(APIView):
+    """GET /api/results/{handle}/?offset=100&limit=100 - Later pages of a paginated execute result"""
+    
+    def get(self, request, handle):
         try:
-            executor = SQLExecutor(exercise.schema.db_name)
-            user_result = executor.execute(query)
-            expected_result = executor.execute(exercise.expected_sql)
+            offset = max(0, int(request.GET.get('offset', 0)))
         except ValueError:
-            # Fallback execution on default DB
-            def run_on_default(q):
-                start = timezone.now()
-                try:
-                    with connection.cursor() as cursor:
-                        cursor.execute(q)
-                        rows = cursor.fetchmany(SQLExecutor.MAX_ROWS)
-                        columns = [col[0] for col in cursor.description] if cursor.description else []
-                        row_list = [list(row) for row in rows]
-                    exec_time = (timezone.now() - start).total_seconds()
-                    return {
-                        'success': True,
-                        'columns': columns,
-                        'rows': row_list,
-                        'row_count': len(row_list),
-                        'execution_time': round(exec_time, 3),
-                        'error': None
-                    }
-                except Exception as e:
-                    exec_time = (timezone.now() - start).total_seconds()
-                    return {
-                        'success': False,
-                        'error': str(e),
-                        'columns': [],
-                        'rows': [],
-                        'row_count': 0,
-                        'execution_time': round(exec_time, 3)
-                    }
+            return Response({'error': 'offset must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = page_size(request.GET.get('limit'))
+        page = get_spill().load_page(handle, request.session.session_key, offset, limit)
+        if page is None:
+            return Response(
+                {'error': 'This result has expired; run the query again'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        result = {
+            'success': True,
+            'columns': page['columns'],
+            'rows': page['rows'],
+            'row_count': page['total'],
+            'total_is_lower_bound': page['capped'],
+            'offset': offset,
+            'has_more': offset + len(page['rows']) < page['total'],
+            'result_handle': handle,
+            'error': None
+        }
+        return Response(encode_result(result, result_format(request, {})))
 
-            user_result = run_on_default(query)
-            expected_result = run_on_default(exercise.expected_sql)
-        
-        # Compare results
-        comparison = executor.compare_results(user_result, expected_result)
+def query_text(data) -> Optional[str]:
+    """The body's `query`, stripped ('' when missing), or None if it is not a string"""
+    query = data.get('query')
+    if query is None:
+        return ''
+    return query.strip() if isinstance(query, str) else None
+
+def parse_json_body(request) -> Optional[dict]:
+    """Parse a JSON request body for plain (non-DRF) async views; returns None if malformed"""
+    if not request.body:
+        return {}
+    try:
+        data = json.loads(request.body)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    return data if isinstance(data, dict) else None
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncQueryView(View):
+    """Base for async query endpoints: blocking DB work runs on the bounded offload pool"""
+    
+    http_method_names = ['post']
+    handler = None
+    # Key of the executor result inside the handler's payload; None if the payload is the result
+    result_key = None
+    
+    def handler_options(self, request, data) -> dict:
+        """Extra keyword arguments for the handler"""
+        return {}
+    
+    def _handle(self, exercise_id, query, session, options):
+        exercise = get_object_or_404(Exercise.objects.select_related('schema'), id=exercise_id)
+        return self.handler(exercise, query, session, **options)
+    
+    async def post(self, request, exercise_id):
+        data = parse_json_body(request)
+        if data is None:
+            return JsonResponse({'error': 'Invalid JSON body'}, status=status.HTTP_400_BAD_REQUEST)
+        query = query_text(data)
+        if query is None:
+            return JsonResponse({'error': 'Query must be a string'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Update progress
-        session_id = request.session.session_key or str(uuid.uuid4())
+        if not query:
+            return JsonResponse({'error': 'Query is required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        if comparison['correct']:
-            UserProgress.objects.update_or_create(
-                session_id=session_id,
-                exercise=exercise,
-                defaults={
-                    'completed': True,
-                    'last_query': query,
-                    'completed_at': timezone.now()
-                }
+        try:
+            result = await run_offloaded(
+                self._handle, exercise_id, query, request.session, self.handler_options(request, data)
             )
-        
-        return Response({
-            'correct': comparison['correct'],
-            'message': comparison['message'],
-            'user_result': user_result,
-            'diff': comparison.get('diff')
-        })
+        except Http404:
+            return JsonResponse({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        fmt = result_format(request, data)
+        if self.result_key:
+            result[self.result_key] = encode_result(result[self.result_key], fmt)
+        else:
+            result = encode_result(result, fmt)
+        return JsonResponse(result, encoder=JSONEncoder)
+
+class AsyncExecuteQueryView(AsyncQueryView):
+    """POST /api/async/exercises/{id}/execute/ - Async variant of ExecuteQueryView"""
+    
+    handler = staticmethod(execute_exercise_query)
+    
+    def handler_options(self, request, data):
+        return {'page_size': page_size(data.get('page_size') or request.GET.get('page_size'))}
+
+class AsyncSubmitQueryView(AsyncQueryView):
+    """POST /api/async/exercises/{id}/submit/ - Async variant of SubmitQueryView"""
+    
+    handler = staticmethod(submit_exercise_query)
+    result_key = 'user_result'